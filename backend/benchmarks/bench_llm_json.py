@@ -0,0 +1,156 @@
+"""
+Benchmark for llm_json.extract_json against the parsing chain it replaced.
+
+Builds a corpus of recorded-style agent outputs (or loads one: JSONL with a
+"raw" field, e.g. CrewOutput.raw values logged in production) covering clean
+JSON, markdown fences, prose around the payload, trailing commas, stray
+trailing quotes and double encoding, then times:
+  - legacy:        fence strip + json.loads (twice for double encoding),
+                   the endswith('"}') fixes, the DOTALL array regex and the
+                   find('{') / rfind('}') slice, in the order the old call
+                   sites tried them
+  - extract_json:  one pass per output
+
+and reports how many outputs each one got right (synthetic corpus) or
+parsed at all (recorded corpus).
+
+Run from the backend directory:
+    python benchmarks/bench_llm_json.py --outputs 5000
+    python benchmarks/bench_llm_json.py --corpus crew_outputs.jsonl
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_json import extract_json  # noqa: E402
+
+ARRAY_RE = re.compile(r'\[\s*{.*}\s*\]', re.DOTALL)
+PROSE = (
+    "I searched both sources and compared the offers against the original price. "
+    "Below are the products that match the same type and category. "
+)
+
+
+def _offer(rng: random.Random, i: int) -> dict:
+    return {
+        "title": f"Organic Cotton Crew Neck T-Shirt {i}",
+        "url": f"https://shop{rng.randint(1, 40)}.example.com/products/tee-{i}",
+        "price": round(rng.uniform(5, 300), 2),
+        "retailer": f"Shop {rng.randint(1, 40)}",
+        "image_url": f"https://cdn.example.com/img/{i}.jpg",
+        "description": "Soft, breathable jersey tee. Regular fit. " * rng.randint(1, 4),
+    }
+
+
+def _defect(rng: random.Random, payload) -> str:
+    text = json.dumps(payload)
+    kind = rng.randrange(7)
+    if kind == 1:
+        return f"```json\n{json.dumps(payload, indent=2)}\n```"
+    if kind == 2:
+        return f"{PROSE * rng.randint(1, 3)}\n{text}\nLet me know if you need anything else."
+    if kind == 3:
+        return re.sub(r"([}\]])", r",\1", text, count=2) if text.startswith("{") else text[:-1] + ",]"
+    if kind == 4:
+        return text[:-1] + '"}' if text.endswith("}") else text + '"'
+    if kind == 5:
+        return json.dumps(text)
+    if kind == 6:
+        return f"Thought: I now know the final answer\nFinal Answer: ```\n{text}\n```"
+    return text
+
+
+def build_corpus(outputs: int, seed: int = 11):
+    """(outputs, expected payloads)."""
+    rng = random.Random(seed)
+    corpus, expected = [], []
+    for n in range(outputs):
+        offers = [_offer(rng, n * 20 + i) for i in range(rng.randint(0, 12))]
+        payload = rng.choice([{"offers": offers}, {"similar_products": offers}, offers])
+        corpus.append(_defect(rng, payload))
+        expected.append(payload)
+    return corpus, expected
+
+
+def load_corpus(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line).get("raw", "") for line in f if line.strip()]
+
+
+def legacy_parse(raw: str):
+    cleaned = raw.strip()
+    cleaned = re.sub(r'^```[a-zA-Z]*\n?', '', cleaned)
+    cleaned = re.sub(r'```$', '', cleaned)
+    try:
+        result = json.loads(cleaned)
+        if isinstance(result, str):
+            result = json.loads(result)
+        return result
+    except Exception:
+        pass
+    fixed = raw.strip()
+    if fixed.endswith(']"}'):
+        fixed = fixed[:-3] + ']}'
+    elif fixed.endswith('"}'):
+        fixed = fixed[:-2] + '}'
+    elif fixed.endswith(']"'):
+        fixed = fixed[:-2] + ']'
+    try:
+        return json.loads(fixed)
+    except Exception:
+        pass
+    match = ARRAY_RE.search(raw)
+    if match:
+        try:
+            return json.loads(match.group(0))
+        except Exception:
+            pass
+    start, end = raw.find('{'), raw.rfind('}') + 1
+    if start != -1 and end > start:
+        try:
+            return json.loads(raw[start:end])
+        except Exception:
+            pass
+    return None
+
+
+def timed(label: str, fn, corpus: list, expected, repeat: int):
+    best = float("inf")
+    results = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [fn(text) for text in corpus]
+        best = min(best, time.perf_counter() - start)
+    megabytes = sum(len(t) for t in corpus) / 1e6
+    if expected is None:
+        outcome = f"parsed {sum(1 for r in results if isinstance(r, (dict, list)))}/{len(corpus)}"
+    else:
+        outcome = f"correct {sum(1 for r, e in zip(results, expected) if r == e)}/{len(corpus)}"
+    print(f"{label:<13} {best * 1000:9.1f} ms  {len(corpus) / best:10,.0f} outputs/s  {megabytes / best:7.1f} MB/s  {outcome}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outputs", type=int, default=5000, help="synthetic corpus size")
+    parser.add_argument("--corpus", help="JSONL file with a 'raw' field per agent output")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus, expected = load_corpus(args.corpus), None
+    else:
+        corpus, expected = build_corpus(args.outputs)
+    print(f"{len(corpus)} outputs, {sum(len(t) for t in corpus) / 1e6:.1f} MB")
+    timed("legacy", legacy_parse, corpus, expected, args.repeat)
+    timed("extract_json", extract_json, corpus, expected, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""
+End-to-end load benchmark against local stub upstreams, fully offline.
+
+Starts benchmarks/stubs.py (Exa, Firecrawl and an OpenAI-compatible LLM
+answering from benchmarks/fixtures/ with the given latency distributions and
+error rates) and the API under uvicorn, pointed at the stubs through
+EXA_BASE_URL / FIRECRAWL_BASE_URL / OPENAI_API_BASE, with its caches, price
+history and product index in a temporary directory. DuckDuckGo has no base
+URL to redirect, so the backend runs with DUCKDUCKGO_ENABLED=false and the
+crews' web searches go to the Exa stub (--backend-env DUCKDUCKGO_ENABLED=true
+puts the real DuckDuckGo back, and the run is no longer offline). Then, for every
+endpoint and concurrency level, that many closed-loop clients send
+--requests requests between them, and the run reports requests/sec, p50,
+p95 and p99 latency, status codes, and how many upstream calls the stubs
+served during the run.
+
+Every run uses its own product URLs (spread over --domains retailer
+domains, as the per-domain limiter sees them), so runs start with cold
+caches. With --distinct-urls N a run cycles through N pages, so repeats are
+served from the caches and single-flight.
+
+Endpoints: product (/api/product), similar (/api/similar-products),
+compare (/api/compare-price), extract (/api/extract-price-ai). compare runs
+the CrewAI crews, so it needs the full requirements installed.
+
+Run from the backend directory:
+    python benchmarks/bench_load.py
+    python benchmarks/bench_load.py --endpoints product,similar --concurrency 1,16,64 --requests 300
+    python benchmarks/bench_load.py --latency firecrawl=fixed:200 --error-rate firecrawl=0.1 --json load.json
+    python benchmarks/bench_load.py --backend-env GOVERNOR_ENABLED=false
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+import httpx
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(BENCHMARKS)
+TITLE = "Sony WH-1000XM5 Wireless Noise Cancelling Headphones"
+
+
+def _product(url: str, n: int) -> dict:
+    # The page number keeps titles (and so LLM prompts) distinct, like the URLs
+    return {"title": f"{TITLE} #{n}", "price": 349.99, "currency": "USD", "url": url}
+
+
+ENDPOINTS = {
+    "product": ("/api/product", lambda url, n: {"url": url}),
+    "similar": ("/api/similar-products", _product),
+    "compare": ("/api/compare-price", _product),
+    "extract": ("/api/extract-price-ai", lambda url, n: {"content": "", "url": url}),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(ordered: list, q: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return float("nan")
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def wait_until_up(url: str, proc: subprocess.Popen, log_path: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            sys.exit(f"{url} exited with status {proc.returncode}; see {log_path}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"{url} did not come up within {timeout:.0f}s; see {log_path}")
+
+
+def start(name: str, args: list, env: dict, workdir: str) -> tuple:
+    log_path = os.path.join(workdir, f"{name}.log")
+    log = open(log_path, "w")
+    proc = subprocess.Popen(args, cwd=BACKEND, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return proc, log_path
+
+
+def backend_env(stub_url: str, workdir: str, extra: list, warm_up: str) -> dict:
+    env = dict(
+        os.environ,
+        EXA_BASE_URL=f"{stub_url}/exa",
+        FIRECRAWL_BASE_URL=f"{stub_url}/firecrawl",
+        OPENAI_API_BASE=f"{stub_url}/openai/v1",
+        OPENAI_BASE_URL=f"{stub_url}/openai/v1",
+        OPENAI_API_KEY="bench",
+        EXA_API_KEY="bench",
+        FIRECRAWL_API_KEY="bench",
+        HTTP2_ENABLED="false",
+        DUCKDUCKGO_ENABLED="false",
+        WARM_UP=warm_up,
+        CREWAI_DISABLE_TELEMETRY="true",
+        OTEL_SDK_DISABLED="true",
+    )
+    for name in ("SCRAPE_CACHE", "LLM_CACHE", "EXA_CACHE", "PRICE_HISTORY", "PRODUCT_INDEX"):
+        env[f"{name}_PATH"] = os.path.join(workdir, f"{name.lower()}.sqlite3")
+    for assignment in extra or ():
+        key, _, value = assignment.partition("=")
+        env[key] = value
+    return env
+
+
+async def run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, requests: int,
+                    run: int, distinct_urls: int, domains: int) -> dict:
+    path, build = ENDPOINTS[endpoint]
+    latencies, statuses = [], Counter()
+    issued = 0
+
+    async def worker():
+        nonlocal issued
+        while issued < requests:
+            n = issued % distinct_urls if distinct_urls else issued
+            issued += 1
+            url = f"https://shop{n % domains}.example/r{run}/item-{n}"
+            started = time.perf_counter()
+            try:
+                resp = await client.post(path, json=build(url, n))
+                statuses[str(resp.status_code)] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": statuses.get("200", 0),
+        "seconds": round(elapsed, 3),
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "statuses": dict(statuses),
+    }
+
+
+def upstream_calls(before: dict, after: dict) -> dict:
+    return {
+        name: sum(after[name]["requests"].values()) - sum(before[name]["requests"].values())
+        for name in ("exa", "firecrawl", "llm")
+    }
+
+
+async def run_all(args, api_url: str, stub_url: str) -> list:
+    results = []
+    timeout = httpx.Timeout(args.timeout, connect=5)
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=api_url, timeout=timeout, limits=limits) as client, \
+            httpx.AsyncClient(base_url=stub_url) as stub:
+        run = 0
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                run += 1
+                before = (await stub.get("/_stats")).json()
+                result = await run_level(
+                    client, endpoint, concurrency, args.requests, run, args.distinct_urls, args.domains
+                )
+                result["upstream_calls"] = upstream_calls(before, (await stub.get("/_stats")).json())
+                results.append(result)
+                print(
+                    f"{endpoint:<8} {concurrency:>5} {result['requests']:>6} {result['ok']:>6} {result['rps']:>8.2f}"
+                    f" {result['p50_ms']:>9.0f} {result['p95_ms']:>9.0f} {result['p99_ms']:>9.0f} {result['max_ms']:>9.0f}"
+                    f"  {json.dumps(result['statuses'])} upstream={json.dumps(result['upstream_calls'])}",
+                    flush=True,
+                )
+    return results
+
+
+def _csv(cast):
+    return lambda value: [cast(item) for item in value.split(",") if item]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", type=_csv(str), default=list(ENDPOINTS), help="comma-separated, default: all")
+    parser.add_argument("--concurrency", type=_csv(int), default=[1, 8, 32], help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=100, help="requests per endpoint and level")
+    parser.add_argument("--distinct-urls", type=int, default=0, help="pages per run (0: a new page per request)")
+    parser.add_argument("--domains", type=int, default=50, help="retailer domains the pages are spread over")
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=SPEC", help="stub latency, e.g. llm=fixed:800")
+    parser.add_argument("--error-rate", action="append", metavar="UPSTREAM=RATE", help="stub error rate, e.g. firecrawl=0.05")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--warm-up", default="blocking", choices=("none", "background", "blocking"), help="backend WARM_UP")
+    parser.add_argument("--backend-env", action="append", metavar="KEY=VALUE", help="extra backend settings")
+    parser.add_argument("--timeout", type=float, default=180, help="client timeout per request (seconds)")
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    args = parser.parse_args()
+    unknown = [endpoint for endpoint in args.endpoints if endpoint not in ENDPOINTS]
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(unknown)} (choose from {', '.join(ENDPOINTS)})")
+
+    workdir = tempfile.mkdtemp(prefix="velora-bench-")
+    stub_port, api_port = free_port(), free_port()
+    stub_url, api_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{api_port}"
+    stub_args = [
+        sys.executable, os.path.join(BENCHMARKS, "stubs.py"), "--port", str(stub_port),
+        "--error-status", str(args.error_status), "--domains", str(args.domains), "--seed", str(args.seed),
+    ]
+    stub_args += [f"--latency={spec}" for spec in args.latency or ()]
+    stub_args += [f"--error-rate={rate}" for rate in args.error_rate or ()]
+    api_args = [
+        sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ]
+
+    processes = []
+    try:
+        stub_proc, stub_log = start("stubs", stub_args, dict(os.environ), workdir)
+        processes.append(stub_proc)
+        wait_until_up(f"{stub_url}/_stats", stub_proc, stub_log, timeout=30)
+        env = backend_env(stub_url, workdir, args.backend_env, args.warm_up)
+        api_proc, api_log = start("api", api_args, env, workdir)
+        processes.append(api_proc)
+        wait_until_up(f"{api_url}/api/stats", api_proc, api_log, timeout=180)
+
+        stub_config = httpx.get(f"{stub_url}/_stats").json()
+        print("stubs: " + ", ".join(f"{name} {stub_config[name]['latency']} errors={stub_config[name]['error_rate']}"
+                                     for name in ("exa", "firecrawl", "llm")))
+        print(f"logs and databases: {workdir}")
+        print(f"{'endpoint':<8} {'conc':>5} {'reqs':>6} {'ok':>6} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+        results = asyncio.run(run_all(args, api_url, stub_url))
+    finally:
+        for proc in reversed(processes):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"stubs": stub_config, "results": results}, f, indent=2)
+        print(f"wrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
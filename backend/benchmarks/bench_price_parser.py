@@ -0,0 +1,159 @@
+"""
+Throughput benchmark for price_parser.
+
+Builds a corpus of product-page-like texts (or loads one, one text per line
+or a JSONL file with a "text" field) and times:
+  - legacy:       the old first-match regex lists the tools used to carry
+  - parse_price:  one call per text
+  - parse_prices: one batch call over the whole corpus
+
+then checks parse_price against REGRESSION_CASES (texts it once got wrong,
+e.g. the model number in "iPhone 15 $799", "kr" inside "krabs", or a
+free-shipping threshold ahead of the price) and exits with status 1 if any
+of them fails.
+
+Run from the backend directory:
+    python benchmarks/bench_price_parser.py --pages 5000
+    python benchmarks/bench_price_parser.py --corpus page_texts.jsonl
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from price_parser import parse_price, parse_prices  # noqa: E402
+
+LEGACY_PATTERNS = [
+    r'[$€£]\s?\d{1,3}(?:[,.]\d{3})*(?:[,.]\d{2})?',
+    r'\d{1,3}(?:[,.]\d{3})*(?:[,.]\d{2})?\s?(USD|EUR|GBP)',
+]
+
+PRICE_SNIPPETS = [
+    "Price: ${amount:,.2f}",
+    "Was ${was:,.2f} Now ${amount:,.2f}",
+    "{eu} €",
+    "Regular price £{was:.2f} Sale price £{amount:.2f}",
+    "From ${amount:.2f} - ${was:.2f}",
+    "{amount:.2f} USD",
+    "Unser Preis: {eu} EUR statt {eu_was} EUR",
+    "RRP £{was:.2f} £{amount:.2f}",
+    "iPhone 15 ${amount:.2f}",
+    "Pack of 3 £{amount:.2f}",
+]
+# (text, expected amount, expected currency)
+REGRESSION_CASES = [
+    ("iPhone 15 $799", "799", "USD"),
+    ("Size 10 $49.99", "49.99", "USD"),
+    ("Nike Air Max 90 $130", "130", "USD"),
+    ("Pack of 3 £12.00", "12.00", "GBP"),
+    ("Pack of 3 €12.00", "12.00", "EUR"),
+    ("12,99 €", "12.99", "EUR"),
+    ("49 zł", "49", "PLN"),
+    ("1.299,00 EUR", "1299.00", "EUR"),
+    ("Was $1,299.99 Now $999", "999", "USD"),
+    ("12 krabs for $5", "5", "USD"),
+    ("Free shipping over $35. Price $24.99", "24.99", "USD"),
+    ("Size 10 USD 45", "45", "USD"),
+    ("Price: 1 299 kr", "1299", "SEK"),
+    ("CHF 89.90", "89.90", "CHF"),
+    ("Unser Preis: 19,99 EUR statt 29,99 EUR", "19.99", "EUR"),
+]
+FILLER = (
+    "Free shipping on orders over 50. Made from 100% organic cotton. Machine wash cold. "
+    "Size guide: S M L XL. Rated 4.7 out of 5 by 1,204 customers. Ships in 2-3 business days. "
+    "Returns accepted within 30 days. Model is 183 cm and wears size M. "
+)
+
+
+def _eu(value: float) -> str:
+    return f"{value:,.2f}".replace(",", " ").replace(".", ",").replace(" ", ".")
+
+
+def build_corpus(pages: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(pages):
+        amount = round(rng.uniform(5, 3000), 2)
+        was = round(amount * rng.uniform(1.1, 1.8), 2)
+        snippet = rng.choice(PRICE_SNIPPETS).format(amount=amount, was=was, eu=_eu(amount), eu_was=_eu(was))
+        before = FILLER * rng.randint(1, 6)
+        after = FILLER * rng.randint(1, 6)
+        corpus.append(f"{before}{snippet} {after}" if rng.random() > 0.1 else before + after)
+    return corpus
+
+
+def load_corpus(path: str) -> list:
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                texts.append(json.loads(line).get("text", ""))
+            else:
+                texts.append(line)
+    return texts
+
+
+def legacy_parse(text: str):
+    for pattern in LEGACY_PATTERNS:
+        match = re.search(pattern, text)
+        if match:
+            return match.group(0)
+    return None
+
+
+def check_regressions() -> list:
+    """REGRESSION_CASES that parse_price gets wrong, as (text, expected, got)."""
+    failures = []
+    for text, amount, currency in REGRESSION_CASES:
+        price = parse_price(text)
+        got = (str(price.amount), price.currency) if price else None
+        if got != (amount, currency):
+            failures.append((text, (amount, currency), got))
+    return failures
+
+
+def timed(label: str, fn, corpus: list, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(corpus)
+        best = min(best, time.perf_counter() - start)
+    megabytes = sum(len(t) for t in corpus) / 1e6
+    print(f"{label:<14} {best * 1000:9.1f} ms  {len(corpus) / best:12,.0f} texts/s  {megabytes / best:8.1f} MB/s")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=5000, help="synthetic corpus size")
+    parser.add_argument("--corpus", help="file with one page text per line, or JSONL with a 'text' field")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus(args.pages)
+    print(f"{len(corpus)} texts, {sum(len(t) for t in corpus) / 1e6:.1f} MB")
+    timed("legacy", lambda texts: [legacy_parse(t) for t in texts], corpus, args.repeat)
+    single = timed("parse_price", lambda texts: [parse_price(t) for t in texts], corpus, args.repeat)
+    batch = timed("parse_prices", parse_prices, corpus, args.repeat)
+    assert single == batch, "batch and per-text results differ"
+    found = sum(1 for p in batch if p)
+    print(f"prices found in {found}/{len(corpus)} texts")
+
+    failures = check_regressions()
+    for text, expected, got in failures:
+        print(f"FAIL: {text!r}: expected {expected}, got {got}")
+    print(f"regression cases: {len(REGRESSION_CASES) - len(failures)}/{len(REGRESSION_CASES)} correct")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Start-up benchmark: how long `import main` takes in a fresh interpreter.
+
+Each run spawns `python -X importtime -c "import main"` (what a uvicorn
+worker pays before it can serve a request), then reports the median total,
+the slowest top-level imports, and whether any deferred dependency (CrewAI,
+exa_py, duckduckgo_search, litellm) was imported eagerly. With --warm it also
+times lazy.warm_up(), i.e. what the first LLM request (or WARM_UP) pays.
+
+Exits with status 1 when the median is over --budget-ms or a deferred
+dependency was imported, so it can gate CI or a deploy.
+
+Run from the backend directory:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10 --budget-ms 600 --warm
+"""
+import os
+import re
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFERRED = ("crewai", "exa_py", "duckduckgo_search", "litellm")
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+PROBE = (
+    "import sys, json, time\n"
+    "import main\n"
+    "deferred = [m for m in {deferred!r} if m in sys.modules]\n"
+    "warm_ms = None\n"
+    "if {warm!r}:\n"
+    "    import lazy\n"
+    "    started = time.perf_counter()\n"
+    "    lazy.warm_up()\n"
+    "    warm_ms = (time.perf_counter() - started) * 1000\n"
+    "print(json.dumps({{'deferred': deferred, 'warm_ms': warm_ms}}))\n"
+)
+
+
+def run_once(warm: bool) -> dict:
+    env = dict(os.environ, WARM_UP="none")
+    env.setdefault("FIRECRAWL_API_KEY", "bench")
+    env.setdefault("EXA_API_KEY", "bench")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(deferred=DEFERRED, warm=warm)],
+        cwd=BACKEND, env=env, capture_output=True, text=True, check=True,
+    )
+    # importtime lists a module's imports (two spaces deeper) right before the module itself
+    total_ms, children, nested = 0.0, [], []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        depth, name, cumulative = len(match.group(3)), match.group(4), int(match.group(2)) / 1000
+        if depth == 3:
+            nested.append((cumulative, name))
+        elif depth == 1:
+            if name == "main":
+                total_ms, children = cumulative, nested
+            nested = []
+    report = json.loads(proc.stdout.strip().splitlines()[-1])
+    report["total_ms"] = total_ms
+    report["children"] = children
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000, help="import-time budget for `import main`")
+    parser.add_argument("--warm", action="store_true", help="also time lazy.warm_up()")
+    parser.add_argument("--top", type=int, default=8, help="slowest imports to list")
+    args = parser.parse_args()
+
+    runs = [run_once(args.warm) for _ in range(args.runs)]
+    total = statistics.median(r["total_ms"] for r in runs)
+    print(f"import main: median {total:.0f} ms over {args.runs} runs (min {min(r['total_ms'] for r in runs):.0f} ms)")
+
+    for ms, name in sorted(runs[-1]["children"], reverse=True)[:args.top]:
+        print(f"  {name:<28} {ms:8.1f} ms")
+
+    if args.warm:
+        warm = statistics.median(r["warm_ms"] for r in runs)
+        print(f"lazy.warm_up(): median {warm:.0f} ms")
+
+    failed = False
+    deferred = sorted({m for r in runs for m in r["deferred"]})
+    if deferred:
+        print(f"FAIL: deferred dependencies imported at start-up: {', '.join(deferred)}")
+        failed = True
+    if total > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print(f"OK: within the {args.budget_ms:.0f} ms budget")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
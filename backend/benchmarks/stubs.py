@@ -0,0 +1,243 @@
+"""
+Local stand-ins for Exa, Firecrawl and an OpenAI-compatible LLM, for offline
+benchmarks (bench_load.py starts them; they can also be run on their own).
+
+Everything is served from one port, with a path prefix per upstream:
+    /exa/...        EXA_BASE_URL=http://127.0.0.1:<port>/exa
+                    (REST /v1/findSimilar, /search, /contents and the exa_py
+                    SDK's /findSimilar, /search, /contents)
+    /firecrawl/...  FIRECRAWL_BASE_URL=http://127.0.0.1:<port>/firecrawl
+                    (/v1/scrape, "json" or markdown/rawHtml formats)
+    /openai/v1/...  OPENAI_API_BASE=http://127.0.0.1:<port>/openai/v1
+                    (/chat/completions)
+
+Responses come from the recorded payloads in benchmarks/fixtures/, with the
+URLs filled in per request: findSimilar returns pages spread over --domains
+retailer domains (stable per source URL), scrapes echo the requested URL,
+and the LLM answers with the first fixture response whose "match" text is in
+the prompt. Each upstream waits a sampled latency before answering and fails
+with --error-status at its error rate. Latency specs (milliseconds):
+    fixed:MS   uniform:MIN:MAX   lognormal:MEDIAN:SIGMA   exp:MEAN
+
+GET /_stats returns the requests and injected errors per upstream and route.
+
+Run from the backend directory:
+    python benchmarks/stubs.py --port 18100
+    python benchmarks/stubs.py --latency firecrawl=lognormal:1500:0.5 --error-rate exa=0.02
+"""
+import os
+import copy
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+UPSTREAM_NAMES = ("exa", "firecrawl", "llm")
+# Roughly what the real services take for the calls the backend makes
+DEFAULT_LATENCY = {"exa": "lognormal:400:0.4", "firecrawl": "lognormal:2500:0.5", "llm": "lognormal:1500:0.4"}
+DEFAULT_DOMAINS = 50
+
+
+def parse_latency(spec: str, rng: random.Random):
+    """A function returning one latency sample in seconds for `spec` (see the module docstring)."""
+    kind, *params = spec.split(":")
+    try:
+        params = [float(param) for param in params]
+        if kind == "fixed":
+            (ms,) = params
+            return lambda: ms / 1000
+        if kind == "uniform":
+            low, high = params
+            return lambda: rng.uniform(low, high) / 1000
+        if kind == "lognormal":
+            median, sigma = params
+            return lambda: rng.lognormvariate(math.log(median), sigma) / 1000
+        if kind == "exp":
+            (mean,) = params
+            return lambda: rng.expovariate(1 / mean) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec: {spec!r}")
+
+
+def parse_assignments(values: list, cast) -> dict:
+    """{"exa": ...} from ["exa=...", ...] command-line values."""
+    parsed = {}
+    for value in values or ():
+        name, _, setting = value.partition("=")
+        if name not in UPSTREAM_NAMES or not setting:
+            raise ValueError(f"Expected <{'|'.join(UPSTREAM_NAMES)}>=<value>, got {value!r}")
+        parsed[name] = cast(setting)
+    return parsed
+
+
+def load_fixture(name: str):
+    with open(os.path.join(FIXTURES, f"{name}.json")) as f:
+        return json.load(f)
+
+
+class Upstream:
+    """Latency, injected failures and request counts of one stubbed upstream."""
+
+    def __init__(self, name: str, latency: str, error_rate: float, error_status: int, rng: random.Random):
+        self.name = name
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = rng
+        self.sample = parse_latency(latency, rng)
+        self.requests = Counter()
+        self.errors = Counter()
+
+    async def respond(self, route: str, build) -> JSONResponse:
+        self.requests[route] += 1
+        await asyncio.sleep(self.sample())
+        if self.rng.random() < self.error_rate:
+            self.errors[route] += 1
+            return JSONResponse({"error": f"injected {self.name} failure"}, status_code=self.error_status)
+        return JSONResponse(build())
+
+    def stats(self) -> dict:
+        return {
+            "latency": self.latency,
+            "error_rate": self.error_rate,
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+        }
+
+
+def _digest(text: str) -> int:
+    return int(hashlib.sha1(text.encode()).hexdigest()[:12], 16)
+
+
+def create_app(latency: dict = None, error_rates: dict = None, error_status: int = 503,
+               domains: int = DEFAULT_DOMAINS, seed: int = None) -> FastAPI:
+    latency = {**DEFAULT_LATENCY, **(latency or {})}
+    error_rates = error_rates or {}
+    rng = random.Random(seed)
+    upstreams = {
+        name: Upstream(name, latency[name], error_rates.get(name, 0.0), error_status, rng)
+        for name in UPSTREAM_NAMES
+    }
+    find_similar = load_fixture("exa_find_similar")
+    search = load_fixture("exa_search")
+    contents = load_fixture("exa_contents")
+    scrape_pages = load_fixture("firecrawl_scrape")["pages"]
+    scrape_json = load_fixture("firecrawl_json")
+    chat = load_fixture("llm_chat")
+    started = time.time()
+    app = FastAPI()
+
+    def similar_results(source_url: str, count: int) -> list:
+        seed_value = _digest(source_url)
+        results = []
+        for i in range(count):
+            result = dict(find_similar["results"][i % len(find_similar["results"])])
+            result["id"] = f"{seed_value:x}-{i}"
+            result["url"] = f"https://shop{(seed_value + i) % domains}.example/products/{seed_value:x}-{i}"
+            results.append(result)
+        return {"requestId": find_similar["requestId"], "results": results}
+
+    def contents_results(urls: list) -> dict:
+        template = contents["results"][0]
+        return {"requestId": contents["requestId"], "results": [{**template, "id": url, "url": url} for url in urls]}
+
+    def scrape(body: dict) -> dict:
+        url = body.get("url", "")
+        formats = body.get("formats") or ["markdown"]
+        if "json" in formats:
+            payload = copy.deepcopy(scrape_json)
+        else:
+            payload = copy.deepcopy(scrape_pages[_digest(url) % len(scrape_pages)])
+            for field in ("markdown", "rawHtml", "html"):
+                if field not in formats:
+                    payload["data"].pop(field, None)
+        metadata = payload["data"].setdefault("metadata", {})
+        metadata["sourceURL"] = url
+        metadata.setdefault("og:url", url)
+        return payload
+
+    def completion(body: dict) -> dict:
+        prompt = "\n".join(str(message.get("content") or "") for message in body.get("messages") or ())
+        folded = prompt.casefold()
+        content = next(
+            response["content"] for response in chat["responses"] if response["match"].casefold() in folded
+        )
+        prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+        return {
+            "id": f"chatcmpl-{_digest(prompt + str(rng.random())):x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model") or chat["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @app.post("/exa/{path:path}")
+    async def exa(path: str, request: Request):
+        body = await request.json()
+        route = path.rsplit("/", 1)[-1]
+        if route == "findSimilar":
+            count = body.get("numResults") or body.get("num_results") or 10
+            return await upstreams["exa"].respond(route, lambda: similar_results(body.get("url", ""), count))
+        if route == "search":
+            return await upstreams["exa"].respond(route, lambda: search)
+        if route == "contents":
+            urls = body.get("urls") or body.get("ids") or []
+            return await upstreams["exa"].respond(route, lambda: contents_results(urls))
+        return JSONResponse({"error": f"no stub for /{path}"}, status_code=404)
+
+    @app.post("/firecrawl/v1/scrape")
+    async def firecrawl_scrape(request: Request):
+        body = await request.json()
+        return await upstreams["firecrawl"].respond("scrape", lambda: scrape(body))
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        return await upstreams["llm"].respond("chat/completions", lambda: completion(body))
+
+    @app.get("/_stats")
+    async def stats():
+        return {"uptime": round(time.time() - started, 1), **{name: u.stats() for name, u in upstreams.items()}}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18100)
+    parser.add_argument("--latency", action="append", metavar="UPSTREAM=SPEC", help="e.g. firecrawl=lognormal:2500:0.5")
+    parser.add_argument("--error-rate", action="append", metavar="UPSTREAM=RATE", help="e.g. exa=0.02")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--domains", type=int, default=DEFAULT_DOMAINS, help="retailer domains findSimilar spreads pages over")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    try:
+        latency = parse_assignments(args.latency, str)
+        for spec in latency.values():
+            parse_latency(spec, random.Random())
+        error_rates = parse_assignments(args.error_rate, float)
+    except ValueError as e:
+        parser.error(str(e))
+    app = create_app(latency, error_rates, args.error_status, args.domains, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Circuit breakers for upstream providers.
+
+Each upstream (firecrawl, exa_search, exa_contents, duckduckgo) has a
+breaker that watches its last BREAKER_WINDOW calls. A call fails when it
+raises (timeouts, connection errors), answers 429/5xx, or takes longer than
+the breaker's slow-call threshold. Once at least BREAKER_MIN_CALLS calls are
+in the window and BREAKER_FAILURE_RATE of them failed, the breaker opens:
+calls fail immediately with CircuitOpenError, and callers switch to their
+fallback (Exa contents for Firecrawl scrapes, Exa search <-> DuckDuckGo).
+
+After BREAKER_OPEN_SECONDS the breaker goes half-open and lets
+BREAKER_HALF_OPEN_PROBES calls through. A successful probe closes it; a
+failed one opens it again.
+
+The pooled httpx clients are guarded by BreakerTransport /
+BreakerAsyncTransport (see http_clients); other clients use guard().
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+import httpx
+from projections import FIRECRAWL_EXTRACT_TIMEOUT
+
+logger = logging.getLogger("breaker")
+
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "true").lower() in ("1", "true", "yes")
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+# Calls slower than this (seconds) count as failures. Firecrawl's is above its extraction
+# timeout, so only extractions that overran it count, not merely long ones.
+SLOW_CALL_SECONDS = {
+    "firecrawl": float(os.getenv("BREAKER_FIRECRAWL_SLOW_CALL", str(FIRECRAWL_EXTRACT_TIMEOUT + 5))),
+    "exa_search": float(os.getenv("BREAKER_EXA_SEARCH_SLOW_CALL", "15")),
+    "exa_contents": float(os.getenv("BREAKER_EXA_CONTENTS_SLOW_CALL", "20")),
+    "duckduckgo": float(os.getenv("BREAKER_DUCKDUCKGO_SLOW_CALL", "15")),
+}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """The upstream's breaker is open; the call was not made."""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit is open (retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def _failed_status(status) -> bool:
+    return status is not None and (status == 429 or status >= 500)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, slow_call: float):
+        self.name = name
+        self.slow_call = slow_call
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._counters = {"calls": 0, "failures": 0, "slow_calls": 0, "rejected": 0, "opened": 0}
+
+    def _enter(self) -> bool:
+        """Admit a call (True if it is a half-open probe) or raise CircuitOpenError."""
+        with self._lock:
+            if self.state == OPEN:
+                retry_in = self._opened_at + BREAKER_OPEN_SECONDS - time.monotonic()
+                if retry_in > 0:
+                    self._counters["rejected"] += 1
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = HALF_OPEN
+                self._probes = 0
+                logger.info(f"Circuit {self.name} half-open, probing")
+            if self.state == HALF_OPEN:
+                if self._probes >= BREAKER_HALF_OPEN_PROBES:
+                    self._counters["rejected"] += 1
+                    raise CircuitOpenError(self.name, 0)
+                self._probes += 1
+            self._counters["calls"] += 1
+            return self.state == HALF_OPEN
+
+    def _exit(self, probe: bool, failed: bool, slow: bool = False) -> None:
+        with self._lock:
+            if slow:
+                self._counters["slow_calls"] += 1
+            if failed:
+                self._counters["failures"] += 1
+            if probe:
+                self._probes -= 1
+                if failed:
+                    self._open()
+                elif self.state == HALF_OPEN:
+                    self.state = CLOSED
+                    self._outcomes.clear()
+                    logger.info(f"Circuit {self.name} closed after a successful probe")
+                return
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if (
+                self.state == CLOSED
+                and len(self._outcomes) >= BREAKER_MIN_CALLS
+                and failures / len(self._outcomes) >= BREAKER_FAILURE_RATE
+            ):
+                self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._counters["opened"] += 1
+        logger.warning(f"Circuit {self.name} opened for {BREAKER_OPEN_SECONDS}s")
+
+    def _abandon(self, probe: bool) -> None:
+        """A call that was cancelled before finishing says nothing about the upstream."""
+        if probe:
+            with self._lock:
+                self._probes -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "window_failures": sum(self._outcomes),
+                "window_calls": len(self._outcomes),
+                **self._counters,
+            }
+
+
+class Call:
+    """One guarded call; record(status) lets a response status decide success vs failure."""
+
+    def __init__(self):
+        self.status = None
+
+    def record(self, status: int) -> None:
+        self.status = status
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _registry_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(name, SLOW_CALL_SECONDS.get(name, 30.0))
+                _breakers[name] = breaker
+    return breaker
+
+
+def breaker_name(upstream: str, path: str = "") -> str:
+    """Breaker for a request to one of the http_clients upstreams."""
+    if upstream == "exa":
+        return "exa_contents" if path.strip("/").endswith("contents") else "exa_search"
+    return upstream
+
+
+@contextmanager
+def guard(name: str):
+    """
+    Run the block as a call to upstream `name`. Raises CircuitOpenError up
+    front while the breaker is open. Exceptions, 429/5xx statuses passed to
+    call.record() and slow calls count as failures; a recorded 4xx raised as
+    an exception does not.
+    """
+    if not BREAKER_ENABLED:
+        yield Call()
+        return
+    breaker = get_breaker(name)
+    probe = breaker._enter()
+    call = Call()
+    started = time.monotonic()
+    try:
+        yield call
+    except (asyncio.CancelledError, GeneratorExit):
+        breaker._abandon(probe)
+        raise
+    except BaseException:
+        client_error = call.status is not None and not _failed_status(call.status)
+        breaker._exit(probe, failed=not client_error)
+        raise
+    slow = time.monotonic() - started > breaker.slow_call
+    breaker._exit(probe, failed=slow or _failed_status(call.status), slow=slow)
+
+
+class BreakerAsyncTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport so requests to `upstream` go through its breaker."""
+
+    def __init__(self, upstream: str, transport: httpx.AsyncBaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        with guard(breaker_name(self.upstream, request.url.path)) as call:
+            response = await self.transport.handle_async_request(request)
+            call.record(response.status_code)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class BreakerTransport(httpx.BaseTransport):
+    """Sync counterpart of BreakerAsyncTransport."""
+
+    def __init__(self, upstream: str, transport: httpx.BaseTransport):
+        self.upstream = upstream
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        with guard(breaker_name(self.upstream, request.url.path)) as call:
+            response = self.transport.handle_request(request)
+            call.record(response.status_code)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+def all_stats() -> dict:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {"enabled": BREAKER_ENABLED, "breakers": {b.name: b.stats() for b in breakers}}
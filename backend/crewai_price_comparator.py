@@ -1,7 +1,14 @@
 import os
 import asyncio
+import logging
 from crewai import Agent, Task, Crew
 from tools import SearchTools
+from llm_pool import run_in_llm_pool
+from deadline import stage_timeout
+from llm_json import parse_llm_json
+from offer_merge import merge_offers
+
+logger = logging.getLogger("crewai_price_comparator")
 
 class PriceComparatorCrew:
     def __init__(self, product_title: str, original_price: float):
@@ -9,6 +16,8 @@ class PriceComparatorCrew:
         self.original_price = original_price
         self.web_search_tool = SearchTools.WebSearchTool()
         self.exa_search_tool = SearchTools.ExaSearchTool()
+        # Set when the request deadline cut a stage short or one of the search crews failed
+        self.partial = False
 
     async def run_async(self):
         # 1. Define parallel agents
@@ -38,59 +47,41 @@ class PriceComparatorCrew:
             agent=exa_agent
         )
 
-        # 2. Run both tasks in parallel (async)
+        # 2. Run both tasks in parallel in the LLM pool, for as long as the request deadline allows.
+        #    Cancelling only drops a kickoff that is still queued: one already running in a pool
+        #    thread cannot be interrupted and keeps its LLM pool slot until it returns.
         duck_crew = Crew(agents=[duck_agent], tasks=[duck_task], verbose=False)
         exa_crew = Crew(agents=[exa_agent], tasks=[exa_task], verbose=False)
-        duck_future = duck_crew.kickoff_async()
-        exa_future = exa_crew.kickoff_async()
-        duck_result, exa_result = await asyncio.gather(duck_future, exa_future)
-
-        # 3. Boss agent
-        boss_agent = Agent(
-            role="Offer Synthesizer",
-            goal="Deduplicate, merge, and sort all offers from both sources. Only return offers cheaper than the original price. Present the best options to the user.",
-            backstory="You are an expert at synthesizing and curating product offers. Your job is to merge, deduplicate, filter, and sort offers to present only the very best cheaper options to the user.",
-            allow_delegation=False
-        )
-        # Extract dict or string context from CrewOutput for boss agent
-        import json
-        def extract_context(result):
-            if hasattr(result, "json_dict") and result.json_dict:
-                return result.json_dict
-            elif hasattr(result, "raw") and result.raw:
-                try:
-                    return json.loads(result.raw)
-                except Exception:
-                    return {}
-            elif isinstance(result, dict):
-                return result
-            elif isinstance(result, str):
-                try:
-                    return json.loads(result)
-                except Exception:
-                    return {}
-            else:
-                return {}
-        merged_context = {
-            "duck_results": extract_context(duck_result),
-            "exa_results": extract_context(exa_result)
+        futures = {
+            "DuckDuckGo": asyncio.ensure_future(run_in_llm_pool(duck_crew.kickoff)),
+            "Exa": asyncio.ensure_future(run_in_llm_pool(exa_crew.kickoff)),
         }
-        boss_task = Task(
-            description=(
-                f"You are given two lists of offers for '{self.product_title}' (current price: {self.original_price}), "
-                "one from DuckDuckGo, one from Exa. Each offer has: title, image_url, description, price, retailer, url. "
-                "Your job: 1) Merge both lists into one, 2) Remove duplicates (same url or same title+retailer), "
-                "3) Filter out any offers with price >= {self.original_price}, 4) Sort the final list by price ascending, "
-                "5) Return ONLY the following JSON: {\"offers\": [ ... ]}. "
-                "If no valid offers, return {\"offers\": []}. Do NOT add any markdown, code blocks, or extra commentary."
-            ),
-            expected_output="A JSON object: {\"offers\": [ ... ]} with only unique, cheaper offers sorted by price ascending.",
-            agent=boss_agent,
-            context=merged_context
+        done, pending = await asyncio.wait(set(futures.values()), timeout=stage_timeout())
+        for future in pending:
+            future.cancel()
+            self.partial = True
+        results, errors = {}, []
+        for name, future in futures.items():
+            if future not in done:
+                logger.warning(f"{name} search crew ran out of time; merging the other crew's offers")
+            elif future.exception() is not None:
+                # One crew failing still leaves the other's offers
+                errors.append(future.exception())
+                self.partial = True
+                logger.warning(f"{name} search crew failed: {future.exception()!r}")
+            else:
+                results[name] = future.result()
+        if errors and not results and not pending:
+            raise errors[0]
+        duck_result, exa_result = results.get("DuckDuckGo"), results.get("Exa")
+
+        # 3. Merge, dedupe, filter and sort the offers in code (no LLM round-trip)
+        offers = merge_offers(
+            self.original_price,
+            parse_llm_json(duck_result) or [],
+            parse_llm_json(exa_result) or [],
         )
-        boss_crew = Crew(agents=[boss_agent], tasks=[boss_task], verbose=False)
-        boss_result = boss_crew.kickoff()
-        return boss_result
+        return {"offers": offers}
 
     async def run(self):
         return await self.run_async()
@@ -4,7 +4,9 @@ Intelligently extracts all product information from scraped e-commerce content f
 """
 
 from crewai import Agent, Task, Crew
-import json
+from llm_cache import cached_kickoff
+from llm_json import parse_llm_json
+from prompt_compaction import budget_chars, compact_metadata, select_windows
 
 def extract_product_data_with_ai(content: str, url: str = ""):
     """
@@ -18,6 +20,11 @@ def extract_product_data_with_ai(content: str, url: str = ""):
         raw_content = hybrid.get("raw_content")
     except Exception:
         structured, raw_content = None, content
+    # Only the useful structured fields, and the page text around its title and prices (not its first N chars)
+    structured = compact_metadata(structured, task="price_extractor_structured") if structured else None
+    title = next((value for key, value in (structured or {}).items() if key.endswith(("name", "title"))), "")
+    raw_content = select_windows(raw_content, budget_chars("price_extractor"), title=title, task="price_extractor") or None
+    input_data = {"structured": structured, "raw_content": raw_content, "url": url}
     agent = Agent(
         role="E-commerce Product Data Analyst",
         goal="Extract complete product information from both structured data and raw content to populate UI product cards",
@@ -87,36 +94,26 @@ def extract_product_data_with_ai(content: str, url: str = ""):
         
         Input:
         Structured: {structured}
-        Raw Content: {str(raw_content)[:1200]}...
+        Raw Content: {raw_content}
         URL: {url}
         """,
         expected_output="JSON object with complete product data, with source and reasoning for each field",
         agent=agent,
-        input_data={"structured": structured, "raw_content": raw_content, "url": url}
+        input_data=input_data
     )
     
     crew = Crew(
         tasks=[task],
         verbose=True  # Enable verbose mode to see agent thinking
     )
-    raw_result = crew.kickoff()
+    raw_result = cached_kickoff(crew, input_data)
     
     print("CrewAI raw result:", raw_result)
     
     try:
-        # If result is a string, try to parse as JSON
-        if isinstance(raw_result, str):
-            # Clean up the result string to extract JSON
-            json_start = raw_result.find('{')
-            json_end = raw_result.rfind('}') + 1
-            if json_start != -1 and json_end > json_start:
-                json_str = raw_result[json_start:json_end]
-                result = json.loads(json_str)
-            else:
-                result = json.loads(raw_result)
-        else:
-            result = raw_result
-            
+        # Pull the JSON object out of the crew output (fences, prose and common LLM JSON defects are handled)
+        result = parse_llm_json(raw_result, expect=dict)
+
         print("CrewAI parsed result:", result)
         
         # Ensure we have at least some basic data
@@ -138,49 +135,19 @@ def extract_product_data_with_ai(content: str, url: str = ""):
                 }
                 print("Using fallback result due to empty AI extraction")
                 return fallback_result
-        # If result is not a dictionary (like CrewOutput object), convert it to dict
-        elif not isinstance(result, dict):
-            try:
-                # Try to convert to dictionary if possible
-                if hasattr(result, '__dict__'):
-                    result = result.__dict__
-                # If it's a string that looks like JSON, parse it
-                elif isinstance(result, str) and result.strip().startswith('{'):
-                    result = json.loads(result)
-                else:
-                    # Extract the raw string and try to find JSON in it
-                    result_str = str(result)
-                    json_start = result_str.find('{')
-                    json_end = result_str.rfind('}') + 1
-                    if json_start != -1 and json_end > json_start:
-                        result = json.loads(result_str[json_start:json_end])
-                    else:
-                        # Create a fallback with the object's string representation
-                        return {
-                            "title": url.split('/')[-1].replace('-', ' ').title() if url else "Product",
-                            "price": {
-                                "value": None,
-                                "currency": "USD",
-                                "confidence": 0
-                            },
-                            "description": "Product description not available",
-                            "extraction_method": "object_fallback",
-                            "overall_confidence": 0
-                        }
-            except Exception as e:
-                print(f"Error converting result to dictionary: {e}")
-                # Return fallback if conversion fails
-                return {
-                    "title": url.split('/')[-1].replace('-', ' ').title() if url else "Product",
-                    "price": {
-                        "value": None,
-                        "currency": "USD",
-                        "confidence": 0
-                    },
-                    "description": "Product description not available",
-                    "extraction_method": "conversion_fallback",
-                    "overall_confidence": 0
-                }
+        else:
+            # No JSON object in the output: create a fallback from the URL
+            return {
+                "title": url.split('/')[-1].replace('-', ' ').title() if url else "Product",
+                "price": {
+                    "value": None,
+                    "currency": "USD",
+                    "confidence": 0
+                },
+                "description": "Product description not available",
+                "extraction_method": "object_fallback",
+                "overall_confidence": 0
+            }
             
         return result
         
@@ -1,11 +1,15 @@
+import json
 from crewai import Agent, Task, Crew
+from llm_cache import cached_kickoff
+from llm_json import parse_llm_json
+from prompt_compaction import compact_metadata
 
-import json
 
 def run_product_cleaner(firecrawl_data):
     # Use only the metadata for extraction
     metadata = firecrawl_data.get("data", {}).get("metadata", {})
     url = metadata.get("url") or metadata.get("og:url") or metadata.get("ogUrl")
+    input_data = {**compact_metadata(metadata, task="product_cleaner"), "url": url}
     agent = Agent(
         role="product_cleaner",
         goal="Extract and clean product data from e-commerce metadata JSON.",
@@ -16,7 +20,8 @@ def run_product_cleaner(firecrawl_data):
             'You are a data extraction expert. Your mission is to analyze the Firecrawl metadata JSON provided and extract key product information with extreme accuracy. '
             'You MUST NOT invent, guess, or hallucinate any data. Every piece of information in your output must be sourced directly from the input metadata. '
             'For each field, if the main key is missing, try all plausible alternatives (e.g., for title: "og:title", "title", "product_title"). '
-            'Return the best available value for each field. If you find partial data, return it. Only return null if you are certain no value is present in any field.'
+            'Return the best available value for each field. If you find partial data, return it. Only return null if you are certain no value is present in any field.\n'
+            f'Metadata JSON: {json.dumps(input_data)}'
         ),
         expected_output=(
             'A single, clean JSON object containing the extracted product data. Follow these rules strictly:\n'
@@ -35,20 +40,12 @@ def run_product_cleaner(firecrawl_data):
             '   - **Correct Output**: `{"title": "Cool T-Shirt", "price": 19.99, "image_url": "http://example.com/img.png", "site_name": null, ...}`\n'
             '5. **Output Format**: Return ONLY the final, valid JSON object and nothing else.'
         ),
-        input_data={**metadata, "url": url},
+        input_data=input_data,
         agent=agent
     )
     crew = Crew(tasks=[task])
-    raw_result = crew.kickoff()
+    raw_result = cached_kickoff(crew, input_data)
     print("CrewAI raw result:", raw_result)
-    try:
-        # If result is a string, try to parse as JSON
-        if isinstance(raw_result, str):
-            result = json.loads(raw_result)
-        else:
-            result = raw_result
-        print("CrewAI parsed result:", result)
-        return result
-    except Exception as e:
-        print("CrewAI JSON parsing error:", e)
-        return None
+    result = parse_llm_json(raw_result, expect=dict)
+    print("CrewAI parsed result:", result)
+    return result
@@ -2,7 +2,10 @@ import os
 import asyncio
 from crewai import Agent, Task, Crew
 from tools import SearchTools
-import json
+from llm_pool import run_in_llm_pool
+from llm_cache import acached_kickoff
+from llm_json import parse_llm_json
+from prompt_compaction import budget_chars, select_windows
 import httpx
 from typing import Dict, List, Any, Optional
 
@@ -67,7 +70,7 @@ class SimilarProductsCrew:
             description=(
                 f"Given the following product details, output a JSON object with: 'summary' (one sentence summary), 'search_term' (natural search phrase for similar products), and echo back the fields.\n"
                 f"title: {product_info.get('title', '')}\n"
-                f"description: {product_info.get('description', '')}\n"
+                f"description: {select_windows(product_info.get('description', ''), budget_chars('search_term'), task='search_term')}\n"
                 f"color: {product_info.get('color', '')}\n"
                 f"price: {product_info.get('price', '')}\n"
             ),
@@ -75,71 +78,24 @@ class SimilarProductsCrew:
             agent=agent
         )
         crew = Crew(tasks=[task])
-        result = crew.kickoff()
+        result = await acached_kickoff(crew)
         
-        # Handle different result types
-        try:
-            if isinstance(result, str):
-                # Parse JSON string
-                return json.loads(result)
-            elif hasattr(result, 'json_dict') and result.json_dict:
-                # CrewOutput with json_dict
-                return result.json_dict
-            elif hasattr(result, 'raw') and result.raw:
-                # CrewOutput with raw string
-                return json.loads(result.raw)
-            elif hasattr(result, '__dict__'):
-                # Object with dict representation
-                return result.__dict__
-            else:
-                # Return as is
-                return result
-        except Exception as e:
-            print(f"Error parsing search term result: {e}")
-            # Return a default search term based on the product title
+        parsed = parse_llm_json(result, expect=dict)
+        if parsed is None:
+            # Default search term based on the product title
             return {
                 "search_term": f"similar to {self.product_title}",
                 "summary": self.product_title
             }
+        return parsed
 
     def extract_result_data(self, result) -> Dict[str, Any]:
         """Extract data from various result types (string, CrewOutput, dict, etc.)"""
-        try:
-            if isinstance(result, str):
-                # Try to parse as JSON string
-                cleaned = result.strip()
-                # Remove code block markers if present
-                if cleaned.startswith('```') and cleaned.endswith('```'):
-                    cleaned = '\n'.join(cleaned.split('\n')[1:-1])
-                elif cleaned.startswith('```'):
-                    # Only start marker
-                    cleaned = '\n'.join(cleaned.split('\n')[1:])
-                return json.loads(cleaned)
-            elif hasattr(result, 'json_dict') and result.json_dict:
-                # CrewOutput with json_dict
-                return result.json_dict
-            elif hasattr(result, 'raw') and result.raw:
-                # CrewOutput with raw string
-                cleaned = result.raw.strip()
-                # Fix common JSON formatting issues
-                if cleaned.endswith(']"}'): 
-                    cleaned = cleaned[:-3] + ']}'
-                elif cleaned.endswith('"}'):
-                    cleaned = cleaned[:-2] + '}'
-                return json.loads(cleaned)
-            elif isinstance(result, dict):
-                # Already a dict
-                return result
-            elif hasattr(result, '__dict__'):
-                # Object with dict representation
-                return result.__dict__
-            else:
-                # Return empty dict as fallback
-                return {"products": []}
-        except Exception as e:
-            import logging
-            logging.error(f"Error extracting result data: {e}")
+        parsed = parse_llm_json(result)
+        if parsed is None:
+            # Return empty dict as fallback
             return {"products": []}
+        return parsed
 
     async def run_async(self, product_url=None) -> Dict[str, Any]:
         """Run the similar products search flow asynchronously."""
@@ -184,7 +140,7 @@ class SimilarProductsCrew:
             
             # Run Exa search
             exa_crew = Crew(agents=[exa_agent], tasks=[exa_task], verbose=False)
-            exa_result = await exa_crew.kickoff_async()
+            exa_result = await run_in_llm_pool(exa_crew.kickoff)
             
             # Process the search results
             product_processor = Agent(
@@ -219,7 +175,7 @@ class SimilarProductsCrew:
                 verbose=False
             )
             
-            final_result = processor_crew.kickoff()
+            final_result = await run_in_llm_pool(processor_crew.kickoff)
             
             # Return the processed results
             return self.extract_result_data(final_result)
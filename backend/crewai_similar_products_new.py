@@ -3,8 +3,14 @@ import asyncio
 import logging
 from crewai import Agent, Task, Crew, LLM
 from crewai.tools import BaseTool
-from exa_py import Exa
-from tools import SearchTools
+from tools import SearchTools, get_exa_client
+from projections import exa_contents, exa_text
+from llm_pool import run_in_llm_pool
+from llm_cache import acached_kickoff
+from deadline import DeadlineExceeded, deadline_expired, within_deadline
+from llm_json import parse_llm_json
+from prompt_compaction import budget_chars, compact_records, select_windows
+from relevance import RELEVANCE_LLM_TIEBREAK, rank_candidates
 import json
 import httpx
 from typing import Dict, List, Any, Optional
@@ -17,10 +23,6 @@ logger = logging.getLogger(__name__)
 # --- No database dependency ---
 # Note: Supabase functionality removed as it's not set up yet
 
-# Get Exa API key from environment
-EXA_API_KEY = os.getenv("EXA_API_KEY", "24b1e244-275f-4343-bd1d-0578e3ddc020")
-exa_client = Exa(EXA_API_KEY)
-
 # Define the Exa tools as top-level classes with proper type annotations
 class ExaFindSimilarTool(BaseTool):
     name: str = "ExaFindSimilarTool"
@@ -33,7 +35,7 @@ class ExaFindSimilarTool(BaseTool):
         # Try URL-based search first
         try:
             logger.info("Attempting to find similar products using URL...")
-            result = exa_client.find_similar(url=url, num_results=10)
+            result = get_exa_client().find_similar(url=url, num_results=10, contents=exa_contents("metadata"))
             logger.info(f"Found {len(result.results)} similar links from URL search")
             
             for item in result.results:
@@ -66,7 +68,9 @@ class ExaFindSimilarTool(BaseTool):
                             
                             try:
                                 # Perform content search as fallback
-                                content_result = exa_client.search(search_query, num_results=10)
+                                content_result = get_exa_client().search(
+                                    search_query, num_results=10, contents=exa_contents("metadata")
+                                )
                                 logger.info(f"Fallback search found {len(content_result.results)} results")
                                 
                                 for item in content_result.results:
@@ -96,7 +100,7 @@ class ExaContentsTool(BaseTool):
     def _run(self, url: str) -> str:
         try:
             logger.info(f"Fetching content for URL: {url}")
-            content = exa_client.get_contents(url=url)
+            content = get_exa_client().get_contents(url, text=exa_text("page"))
             
             # Extract valuable information
             result = {"url": url}
@@ -107,13 +111,13 @@ class ExaContentsTool(BaseTool):
                 # Extract title
                 result["title"] = content_result.title if hasattr(content_result, 'title') else ""
                 
-                # Extract text content (truncate for reasonable size)
-                result["text"] = content_result.text[:2000] if hasattr(content_result, 'text') else ""
+                # Extract text content (capped at EXA_PAGE_CHARS by Exa)
+                result["text"] = getattr(content_result, 'text', None) or ""
                 
                 # Extract images
-                result["image_urls"] = content_result.image_urls if hasattr(content_result, 'image_urls') else []
+                result["image_urls"] = [content_result.image] if getattr(content_result, 'image', None) else []
             
-            return json.dumps(result, indent=2)
+            return json.dumps(result)
         except Exception as e:
             logger.exception(f"Error fetching content: {e}")
             return json.dumps({"error": str(e), "url": url})
@@ -185,7 +189,7 @@ class SimilarProductsCrew:
             description=(
                 f"Given the following product details, output a JSON object with: 'summary' (one sentence summary), 'search_term' (natural search phrase for similar products), and echo back the fields.\n"
                 f"title: {product_info.get('title', '')}\n"
-                f"description: {product_info.get('description', '')}\n"
+                f"description: {select_windows(product_info.get('description', ''), budget_chars('search_term'), task='search_term')}\n"
                 f"color: {product_info.get('color', '')}\n"
                 f"price: {product_info.get('price', '')}\n"
             ),
@@ -193,149 +197,40 @@ class SimilarProductsCrew:
             agent=agent
         )
         crew = Crew(tasks=[task])
-        result = crew.kickoff()
+        result = await acached_kickoff(crew)
         
-        # Handle different result types
-        try:
-            if isinstance(result, str):
-                # Parse JSON string
-                return json.loads(result)
-            elif hasattr(result, 'json_dict') and result.json_dict:
-                # CrewOutput with json_dict
-                return result.json_dict
-            elif hasattr(result, 'raw') and result.raw:
-                # CrewOutput with raw string
-                return json.loads(result.raw)
-            elif hasattr(result, '__dict__'):
-                # Object with dict representation
-                return result.__dict__
-            else:
-                # Return as is
-                return result
-        except Exception as e:
-            print(f"Error parsing search term result: {e}")
-            # Return a default search term based on the product title
+        parsed = parse_llm_json(result, expect=dict)
+        if parsed is None:
+            # Default search term based on the product title
             return {
                 "search_term": f"similar to {self.product_title}",
                 "summary": self.product_title
             }
+        return parsed
 
     def extract_result_data(self, result) -> Dict[str, Any]:
-        """Extract data from various result types (string, CrewOutput, dict, etc.)"""
+        """Extract {"similar_products": [...]} from various result types (string, CrewOutput, dict, list)."""
         import logging
         logger = logging.getLogger(__name__)
-        
+
         logger.info(f"Extracting result data from type: {type(result)}")
-        if hasattr(result, 'raw'):
-            logger.info(f"Result has raw attribute: {result.raw[:200]}...")
-        
-        # IMPORTANT: Direct forwarding of results
-        # First priority: Check if result.raw is a valid JSON array and use it directly
-        if hasattr(result, 'raw') and result.raw:
-            cleaned = result.raw.strip()
-            logger.info(f"Processing CrewOutput.raw: {cleaned[:200]}...")
-            
-            # Check if the raw output is a JSON array
-            if cleaned.startswith('[') and cleaned.endswith(']'):
-                try:
-                    parsed = json.loads(cleaned)
-                    logger.info(f"Successfully parsed raw as JSON array with {len(parsed)} items")
-                    return {"similar_products": parsed}
-                except json.JSONDecodeError:
-                    logger.warning("Failed to parse raw as JSON array, continuing with other methods")
-        
-        try:
-            # If result is already a list of products, wrap it in a dict
-            if isinstance(result, list):
-                logger.info(f"Result is a list with {len(result)} items")
-                return {"similar_products": result}
-            
-            elif isinstance(result, str):
-                # Try to parse as JSON string
-                cleaned = result.strip()
-                logger.info(f"Cleaning string result: {cleaned[:200]}...")
-                
-                # Remove code block markers if present
-                if cleaned.startswith('```') and cleaned.endswith('```'):
-                    cleaned = '\n'.join(cleaned.split('\n')[1:-1])
-                elif cleaned.startswith('```'):
-                    # Only start marker
-                    cleaned = '\n'.join(cleaned.split('\n')[1:])
-                    
-                # Try to parse as JSON
-                try:
-                    parsed = json.loads(cleaned)
-                    logger.info(f"Successfully parsed string as JSON: {type(parsed)}")
-                    if isinstance(parsed, list):
-                        return {"similar_products": parsed}
-                    return parsed
-                except json.JSONDecodeError:
-                    logger.warning(f"Failed to parse as JSON, returning as text: {cleaned[:100]}...")
-                    return {"similar_products": [{"text": cleaned, "url": "", "title": "Extracted Text"}]}
-            
-            elif hasattr(result, 'raw') and result.raw:
-                # Already tried direct JSON parsing above, now try extracting JSON from text
-                cleaned = result.raw.strip()
-                
-                # Try to extract JSON from the text (common in agent outputs)
-                import re
-                json_match = re.search(r'\[\s*{.*}\s*\]', cleaned, re.DOTALL)
-                if json_match:
-                    try:
-                        json_str = json_match.group(0)
-                        logger.info(f"Found JSON array in raw text: {json_str[:200]}...")
-                        parsed = json.loads(json_str)
-                        return {"similar_products": parsed}
-                    except json.JSONDecodeError:
-                        logger.warning("Failed to parse extracted JSON array")
-                
-                # Fix common JSON formatting issues and try again
-                if cleaned.endswith(']"}'): 
-                    cleaned = cleaned[:-3] + ']}' 
-                elif cleaned.endswith('"}'):
-                    cleaned = cleaned[:-2] + '}'
-                    
-                try:
-                    parsed = json.loads(cleaned)
-                    logger.info(f"Parsed fixed JSON: {type(parsed)}")
-                    if isinstance(parsed, list):
-                        return {"similar_products": parsed}
-                    return parsed
-                except json.JSONDecodeError:
-                    logger.warning("Failed to parse fixed JSON")
-                    
-            elif hasattr(result, 'json_dict') and result.json_dict:
-                # CrewOutput with json_dict
-                logger.info(f"Using CrewOutput.json_dict: {type(result.json_dict)}")
-                if isinstance(result.json_dict, list):
-                    return {"similar_products": result.json_dict}
-                return result.json_dict
-                
-            elif isinstance(result, dict):
-                # Already a dict
-                logger.info(f"Result is already a dict with keys: {result.keys()}")
-                # If it doesn't have similar_products key, add it
-                if "similar_products" not in result and any(isinstance(val, list) for val in result.values()):
-                    # Find the first list value and use it as similar_products
-                    for key, val in result.items():
-                        if isinstance(val, list):
-                            logger.info(f"Using list value from key '{key}' as similar_products")
-                            return {"similar_products": val}
-                return result
-                
-            elif hasattr(result, '__dict__'):
-                # Object with dict representation
-                logger.info(f"Converting object to dict: {type(result)}")
-                return result.__dict__
-                
-            else:
-                # Return empty dict as fallback
-                logger.warning(f"Unhandled result type: {type(result)}, returning empty products list")
-                return {"similar_products": []}
-                
-        except Exception as e:
-            logger.error(f"Error extracting result data: {str(e)}")
-            return {"similar_products": []}
+        parsed = parse_llm_json(result)
+        if isinstance(parsed, list):
+            logger.info(f"Result is a list with {len(parsed)} items")
+            return {"similar_products": parsed}
+        if isinstance(parsed, dict):
+            if "similar_products" not in parsed:
+                # Use the first list value as similar_products
+                for key, val in parsed.items():
+                    if isinstance(val, list):
+                        logger.info(f"Using list value from key '{key}' as similar_products")
+                        return {"similar_products": val}
+            return parsed
+        if isinstance(result, str) and result.strip():
+            logger.warning(f"Failed to parse as JSON, returning as text: {result[:100]}...")
+            return {"similar_products": [{"text": result.strip(), "url": "", "title": "Extracted Text"}]}
+        logger.warning(f"Unhandled result type: {type(result)}, returning empty products list")
+        return {"similar_products": []}
 
     def create_product_processor_agent(self):
         """Create an agent to process and filter similar products."""
@@ -353,6 +248,34 @@ class SimilarProductsCrew:
             llm=self.llm
         )
     
+    async def break_ties(self, borderline: List[Dict[str, Any]]) -> set:
+        """URLs among the borderline products that an LLM judges to be a different type of product."""
+        judge_agent = Agent(
+            role="Product Relevance Filter",
+            goal="Decide which borderline products are the same type of product as the original",
+            backstory="You're an expert at determining product relevance by type, category, and features.",
+            llm=self.llm
+        )
+        listing = "\n".join(
+            "- " + " | ".join(f"{field}: {value}" for field, value in prod.items())
+            for prod in compact_records(borderline, ("url", "title", "product_description"), task="tie_break")
+        )
+        judge_task = Task(
+            description=(
+                f"Original product: '{self.product_title}' ({self.product_description}).\n"
+                f"Candidates:\n{listing}\n\n"
+                "Return ONLY a JSON list of the urls of candidates that are the same type of product as the original. "
+                "Be somewhat generous - include broadly related items."
+            ),
+            expected_output="A JSON list of urls, e.g. [\"https://...\"]",
+            agent=judge_agent
+        )
+        keep = parse_llm_json(await acached_kickoff(Crew(agents=[judge_agent], tasks=[judge_task])), expect=list)
+        if keep is None:
+            return set()
+        keep = {url for url in keep if isinstance(url, str)}
+        return {prod.get("url") for prod in borderline if prod.get("url") not in keep}
+
     async def run_async(self, product_url=None) -> Dict[str, Any]:
         """Run the similar products search flow using a three-agent architecture with Exa tools."""
         try:
@@ -408,24 +331,21 @@ class SimilarProductsCrew:
                 verbose=True
             )
             
-            similar_result = similar_crew.kickoff()
+            try:
+                similar_result = await within_deadline(run_in_llm_pool(similar_crew.kickoff))
+            except DeadlineExceeded:
+                self.logger.warning("Request deadline ran out while finding similar products")
+                return {"similar_products": [], "partial": True}
             
-            # DIRECT USE OF AGENT OUTPUT: Force the agent's raw output to be the result
-            if hasattr(similar_result, 'raw') and similar_result.raw:
-                try:
-                    # Directly use the agent's raw output if it's valid JSON
-                    cleaned_raw = similar_result.raw.strip()
-                    if cleaned_raw.startswith('[') and cleaned_raw.endswith(']'):
-                        parsed_products = json.loads(cleaned_raw)
-                        if isinstance(parsed_products, list):
-                            self.logger.info(f"Directly using agent output as similar products: {len(parsed_products)} items")
-                            return {"similar_products": parsed_products}
-                except Exception as e:
-                    self.logger.warning(f"Failed to directly use agent raw output: {str(e)}")
-                    # Continue to fallback processing
+            # DIRECT USE OF AGENT OUTPUT: a bare JSON array from the agent is the result
+            raw = (getattr(similar_result, "raw", None) or "").strip()
+            raw_products = parse_llm_json(raw, expect=list) if raw.startswith("[") else None
+            if raw_products is not None:
+                self.logger.info(f"Directly using agent output as similar products: {len(raw_products)} items")
+                return {"similar_products": raw_products}
             
             # Extract similar products data
-            similar_data = self.extract_result_data(similar_result)
+            similar_data = self.extract_result_data(similar_result).get("similar_products")
             self.logger.info(f"Found {len(similar_data) if isinstance(similar_data, list) else 0} similar products")
             
             # If we got no results or results in wrong format, handle gracefully
@@ -434,19 +354,18 @@ class SimilarProductsCrew:
                 return {"similar_products": []}
             
             # STEP 2: For each similar product URL, fetch its content using Firecrawl
-            from extraction_utils import fetch_firecrawl_contents
+            from extraction_utils import fetch_firecrawl_contents_many
             self.logger.info("STEP 2: Extracting product data for each similar product URL using Firecrawl")
-            # Log all URLs to be crawled by Firecrawl
-            urls_to_crawl = [prod.get("url") for prod in similar_data if prod.get("url")]
-            self.logger.info(f"[Firecrawl] About to crawl {len(urls_to_crawl)} URLs: {urls_to_crawl}")
-            detailed_products = []
             for idx, prod in enumerate(similar_data):
-                url = prod.get("url")
-                if not url:
+                if not prod.get("url"):
                     self.logger.warning(f"Skipping product with missing URL at index {idx}: {prod}")
-                    continue
-                self.logger.info(f"[Firecrawl] ({idx+1}/{len(urls_to_crawl)}) Crawling URL: {url}")
-                firecrawl_data = fetch_firecrawl_contents(url)
+            products_to_crawl = [prod for prod in similar_data if prod.get("url")]
+            urls_to_crawl = [prod["url"] for prod in products_to_crawl]
+            self.logger.info(f"[Firecrawl] About to crawl {len(urls_to_crawl)} URLs: {urls_to_crawl}")
+            scraped = await fetch_firecrawl_contents_many(urls_to_crawl, require_price=False)
+            detailed_products = []
+            for prod, firecrawl_data in zip(products_to_crawl, scraped):
+                url = prod["url"]
                 if firecrawl_data:
                     # Attach the original similarity score and title if needed
                     firecrawl_data["similarity_score"] = prod.get("score")
@@ -457,61 +376,26 @@ class SimilarProductsCrew:
                 else:
                     self.logger.warning(f"[Firecrawl] Extraction failed for {url}")
             self.logger.info(f"Extracted detailed data for {len(detailed_products)} products using Firecrawl")
+            # STEP 3: Rank products for relevance locally (BM25 + category features)
+            source = {
+                "title": self.product_title,
+                "description": f"{self.product_description} {self.product_color}".strip(),
+            }
+            ranked, ambiguous = rank_candidates(source, detailed_products)
+            self.logger.info(f"Kept {len(ranked)} of {len(detailed_products)} products as relevant ({len(ambiguous)} borderline)")
+            partial = False
+            if RELEVANCE_LLM_TIEBREAK and ambiguous and not deadline_expired():
+                try:
+                    rejected = await within_deadline(self.break_ties(ambiguous))
+                    ranked = [prod for prod in ranked if prod.get("url") not in rejected]
+                except DeadlineExceeded:
+                    self.logger.warning("Request deadline ran out during the relevance tie-break, keeping borderline products")
+                    partial = True
             
-            # STEP 3: Filter products for relevance
-            self.logger.info("STEP 3: Creating Product Filter agent")
-            filter_agent = Agent(
-                role="Product Relevance Filter",
-                goal="Filter products for relevance to the original product",
-                backstory="You're an expert at determining product relevance. You can identify which products are truly similar to the original product based on type, category, and features.",
-                verbose=True,
-                llm=self.llm
-            )
-            
-            filter_task = Task(
-                description=(
-                    f"Filter these products for relevance to the original product:\n"
-                    f"Original product: '{self.product_title}'\n"
-                    f"Description: '{self.product_description}'\n"
-                    f"Color: '{self.product_color}'\n"
-                    f"Price: {self.product_price}\n\n"
-                    "FILTERING INSTRUCTIONS:\n"
-                    "- Keep only products that match the SAME TYPE as the original product\n"
-                    "- Example: If original is a pearl necklace, keep only other jewelry items\n"
-                    "- Example: If original is a belt, keep only other belts or similar accessories\n"
-                    "- Be somewhat generous with your filtering - include broadly related items\n"
-                    "- Keep at least 3-5 products if possible\n"
-                    "- Ensure every product has title, url, description, price, retailer, and image_url fields\n"
-                    "- Return a clean JSON with 'similar_products' as the root key\n"
-                ),
-                expected_output="{'similar_products': [...]} containing only relevant filtered products",
-                agent=filter_agent,
-                context=detailed_products  # Pass the detailed products as context
-            )
-            
-            # Run the filter agent
-            self.logger.info("Starting product filtering")
-            filter_crew = Crew(
-                agents=[filter_agent],
-                tasks=[filter_task],
-                verbose=True
-            )
-            
-            filter_result = filter_crew.kickoff()
-            
-            # Extract final filtered results
-            final_results = self.extract_result_data(filter_result)
-            
-            # Make sure we have the expected format for frontend
-            if not isinstance(final_results, dict) or "similar_products" not in final_results:
-                self.logger.warning("Final result not in expected format, reformatting")
-                if isinstance(final_results, list):
-                    final_results = {"similar_products": final_results}
-                else:
-                    final_results = {"similar_products": []}
-            
-            self.logger.info(f"Final result has {len(final_results.get('similar_products', [])) if isinstance(final_results.get('similar_products'), list) else 0} products")
-            return final_results
+            self.logger.info(f"Final result has {len(ranked)} products")
+            if partial:
+                return {"similar_products": ranked, "partial": True}
+            return {"similar_products": ranked}
             
         except Exception as e:
             self.logger.exception(f"Error in similar products search: {str(e)}")
@@ -0,0 +1,100 @@
+"""
+Request-level deadline budgets for multi-stage endpoints.
+
+An endpoint starts a Deadline (from the client's X-Request-Deadline header /
+`deadline` query parameter, or REQUEST_DEADLINE) and activates it for the
+request. Every stage then asks for its timeout via stage_timeout(default),
+which is the stage's own limit capped by the time left, or awaits through
+within_deadline(). When the budget runs out the remaining stages raise
+DeadlineExceeded (or see a zero timeout) and the endpoint returns the results
+it already has, flagged "partial".
+
+The active deadline lives in a context variable, so it follows the request
+into tasks it spawns (Firecrawl fan-out, single-flight calls).
+"""
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+# Default and maximum end-to-end budget per request, in seconds
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "90"))
+REQUEST_DEADLINE_MAX = float(os.getenv("REQUEST_DEADLINE_MAX", "300"))
+DEADLINE_HEADER = "X-Request-Deadline"
+
+_current = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's deadline ran out before a stage finished."""
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    @classmethod
+    def start(cls, seconds: Optional[float] = None) -> "Deadline":
+        """Deadline of `seconds` (client supplied, clamped to REQUEST_DEADLINE_MAX) or REQUEST_DEADLINE."""
+        if seconds is None or seconds <= 0:
+            seconds = REQUEST_DEADLINE
+        return cls(min(seconds, REQUEST_DEADLINE_MAX))
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def use_deadline(deadline: Deadline):
+    """Make `deadline` the active one for the code (and tasks spawned) inside the block."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Closed from another context (an abandoned streaming generator); nothing to restore
+            pass
+
+
+def stage_timeout(default: Optional[float] = None) -> Optional[float]:
+    """A stage's timeout: `default` capped by the time left on the active deadline (None = unbounded)."""
+    deadline = _current.get()
+    if deadline is None:
+        return default
+    remaining = deadline.remaining()
+    return remaining if default is None else min(default, remaining)
+
+
+def deadline_expired() -> bool:
+    deadline = _current.get()
+    return deadline is not None and deadline.expired
+
+
+async def within_deadline(aw, timeout: Optional[float] = None):
+    """
+    Await `aw` for at most stage_timeout(timeout) seconds. Raises
+    DeadlineExceeded when the request deadline is what ran out, and
+    asyncio.TimeoutError when the stage's own `timeout` did.
+    """
+    limit = stage_timeout(timeout)
+    if limit is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, limit)
+    except asyncio.TimeoutError:
+        if deadline_expired():
+            raise DeadlineExceeded()
+        raise
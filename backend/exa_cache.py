@@ -0,0 +1,234 @@
+"""
+Cache for Exa findSimilar and search responses, with stale-while-revalidate.
+
+Entries are raw Exa response JSON, keyed on endpoint + normalized request
+parameters (canonical URL, case/whitespace-folded query, camelCase keys), so
+the direct httpx calls in main/tools and the exa_py clients share entries.
+Within EXA_CACHE_FRESH_TTL a hit is served as is. After that, until
+EXA_CACHE_STALE_TTL, the stale entry is still served immediately and one
+background refresh per key brings it up to date.
+
+Wrap an exa_py client with cached_exa_client(); call acached_request() /
+cached_request() around direct HTTP calls. EXA_CACHE_ENABLED=false turns
+caching off.
+"""
+import os
+import re
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlite_cache import SqliteCache
+from url_utils import canonicalize_url
+from governor import permit
+from breaker import breaker_name, guard
+import metrics
+
+logger = logging.getLogger("exa_cache")
+
+EXA_CACHE_ENABLED = os.getenv("EXA_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXA_CACHE_PATH = os.getenv(
+    "EXA_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "exa_cache.sqlite3")
+)
+EXA_CACHE_FRESH_TTL = float(os.getenv("EXA_CACHE_FRESH_TTL", str(6 * 3600)))
+EXA_CACHE_STALE_TTL = float(os.getenv("EXA_CACHE_STALE_TTL", str(7 * 24 * 3600)))
+EXA_CACHE_MAX_ENTRIES = int(os.getenv("EXA_CACHE_MAX_ENTRIES", "5000"))
+EXA_CACHE_MAX_BYTES = int(os.getenv("EXA_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Exa endpoints whose responses are cached (normalized: no leading slash or /v1 prefix)
+CACHED_ENDPOINTS = ("findSimilar", "search")
+
+_SNAKE_RE = re.compile(r"_([a-z])")
+# exa_py reports HTTP errors as ValueError("Request failed with status code 429: ...")
+_STATUS_RE = re.compile(r"status code (\d{3})")
+
+
+class ExaCache(SqliteCache):
+    HIT_COUNTERS = ("hits", "stale_hits")
+    MISS_COUNTERS = ("misses",)
+
+    def __init__(self, path: str, fresh_ttl: float, stale_ttl: float, max_entries: int, max_bytes: int):
+        super().__init__(path, max_entries=max_entries, max_bytes=max_bytes)
+        self.fresh_ttl = fresh_ttl
+        self.stale_ttl = stale_ttl
+        self._counters.update(refreshes=0, refresh_failures=0)
+
+    def get(self, key: str):
+        """(response, is_fresh) for `key`, or None."""
+        found = self._read(key, self.stale_ttl)
+        if found is None:
+            self._count("misses")
+            return None
+        data, age = found
+        fresh = age <= self.fresh_ttl
+        self._count("hits" if fresh else "stale_hits")
+        return data, fresh
+
+    def put(self, key: str, data) -> None:
+        self._write(key, data)
+
+
+_exa_cache = None
+_init_lock = threading.Lock()
+# Keys with a background refresh in flight (shared by the async and thread paths)
+_refreshing = set()
+_refresh_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="exa-refresh")
+_refresh_tasks = set()
+
+
+def get_exa_cache():
+    """Process-wide ExaCache, or None when EXA_CACHE_ENABLED is off."""
+    global _exa_cache
+    if not EXA_CACHE_ENABLED:
+        return None
+    if _exa_cache is None:
+        with _init_lock:
+            if _exa_cache is None:
+                _exa_cache = ExaCache(
+                    EXA_CACHE_PATH,
+                    fresh_ttl=EXA_CACHE_FRESH_TTL,
+                    stale_ttl=EXA_CACHE_STALE_TTL,
+                    max_entries=EXA_CACHE_MAX_ENTRIES,
+                    max_bytes=EXA_CACHE_MAX_BYTES,
+                )
+                logger.info(f"Exa cache opened at {EXA_CACHE_PATH}")
+    return _exa_cache
+
+
+def normalize_endpoint(endpoint: str) -> str:
+    endpoint = endpoint.strip("/")
+    return endpoint[3:] if endpoint.startswith("v1/") else endpoint
+
+
+def _normalize_params(params: dict) -> dict:
+    normalized = {}
+    for key, value in params.items():
+        if value is None:
+            continue
+        key = _SNAKE_RE.sub(lambda m: m.group(1).upper(), key)
+        if key == "url" and isinstance(value, str):
+            value = canonicalize_url(value)
+        elif key == "query" and isinstance(value, str):
+            value = " ".join(value.lower().split())
+        normalized[key] = value
+    return normalized
+
+
+def make_key(endpoint: str, params: dict) -> str:
+    return f"{normalize_endpoint(endpoint)}:{json.dumps(_normalize_params(params), sort_keys=True, default=str)}"
+
+
+def _claim_refresh(key: str) -> bool:
+    with _refresh_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _release_refresh(key: str) -> None:
+    with _refresh_lock:
+        _refreshing.discard(key)
+
+
+async def _arefresh(cache: ExaCache, key: str, fetch) -> None:
+    try:
+        await asyncio.to_thread(cache.put, key, await fetch())
+        cache._count("refreshes")
+    except Exception as e:
+        cache._count("refresh_failures")
+        logger.warning(f"Background Exa refresh failed for {key[:80]}: {e}")
+    finally:
+        _release_refresh(key)
+
+
+def _refresh(cache: ExaCache, key: str, fetch) -> None:
+    try:
+        cache.put(key, fetch())
+        cache._count("refreshes")
+    except Exception as e:
+        cache._count("refresh_failures")
+        logger.warning(f"Background Exa refresh failed for {key[:80]}: {e}")
+    finally:
+        _release_refresh(key)
+
+
+async def acached_request(endpoint: str, params: dict, fetch):
+    """
+    Exa response for (endpoint, params): from the cache when fresh, from the
+    cache plus a background refresh when stale, else `await fetch()` (stored).
+    Cache reads and writes (SQLite + zlib) run in a worker thread.
+    """
+    cache = get_exa_cache()
+    if cache is None:
+        return await fetch()
+    key = make_key(endpoint, params)
+    found = await asyncio.to_thread(cache.get, key)
+    if found is not None:
+        data, fresh = found
+        if not fresh and _claim_refresh(key):
+            task = asyncio.create_task(_arefresh(cache, key, fetch))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return data
+    data = await fetch()
+    await asyncio.to_thread(cache.put, key, data)
+    return data
+
+
+def cached_request(endpoint: str, params: dict, fetch):
+    """acached_request for blocking callers (CrewAI tools, exa_py); refreshes run on a small thread pool."""
+    cache = get_exa_cache()
+    if cache is None:
+        return fetch()
+    key = make_key(endpoint, params)
+    found = cache.get(key)
+    if found is not None:
+        data, fresh = found
+        if not fresh and _claim_refresh(key):
+            _refresh_executor.submit(_refresh, cache, key, fetch)
+        return data
+    data = fetch()
+    cache.put(key, data)
+    return data
+
+
+def cached_exa_client(client):
+    """
+    Route an exa_py client's requests through its circuit breaker and the
+    governor, and its findSimilar/search requests through the cache as well;
+    returns the client.
+    """
+    if client is None:
+        return None
+    request = client.request
+
+    def _governed(endpoint, data, method, *args, **kwargs):
+        stage = metrics.stage(f"exa_sdk:{normalize_endpoint(endpoint)}")
+        with stage, guard(breaker_name("exa", endpoint)) as call, permit("exa") as held:
+            try:
+                result = request(endpoint, data, method, *args, **kwargs)
+            except ValueError as e:
+                match = _STATUS_RE.search(str(e))
+                if match:
+                    held.record(int(match.group(1)))
+                    call.record(int(match.group(1)))
+                raise
+            held.record(200)
+            call.record(200)
+            return result
+
+    def _cached(endpoint, data=None, method="POST", *args, **kwargs):
+        if (
+            method != "POST"
+            or not isinstance(data, dict)
+            or data.get("stream")
+            or normalize_endpoint(endpoint) not in CACHED_ENDPOINTS
+        ):
+            return _governed(endpoint, data, method, *args, **kwargs)
+        return cached_request(endpoint, data, lambda: _governed(endpoint, data, method, *args, **kwargs))
+
+    client.request = _cached
+    return client
@@ -1,17 +1,31 @@
 import os
 import json
+import asyncio
 import logging
-import requests
-from exa_py import Exa
-from firecrawl import JsonConfig, FirecrawlApp
 from pydantic import BaseModel
+from http_clients import get_client, get_async_client
+from scrape_cache import get_scrape_cache
+from product_index import index_product
+from singleflight import SingleFlight, ThreadSingleFlight
+from url_utils import canonicalize_url
+from deadline import stage_timeout
+import metrics
+from breaker import CircuitOpenError
+from price_parser import parse_price
+from projections import EXA_PAGE_CHARS, FIRECRAWL_EXTRACT_TIMEOUT, exa_rest_text, firecrawl_scrape_body
 
 logger = logging.getLogger("extraction_utils")
 
 EXA_API_KEY = os.getenv("EXA_API_KEY")
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
 
-exa_client = Exa(EXA_API_KEY) if EXA_API_KEY else None
+# Fan-out settings for scraping several URLs at once (similar products etc.)
+FIRECRAWL_CONCURRENCY = int(os.getenv("FIRECRAWL_CONCURRENCY", "5"))
+FIRECRAWL_URL_TIMEOUT = float(os.getenv("FIRECRAWL_URL_TIMEOUT", "75"))
+
+# Coalesce concurrent scrapes of the same page (async handlers / worker threads)
+_afirecrawl_flight = SingleFlight("firecrawl_json")
+_firecrawl_flight = ThreadSingleFlight("firecrawl_json_sync")
 
 class ProductSchema(BaseModel):
     title: str = ''
@@ -25,71 +39,238 @@ class ProductSchema(BaseModel):
     site_name: str = ''
     url: str = ''
 
-def fetch_firecrawl_contents(url: str):
+def _firecrawl_json_payload(url: str) -> dict:
+    """Request body for a Firecrawl /v1/scrape call that extracts ProductSchema as JSON."""
+    return firecrawl_scrape_body(
+        url, ["json"],
+        jsonOptions={"schema": ProductSchema.model_json_schema()},
+        timeout=int(FIRECRAWL_EXTRACT_TIMEOUT * 1000),  # milliseconds
+    )
+
+
+def _parse_firecrawl_json(url: str, resp):
+    """Turn a Firecrawl /v1/scrape response into a product data dict, or None."""
+    if resp.status_code != 200:
+        logger.error(f"[Firecrawl JSON] Firecrawl error for {url}: {resp.status_code} {resp.text[:500]}")
+        return None
+    body = resp.json()
+    product_data = (body.get("data") or {}).get("json")
+    if not body.get("success") or not product_data:
+        logger.error(f"[Firecrawl JSON] No data returned for {url}")
+        return None
+    logger.info(f"[Firecrawl JSON] Extraction successful for {url}")
+    logger.debug(f"[Firecrawl JSON] Output for {url}: {json.dumps(product_data)}")
+
+    # Convert to dict if needed
+    if not isinstance(product_data, dict):
+        product_data = dict(product_data)
+
+    # Add URL if not present
+    if 'url' not in product_data:
+        product_data['url'] = url
+
+    return product_data
+
+
+def _product_from_exa_contents(url: str, resp):
+    """ProductSchema-shaped dict from an Exa /contents response (the fallback when Firecrawl fails), or None."""
+    if resp.status_code != 200:
+        logger.error(f"[Exa contents] Exa error for {url}: {resp.status_code} {resp.text[:500]}")
+        return None
+    results = resp.json().get("results") or []
+    if not results:
+        return None
+    item = results[0]
+    text = item.get("text") or ""
+    price = parse_price(text)
+    return {
+        "title": item.get("title") or "",
+        "price": price.raw if price else "",
+        "currency": (price.currency or "") if price else "",
+        "product_description": text[:300],
+        "image_url": item.get("image") or "",
+        "url": url,
+        "text": text[:EXA_PAGE_CHARS],
+        "source": "exa_contents",
+    }
+
+
+def _exa_contents_request(url: str) -> dict:
+    return {"json": {"urls": [url], "text": exa_rest_text("page")}, "headers": {"Authorization": f"Bearer {EXA_API_KEY}"}}
+
+
+def fetch_exa_contents(url: str):
+    """Product data for `url` read through Exa contents (the fallback when Firecrawl fails), or None."""
+    if not EXA_API_KEY:
+        return None
+    logger.info(f"[Exa contents] Falling back to Exa contents for {url}")
+    with metrics.stage("exa_contents") as timer:
+        try:
+            return _product_from_exa_contents(url, get_client("exa").post("/contents", **_exa_contents_request(url)))
+        except Exception as e:
+            timer.fail(type(e).__name__)
+            logger.error(f"[Exa contents] Fallback failed for {url}: {str(e)}")
+            return None
+
+
+async def afetch_exa_contents(url: str):
+    """Async version of fetch_exa_contents."""
+    if not EXA_API_KEY:
+        return None
+    logger.info(f"[Exa contents] Falling back to Exa contents for {url}")
+    async with metrics.stage("exa_contents") as timer:
+        try:
+            resp = await get_async_client("exa").post("/contents", **_exa_contents_request(url))
+            return _product_from_exa_contents(url, resp)
+        except Exception as e:
+            timer.fail(type(e).__name__)
+            logger.error(f"[Exa contents] Fallback failed for {url}: {str(e)}")
+            return None
+
+
+def _cached_firecrawl_json(url: str, require_price: bool = True):
+    cache = get_scrape_cache()
+    cached = cache.get("firecrawl_json", url, require_price=require_price) if cache else None
+    if cached is not None:
+        logger.info(f"[Firecrawl JSON] Cache hit for {url}")
+    return cached
+
+
+def _store_firecrawl_json(url: str, product_data):
+    cache = get_scrape_cache()
+    if cache and product_data:
+        cache.put("firecrawl_json", url, product_data)
+    if product_data:
+        index_product(url, product_data)
+    return product_data
+
+
+def _firecrawl_json_request(url: str) -> dict:
+    logger.info(f"[Firecrawl JSON] Extracting product data for URL: {url}")
+    return {"json": _firecrawl_json_payload(url), "headers": {"Authorization": f"Bearer {FIRECRAWL_API_KEY}"}}
+
+
+def _firecrawl_json_result(url: str, resp, timer):
+    """Product data from a Firecrawl JSON response, cached and indexed, or None (Exa contents takes over)."""
+    product_data = _store_firecrawl_json(url, _parse_firecrawl_json(url, resp))
+    if not product_data:
+        timer.fail("no_data")
+    return product_data
+
+
+def _firecrawl_json_failed(url: str, error: Exception, timer) -> None:
+    if isinstance(error, CircuitOpenError):
+        timer.fail("circuit_open")
+        logger.warning(f"[Firecrawl JSON] {error}; skipping Firecrawl for {url}")
+    else:
+        timer.fail(type(error).__name__)
+        logger.exception(f"[Firecrawl JSON] Extraction failed: {str(error)}")
+
+
+def _scrape_firecrawl_json(url: str):
+    with metrics.stage("firecrawl_json") as timer:
+        try:
+            resp = get_client("firecrawl").post("/v1/scrape", **_firecrawl_json_request(url))
+            product_data = _firecrawl_json_result(url, resp, timer)
+            if product_data:
+                return product_data
+        except Exception as e:
+            _firecrawl_json_failed(url, e, timer)
+    return fetch_exa_contents(url)
+
+
+async def _ascrape_firecrawl_json(url: str):
+    async with metrics.stage("firecrawl_json") as timer:
+        try:
+            resp = await get_async_client("firecrawl").post("/v1/scrape", **_firecrawl_json_request(url))
+            # Caching and indexing write to SQLite; keep them off the event loop
+            product_data = await asyncio.to_thread(_firecrawl_json_result, url, resp, timer)
+            if product_data:
+                return product_data
+        except Exception as e:
+            _firecrawl_json_failed(url, e, timer)
+    return await afetch_exa_contents(url)
+
+
+def fetch_firecrawl_contents(url: str, require_price: bool = True):
     """
-    Extract product data from a single URL using Firecrawl SDK with ProductSchema.
-    Returns parsed product data dict, or None on error.
+    Extract product data from a single URL using Firecrawl JSON extraction with ProductSchema.
+    Blocking version for CrewAI tools and other threaded callers; uses the pooled sync client.
+    Concurrent calls for the same canonical URL share one upstream request.
+    When Firecrawl fails (or its circuit is open) the page is read through
+    Exa contents instead. Returns parsed product data dict, or None on error.
+    With require_price=False a cached scrape whose price has expired is
+    returned without its price fields instead of scraping the page again.
     """
     if not FIRECRAWL_API_KEY:
         logger.error("FIRECRAWL_API_KEY not set.")
         return None
-    
-    try:
-        logger.info(f"[Firecrawl SDK] Extracting product data for URL: {url}")
-        
-        # Initialize Firecrawl SDK with API key
-        app = FirecrawlApp(api_key=FIRECRAWL_API_KEY)
-        json_config = JsonConfig(schema=ProductSchema)
-        
-        # Use SDK to scrape URL with our product schema
-        result = app.scrape_url(
-            url,
-            formats=["json"],
-            json_options=json_config,
-            only_main_content=False,
-            timeout=60000  # 60 seconds in milliseconds
-        )
-        
-        # Check if we got valid results
-        if result and result.json:
-            logger.info(f"[Firecrawl SDK] Extraction successful for {url}")
-            print("\n[Firecrawl SDK Output]\n" + json.dumps(result.json, indent=2))
-            
-            # Convert to dict if needed
-            product_data = result.json
-            if not isinstance(product_data, dict):
-                product_data = dict(product_data)
-                
-            # Add URL if not present
-            if 'url' not in product_data:
-                product_data['url'] = url
-                
-            return product_data
-        else:
-            logger.error(f"[Firecrawl SDK] No data returned for {url}")
-    except Exception as e:
-        logger.error(f"[Firecrawl SDK] Extraction failed: {str(e)}")
-        import traceback
-        logger.error(traceback.format_exc())
-    
-    return None
-
-
-
-def extract_price_with_regex(text: str):
+
+    cached = _cached_firecrawl_json(url, require_price)
+    if cached is not None:
+        return cached
+    return _firecrawl_flight.do(f"firecrawl_json:{canonicalize_url(url)}", _scrape_firecrawl_json, url)
+
+
+async def afetch_firecrawl_contents(url: str, require_price: bool = True):
     """
-    Fallback price extraction using regex on raw text.
-    Returns price string or None.
+    Async version of fetch_firecrawl_contents for use inside FastAPI handlers.
+    Uses the pooled async client and reads the scrape cache in a worker
+    thread, so it never blocks the event loop.
     """
-    import re
-    if not text:
+    if not FIRECRAWL_API_KEY:
+        logger.error("FIRECRAWL_API_KEY not set.")
         return None
-    price_patterns = [
-        r'[$€£]\s?\d{1,3}(?:[,.]\d{3})*(?:[,.]\d{2})?',  # $1,299.99 or €299.99
-        r'\d{1,3}(?:[,.]\d{3})*(?:[,.]\d{2})?\s?(USD|EUR|GBP)',
-    ]
-    for pattern in price_patterns:
-        match = re.search(pattern, text)
-        if match:
-            return match.group(0)
-    return None
+
+    cached = await asyncio.to_thread(_cached_firecrawl_json, url, require_price)
+    if cached is not None:
+        return cached
+    return await _afirecrawl_flight.do(f"firecrawl_json:{canonicalize_url(url)}", _ascrape_firecrawl_json, url)
+
+
+def _bounded_fetches(urls, concurrency: int = None, timeout: float = None, require_price: bool = True):
+    """One coroutine per URL, each resolving to (index, product data or None), sharing a semaphore."""
+    concurrency = max(1, concurrency or FIRECRAWL_CONCURRENCY)
+    timeout = timeout or FIRECRAWL_URL_TIMEOUT
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(idx, url):
+        async with semaphore:
+            # Capped by the request deadline, if one is active (0 once it has run out)
+            limit = stage_timeout(timeout)
+            logger.info(f"[Firecrawl JSON] ({idx+1}/{len(urls)}) Scraping {url}")
+            try:
+                return idx, await asyncio.wait_for(afetch_firecrawl_contents(url, require_price), limit)
+            except asyncio.TimeoutError:
+                logger.warning(f"[Firecrawl JSON] Timed out after {limit:.1f}s for {url}")
+            except Exception as e:
+                logger.error(f"[Firecrawl JSON] Scrape failed for {url}: {str(e)}")
+            return idx, None
+
+    return [fetch_one(idx, url) for idx, url in enumerate(urls)]
+
+
+async def fetch_firecrawl_contents_many(urls, concurrency: int = None, timeout: float = None, require_price: bool = True):
+    """
+    Scrape several URLs concurrently with afetch_firecrawl_contents.
+    At most `concurrency` scrapes run at once and each one is cancelled after
+    `timeout` seconds, or when the active request deadline runs out. Returns a list aligned with `urls` (same order), holding
+    the product data dict or None for failed/timed-out URLs.
+    """
+    results = await asyncio.gather(*_bounded_fetches(urls, concurrency, timeout, require_price))
+    return [data for _, data in results]
+
+
+async def iter_firecrawl_contents(urls, concurrency: int = None, timeout: float = None, require_price: bool = True):
+    """
+    Same fan-out as fetch_firecrawl_contents_many, but yields (index, data)
+    pairs as each scrape finishes. Unfinished scrapes are cancelled if the
+    consumer stops early.
+    """
+    tasks = [asyncio.ensure_future(c) for c in _bounded_fetches(urls, concurrency, timeout, require_price)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
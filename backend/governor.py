@@ -0,0 +1,412 @@
+"""
+Adaptive rate limiting for upstream calls.
+
+Every call to Firecrawl, Exa or DuckDuckGo takes a permit from the limiter
+for its provider and, for scrapes, from the limiter for the target retail
+domain. A limiter combines:
+  - a token bucket (`rate` requests/second, `burst` capacity),
+  - an AIMD concurrency limit: +1/limit per fast success, halved on 429/503,
+    timeouts or transport errors (no response at all), x0.9 when latency
+    exceeds the provider's target; a cancelled call leaves it unchanged,
+  - Retry-After: a 429/503 with the header blocks new permits until then.
+
+A caller that has to wait sleeps until the next token, the end of the
+Retry-After block, or (when the concurrency limit is full) until a permit
+is returned. Per-domain limiters are kept for the GOVERNOR_MAX_DOMAINS most
+recently used domains; idle ones beyond that are dropped.
+
+The pooled httpx clients get this through GovernedTransport /
+GovernedAsyncTransport (see http_clients); other clients use permit() /
+apermit() directly. Limits and current state are in stats() (/api/stats).
+
+Per-provider settings come from DEFAULT_LIMITS, overridable with
+GOVERNOR_<NAME>_RATE / _BURST / _MAX_CONCURRENCY / _TARGET_LATENCY
+(NAME is the provider, or DOMAIN for per-retailer limiters).
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import httpx
+
+logger = logging.getLogger("governor")
+
+GOVERNOR_ENABLED = os.getenv("GOVERNOR_ENABLED", "true").lower() in ("1", "true", "yes")
+# Retries of a 429/503 after waiting out its Retry-After (pooled httpx clients only)
+GOVERNOR_MAX_RETRIES = int(os.getenv("GOVERNOR_MAX_RETRIES", "1"))
+# Upper bound on any single Retry-After we honour, in seconds
+GOVERNOR_MAX_RETRY_AFTER = float(os.getenv("GOVERNOR_MAX_RETRY_AFTER", "60"))
+# Backoff used for a 429 without Retry-After
+GOVERNOR_DEFAULT_BACKOFF = float(os.getenv("GOVERNOR_DEFAULT_BACKOFF", "2"))
+# Per-domain limiters kept (least recently used idle ones are dropped beyond this)
+GOVERNOR_MAX_DOMAINS = int(os.getenv("GOVERNOR_MAX_DOMAINS", "1000"))
+
+DEFAULT_LIMITS = {
+    "firecrawl": {"rate": 10.0, "burst": 10, "max_concurrency": 16, "target_latency": 30.0},
+    "exa": {"rate": 5.0, "burst": 5, "max_concurrency": 10, "target_latency": 8.0},
+    "duckduckgo": {"rate": 1.0, "burst": 2, "max_concurrency": 2, "target_latency": 5.0},
+    "domain": {"rate": 2.0, "burst": 4, "max_concurrency": 4, "target_latency": 30.0},
+}
+# Providers whose requests also count against the target site's limiter
+DOMAIN_LIMITED = ("firecrawl",)
+OVERLOAD_STATUSES = (429, 503)
+
+# Longest a caller waits for a permit to be returned before checking again
+_RELEASE_WAIT = 1.0
+
+
+def _setting(name: str, field: str):
+    default = DEFAULT_LIMITS.get(name, DEFAULT_LIMITS["domain"])[field]
+    value = os.getenv(f"GOVERNOR_{name.upper()}_{field.upper()}")
+    return type(default)(value) if value else default
+
+
+class Limiter:
+    def __init__(self, name: str, rate: float, burst: int, max_concurrency: int, target_latency: float):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.limit = float(max_concurrency)
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.blocked_until = 0.0
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        # Callbacks of callers waiting for a permit to be returned
+        self._waiters = []
+        self._counters = {"granted": 0, "throttled": 0, "overloads": 0, "errors": 0, "slow": 0}
+
+    def _try_acquire(self, wake=None) -> float:
+        """
+        Take a permit and return 0, or return how long to wait before trying
+        again. When the concurrency limit is full, `wake` is called as soon as
+        a permit is returned.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if now < self.blocked_until:
+                self._counters["throttled"] += 1
+                return self.blocked_until - now
+            if self.in_flight >= int(self.limit):
+                if wake is not None:
+                    self._waiters.append(wake)
+                return _RELEASE_WAIT
+            if self.tokens < 1:
+                self._counters["throttled"] += 1
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+            self.in_flight += 1
+            self._counters["granted"] += 1
+            return 0.0
+
+    def _give_back(self) -> None:
+        """Undo a _try_acquire that was granted (another limiter refused the same call)."""
+        with self._lock:
+            self.in_flight -= 1
+            self.tokens = min(self.burst, self.tokens + 1)
+            self._counters["granted"] -= 1
+            waiters, self._waiters = self._waiters, []
+        _wake_all(waiters)
+
+    def release(self, latency: float, status: int = None, retry_after: float = None,
+                timed_out: bool = False, failed: bool = False, cancelled: bool = False) -> None:
+        """
+        Return a permit and adapt the concurrency limit to how the call went.
+        `failed`: the call raised before any response; `cancelled`: the caller gave up (no signal either way).
+        """
+        with self._lock:
+            self.in_flight -= 1
+            waiters, self._waiters = self._waiters, []
+            self._adapt(latency, status, retry_after, timed_out, failed, cancelled)
+        _wake_all(waiters)
+
+    def _adapt(self, latency, status, retry_after, timed_out, failed, cancelled) -> None:
+        """AIMD update of the concurrency limit for one finished call (lock held)."""
+        if cancelled:
+            return
+        if timed_out or failed or status in OVERLOAD_STATUSES:
+            self.limit = max(1.0, self.limit / 2)
+            self._counters["errors" if failed else "overloads"] += 1
+            if status in OVERLOAD_STATUSES:
+                wait = min(retry_after if retry_after is not None else GOVERNOR_DEFAULT_BACKOFF, GOVERNOR_MAX_RETRY_AFTER)
+                self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        elif latency > self.target_latency:
+            self.limit = max(1.0, self.limit * 0.9)
+            self._counters["slow"] += 1
+        elif status is None or status < 400:
+            self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+
+    def idle(self) -> bool:
+        """No call in flight, nobody waiting and no Retry-After block: dropping it loses nothing that matters."""
+        with self._lock:
+            return not self.in_flight and not self._waiters and time.monotonic() >= self.blocked_until
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "concurrency_limit": round(self.limit, 2),
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "tokens": round(self.tokens, 2),
+                "blocked_for": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+                **self._counters,
+            }
+
+
+def _wake_all(waiters: list) -> None:
+    for wake in waiters:
+        wake()
+
+
+_limiters = {}
+# Per-domain limiters, least recently used first
+_domain_limiters = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def _new_limiter(name: str) -> Limiter:
+    settings = name.split(":", 1)[0] if name.startswith("domain:") else name
+    return Limiter(
+        name,
+        rate=_setting(settings, "rate"),
+        burst=_setting(settings, "burst"),
+        max_concurrency=_setting(settings, "max_concurrency"),
+        target_latency=_setting(settings, "target_latency"),
+    )
+
+
+def _drop_idle_domains() -> None:
+    """Drop least recently used idle domain limiters beyond GOVERNOR_MAX_DOMAINS (registry lock held)."""
+    excess = len(_domain_limiters) - GOVERNOR_MAX_DOMAINS
+    if excess <= 0:
+        return
+    idle = []
+    for name, limiter in _domain_limiters.items():
+        if len(idle) == excess:
+            break
+        if limiter.idle():
+            idle.append(name)
+    for name in idle:
+        del _domain_limiters[name]
+
+
+def get_limiter(name: str) -> Limiter:
+    if name.startswith("domain:"):
+        with _registry_lock:
+            limiter = _domain_limiters.get(name)
+            if limiter is None:
+                limiter = _domain_limiters[name] = _new_limiter(name)
+                _drop_idle_domains()
+            else:
+                _domain_limiters.move_to_end(name)
+        return limiter
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = _limiters[name] = _new_limiter(name)
+    return limiter
+
+
+def _domain(url) -> str:
+    try:
+        host = (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def limiters_for(provider: str, target_url: str = None) -> list:
+    limiters = [get_limiter(provider)]
+    domain = _domain(target_url) if target_url and provider in DOMAIN_LIMITED else ""
+    if domain:
+        limiters.append(get_limiter(f"domain:{domain}"))
+    return limiters
+
+
+class Permit:
+    """Permits held on one or more limiters for a single upstream call."""
+
+    def __init__(self, limiters: list):
+        self.limiters = limiters
+        self.started = time.monotonic()
+        self.status = None
+        self.retry_after = None
+
+    def record(self, status: int, retry_after: float = None) -> None:
+        self.status = status
+        self.retry_after = retry_after
+
+    def _release(self, error: BaseException = None) -> None:
+        latency = time.monotonic() - self.started
+        timed_out = error is not None and _is_timeout(error)
+        # A recorded status (e.g. raise_for_status after a 404) says more than the exception
+        cancelled = isinstance(error, (asyncio.CancelledError, GeneratorExit)) and self.status is None
+        failed = error is not None and self.status is None and not (timed_out or cancelled)
+        for limiter in self.limiters:
+            limiter.release(latency, self.status, self.retry_after, timed_out, failed, cancelled)
+
+
+def _wait_time(limiters: list, acquired: list, wake=None) -> float:
+    """Acquire every limiter in order; on the first refusal give the others back and return the wait."""
+    for limiter in limiters:
+        wait = limiter._try_acquire(wake)
+        if wait:
+            for held in acquired:
+                held._give_back()
+            acquired.clear()
+            return wait
+        acquired.append(limiter)
+    return 0.0
+
+
+def _is_timeout(exc: BaseException) -> bool:
+    return isinstance(exc, (httpx.TimeoutException, asyncio.TimeoutError, TimeoutError))
+
+
+def _async_waiter():
+    """A future on the running loop and a thread-safe callback that completes it."""
+    loop = asyncio.get_running_loop()
+    woken = loop.create_future()
+
+    def _set():
+        if not woken.done():
+            woken.set_result(None)
+
+    def wake():
+        try:
+            loop.call_soon_threadsafe(_set)
+        except RuntimeError:
+            pass  # the loop has closed
+
+    return woken, wake
+
+
+@asynccontextmanager
+async def apermit(provider: str, target_url: str = None):
+    """Wait for a permit (async). Call permit.record(status, retry_after) once the response is in."""
+    limiters = limiters_for(provider, target_url) if GOVERNOR_ENABLED else []
+    acquired = []
+    while True:
+        woken, wake = _async_waiter()
+        wait = _wait_time(limiters, acquired, wake)
+        if not wait:
+            break
+        await asyncio.wait({woken}, timeout=wait)
+    permit = Permit(limiters)
+    try:
+        yield permit
+    except BaseException as e:
+        permit._release(e)
+        raise
+    permit._release()
+
+
+@contextmanager
+def permit(provider: str, target_url: str = None):
+    """apermit for blocking callers (worker threads)."""
+    limiters = limiters_for(provider, target_url) if GOVERNOR_ENABLED else []
+    acquired = []
+    while True:
+        woken = threading.Event()
+        wait = _wait_time(limiters, acquired, woken.set)
+        if not wait:
+            break
+        woken.wait(wait)
+    held = Permit(limiters)
+    try:
+        yield held
+    except BaseException as e:
+        held._release(e)
+        raise
+    held._release()
+
+
+def parse_retry_after(value) -> float:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _target_url(request: httpx.Request):
+    """The page a request is about (Firecrawl scrape bodies carry it as "url")."""
+    if b'"url"' not in request.content:
+        return None
+    try:
+        return json.loads(request.content).get("url")
+    except (ValueError, AttributeError):
+        return None
+
+
+class GovernedAsyncTransport(httpx.AsyncBaseTransport):
+    """Wraps an httpx transport so every request takes a permit for `provider`."""
+
+    def __init__(self, provider: str, transport: httpx.AsyncBaseTransport):
+        self.provider = provider
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        target = _target_url(request)
+        for attempt in range(GOVERNOR_MAX_RETRIES + 1):
+            async with apermit(self.provider, target) as held:
+                response = await self.transport.handle_async_request(request)
+                held.record(response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+            if response.status_code not in OVERLOAD_STATUSES or attempt == GOVERNOR_MAX_RETRIES:
+                return response
+            logger.warning(f"{self.provider} answered {response.status_code} for {request.url.path}, retrying")
+            await response.aclose()
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class GovernedTransport(httpx.BaseTransport):
+    """Sync counterpart of GovernedAsyncTransport."""
+
+    def __init__(self, provider: str, transport: httpx.BaseTransport):
+        self.provider = provider
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        target = _target_url(request)
+        for attempt in range(GOVERNOR_MAX_RETRIES + 1):
+            with permit(self.provider, target) as held:
+                response = self.transport.handle_request(request)
+                held.record(response.status_code, parse_retry_after(response.headers.get("Retry-After")))
+            if response.status_code not in OVERLOAD_STATUSES or attempt == GOVERNOR_MAX_RETRIES:
+                return response
+            logger.warning(f"{self.provider} answered {response.status_code} for {request.url.path}, retrying")
+            response.close()
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+def stats() -> dict:
+    """Current limits and counters for every limiter created so far."""
+    with _registry_lock:
+        limiters = list(_limiters.values()) + list(_domain_limiters.values())
+    return {"enabled": GOVERNOR_ENABLED, "limiters": {limiter.name: limiter.stats() for limiter in limiters}}
@@ -0,0 +1,125 @@
+"""
+Shared, pooled HTTP clients for the upstream APIs (Exa, Firecrawl).
+
+Every call site goes through get_async_client()/get_client() instead of
+opening its own connection, so keep-alive connections (and HTTP/2 when `h2`
+is installed) are reused across requests. Each client's transport is wrapped
+by a circuit breaker and the governor, so every request fails fast while its
+upstream is down and is rate limited per provider (and per target site for
+scrapes) otherwise. The async clients are opened and
+closed by the FastAPI lifespan in main.py; the sync clients are used by the
+blocking CrewAI tools, which run in worker threads.
+"""
+import os
+import logging
+import threading
+import httpx
+from governor import GovernedAsyncTransport, GovernedTransport
+from breaker import BreakerAsyncTransport, BreakerTransport
+
+logger = logging.getLogger("http_clients")
+
+# --- Pool settings (tunable via env) ---
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Base URL and default read timeout (seconds) per upstream
+UPSTREAMS = {
+    "exa": {
+        "base_url": os.getenv("EXA_BASE_URL", "https://api.exa.ai"),
+        "timeout": float(os.getenv("EXA_TIMEOUT", "30")),
+    },
+    "firecrawl": {
+        "base_url": os.getenv("FIRECRAWL_BASE_URL", "https://api.firecrawl.dev"),
+        "timeout": float(os.getenv("FIRECRAWL_TIMEOUT", "75")),
+    },
+}
+
+_async_clients = {}
+_sync_clients = {}
+_sync_lock = threading.Lock()
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _client_kwargs(upstream: str) -> dict:
+    if upstream not in UPSTREAMS:
+        raise KeyError(f"Unknown upstream: {upstream}")
+    config = UPSTREAMS[upstream]
+    return {
+        "base_url": config["base_url"],
+        "http2": _http2_available(),
+        "limits": httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(config["timeout"], connect=HTTP_CONNECT_TIMEOUT),
+    }
+
+
+def _governed_kwargs(upstream: str, asynchronous: bool) -> dict:
+    """Client kwargs with the connection pool moved into a breaker + governor transport."""
+    kwargs = _client_kwargs(upstream)
+    http2, limits = kwargs.pop("http2", False), kwargs.pop("limits", None)
+    transport = kwargs.pop("transport", None)
+    if asynchronous:
+        transport = transport or httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+        kwargs["transport"] = BreakerAsyncTransport(upstream, GovernedAsyncTransport(upstream, transport))
+    else:
+        transport = transport or httpx.HTTPTransport(http2=http2, limits=limits)
+        kwargs["transport"] = BreakerTransport(upstream, GovernedTransport(upstream, transport))
+    return kwargs
+
+
+def get_async_client(upstream: str) -> httpx.AsyncClient:
+    """Return the pooled AsyncClient for an upstream, creating it on first use."""
+    client = _async_clients.get(upstream)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(**_governed_kwargs(upstream, asynchronous=True))
+        _async_clients[upstream] = client
+    return client
+
+
+def get_client(upstream: str) -> httpx.Client:
+    """Return the pooled (thread-safe) sync Client for an upstream."""
+    client = _sync_clients.get(upstream)
+    if client is None or client.is_closed:
+        with _sync_lock:
+            client = _sync_clients.get(upstream)
+            if client is None or client.is_closed:
+                client = httpx.Client(**_governed_kwargs(upstream, asynchronous=False))
+                _sync_clients[upstream] = client
+    return client
+
+
+async def startup():
+    """Open the async pools up front (called from the app lifespan)."""
+    for upstream in UPSTREAMS:
+        get_async_client(upstream)
+    logger.info(
+        f"HTTP client pools ready for {list(UPSTREAMS)} "
+        f"(max_connections={HTTP_MAX_CONNECTIONS}, keepalive={HTTP_MAX_KEEPALIVE}, http2={_http2_available()})"
+    )
+
+
+async def shutdown():
+    """Close every pooled client (called from the app lifespan)."""
+    for client in list(_async_clients.values()):
+        await client.aclose()
+    _async_clients.clear()
+    with _sync_lock:
+        for client in list(_sync_clients.values()):
+            client.close()
+        _sync_clients.clear()
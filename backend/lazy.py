@@ -0,0 +1,96 @@
+"""
+Deferred loading of heavy dependencies.
+
+CrewAI (and the agent modules built on it), exa_py and duckduckgo_search
+take seconds to import, and most requests never need them (/api/product
+served from the scrape cache, /api/price-history, /api/stats). Instead of
+importing them at module load, callers register a factory under a name and
+get() it on first use (aget() from coroutines):
+
+    register("price_comparator", "crewai_price_comparator:PriceComparatorCrew")
+    PriceComparatorCrew = await aget("price_comparator")
+
+A factory is a callable or a "module:attribute" string. Each one runs once
+(thread-safe); stats() reports how long every loaded entry took. warm_up()
+loads everything registered so far, for the optional warm-up in the app
+lifespan (WARM_UP).
+"""
+import os
+import time
+import asyncio
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger("lazy")
+
+# none: load on first use; background: load after start-up without delaying it; blocking: load before serving
+WARM_UP = os.getenv("WARM_UP", "none").lower()
+
+_factories = {}
+_loaded = {}
+_load_ms = {}
+_locks = {}  # name -> lock held while that entry loads, so one slow import does not block the others
+_lock = threading.Lock()
+
+
+def _import(path: str):
+    module, _, attribute = path.partition(":")
+    loaded = importlib.import_module(module)
+    return getattr(loaded, attribute) if attribute else loaded
+
+
+def register(name: str, factory) -> None:
+    """Register a callable (or "module:attribute" path) that builds `name` on first get()."""
+    with _lock:
+        _factories.setdefault(name, factory)
+        _locks.setdefault(name, threading.RLock())
+
+
+def get(name: str):
+    """The object registered as `name`, built on the first call."""
+    try:
+        return _loaded[name]
+    except KeyError:
+        pass
+    with _locks[name]:
+        if name not in _loaded:
+            factory = _factories[name]
+            started = time.perf_counter()
+            _loaded[name] = _import(factory) if isinstance(factory, str) else factory()
+            _load_ms[name] = (time.perf_counter() - started) * 1000
+            logger.info(f"Loaded {name} in {_load_ms[name]:.0f}ms")
+    return _loaded[name]
+
+
+async def aget(name: str):
+    """get() for coroutines: a first load runs in a worker thread instead of blocking the event loop."""
+    if name in _loaded:
+        return _loaded[name]
+    return await asyncio.to_thread(get, name)
+
+
+def warm_up() -> None:
+    """Load every registered entry, including ones registered by the modules loaded here; never raises."""
+    attempted = set()
+    while True:
+        with _lock:
+            pending = [name for name in _factories if name not in attempted]
+        if not pending:
+            return
+        for name in pending:
+            attempted.add(name)
+            try:
+                get(name)
+            except Exception:
+                logger.exception(f"Warm-up of {name} failed")
+
+
+def stats() -> dict:
+    with _lock:
+        names = list(_factories)
+    return {
+        "warm_up": WARM_UP,
+        "loaded": {name: round(_load_ms[name], 1) for name in names if name in _load_ms},
+        "pending": [name for name in names if name not in _loaded],
+    }
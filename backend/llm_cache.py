@@ -0,0 +1,146 @@
+"""
+Content-addressed cache for CrewAI kickoffs.
+
+The product cleaner, search-term generator and price extractor give the
+same answer for the same page, so their crew outputs are stored on disk
+(see sqlite_cache) under a SHA-256 of model + prompt + input data. The
+prompt covers every task's description and expected output plus its
+agent's role, goal and backstory, so editing a prompt or switching models
+never serves an old answer. Only successful, non-empty outputs are stored.
+
+Set LLM_CACHE_ENABLED=false to always call the LLM.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from sqlite_cache import SqliteCache
+from llm_pool import run_in_llm_pool
+
+logger = logging.getLogger("llm_cache")
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "llm_cache.sqlite3")
+)
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+
+class CachedCrewOutput:
+    """Stand-in for a CrewOutput replayed from the cache (same raw / json_dict / str surface)."""
+
+    def __init__(self, raw: str, json_dict=None):
+        self.raw = raw
+        self.json_dict = json_dict
+        self.pydantic = None
+        self.tasks_output = []
+
+    def to_dict(self) -> dict:
+        return dict(self.json_dict or {})
+
+    def __str__(self) -> str:
+        return self.raw
+
+
+class LLMCache(SqliteCache):
+    def __init__(self, path: str, ttl: float, max_entries: int, max_bytes: int):
+        super().__init__(path, max_entries=max_entries, max_bytes=max_bytes)
+        self.ttl = ttl
+
+    def get(self, key: str):
+        found = self._read(key, self.ttl)
+        self._count("hits" if found else "misses")
+        return found[0] if found else None
+
+    def put(self, key: str, value: dict) -> None:
+        self._write(key, value)
+
+
+_llm_cache = None
+_init_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide LLMCache, or None when LLM_CACHE_ENABLED is off."""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        with _init_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMCache(
+                    LLM_CACHE_PATH,
+                    ttl=LLM_CACHE_TTL,
+                    max_entries=LLM_CACHE_MAX_ENTRIES,
+                    max_bytes=LLM_CACHE_MAX_BYTES,
+                )
+                logger.info(f"LLM cache opened at {LLM_CACHE_PATH}")
+    return _llm_cache
+
+
+def _model_name(agent) -> str:
+    llm = getattr(agent, "llm", None)
+    model = getattr(llm, "model", None) or getattr(llm, "model_name", None) or (llm if isinstance(llm, str) else None)
+    return model or os.getenv("OPENAI_MODEL_NAME") or "default"
+
+
+def crew_cache_key(crew, input_data=None) -> str:
+    """SHA-256 over the crew's models, prompts and the input data it runs on."""
+    tasks = []
+    for task in crew.tasks:
+        agent = task.agent
+        tasks.append({
+            "model": _model_name(agent),
+            "role": getattr(agent, "role", None),
+            "goal": getattr(agent, "goal", None),
+            "backstory": getattr(agent, "backstory", None),
+            "description": task.description,
+            "expected_output": task.expected_output,
+        })
+    blob = json.dumps({"tasks": tasks, "input": input_data}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _lookup(crew, input_data):
+    cache = get_llm_cache()
+    if cache is None:
+        return None, None
+    key = crew_cache_key(crew, input_data)
+    hit = cache.get(key)
+    if hit is not None:
+        logger.info(f"LLM cache hit {key[:12]}")
+        return key, CachedCrewOutput(hit["raw"], hit.get("json_dict"))
+    return key, None
+
+
+def _store(key, result) -> None:
+    if key is None or result is None:
+        return
+    raw = result if isinstance(result, str) else getattr(result, "raw", None)
+    if not raw:
+        return
+    json_dict = getattr(result, "json_dict", None)
+    get_llm_cache().put(key, {"raw": raw, "json_dict": json_dict if isinstance(json_dict, dict) else None})
+
+
+def cached_kickoff(crew, input_data=None):
+    """crew.kickoff(), answered from the LLM cache when the same crew already ran on the same input."""
+    key, hit = _lookup(crew, input_data)
+    if hit is not None:
+        return hit
+    result = crew.kickoff()
+    _store(key, result)
+    return result
+
+
+async def acached_kickoff(crew, input_data=None):
+    """cached_kickoff for async callers: cache hits skip the LLM pool entirely."""
+    key, hit = _lookup(crew, input_data)
+    if hit is not None:
+        return hit
+    result = await run_in_llm_pool(crew.kickoff)
+    _store(key, result)
+    return result
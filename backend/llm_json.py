@@ -0,0 +1,193 @@
+"""
+Tolerant JSON extraction for LLM and CrewAI outputs.
+
+Agents wrap JSON in markdown fences and prose, double-encode it, or leave
+small defects behind. extract_json() first tries the C decoder at the first
+bracket; when that fails it finds the first valid object or array in one
+forward scan: a single regex walks the structural characters (quotes,
+backslashes, brackets, commas), keeps a bracket stack, and records repairs
+on the way, so each balanced span is decoded once. Repaired defects:
+  - markdown fences and surrounding prose (skipped by the scan),
+  - trailing commas before "}" / "]",
+  - stray quotes after a closing bracket ({"offers": []"}),
+  - double-encoded JSON ("{\\"offers\\": []}"),
+  - raw control characters inside strings.
+
+parse_llm_json() accepts whatever a crew returned (CrewOutput, cached
+output, dict, list or str) and returns the parsed JSON or None.
+"""
+import re
+import json
+import logging
+from bisect import bisect_left
+import metrics
+
+logger = logging.getLogger("llm_json")
+
+_TOKEN_RE = re.compile(r'["\\{}\[\],]')
+_CLOSERS = {"}": "{", "]": "["}
+_decoder = json.JSONDecoder(strict=False)
+
+
+def _strip_fence(text: str) -> str:
+    if text.startswith("```"):
+        newline = text.find("\n")
+        text = text[newline + 1:] if newline != -1 else text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    return text.strip()
+
+
+def _first_open(text: str) -> int:
+    brace, bracket = text.find("{"), text.find("[")
+    return brace if bracket == -1 or (brace != -1 and brace < bracket) else bracket
+
+
+def _is_blank(text: str, start: int, end: int) -> bool:
+    return start >= end or text[start:end].isspace()
+
+
+def _decode(text: str, start: int, end: int, drops: list, expect):
+    """Decode text[start:end] without the characters at `drops`; the value if it has type `expect`, else None."""
+    lo, hi = bisect_left(drops, start), bisect_left(drops, end)
+    if lo == hi:
+        span = text[start:end]
+    else:
+        parts, pos = [], start
+        for drop in drops[lo:hi]:
+            parts.append(text[pos:drop])
+            pos = drop + 1
+        parts.append(text[pos:end])
+        span = "".join(parts)
+    try:
+        value = _decoder.decode(span)
+    except ValueError:
+        return None
+    return value if expect is None or isinstance(value, expect) else None
+
+
+def _scan(text: str, expect):
+    """First valid JSON object/array in `text` (see module docstring), or None."""
+    stack = []  # positions of open brackets
+    children = []  # spans closed directly inside the outermost open bracket
+    drops = []  # positions of characters removed by repairs (stray quotes, trailing commas)
+    last_comma = -1
+    prev_close = -1  # position of the last closing bracket or string quote outside a string
+    in_string = False
+    escaped_at = -1
+    for match in _TOKEN_RE.finditer(text):
+        pos = match.start()
+        char = text[pos]
+        if in_string:
+            if char == "\\" and escaped_at != pos:
+                escaped_at = pos + 1
+            elif char == '"' and escaped_at != pos:
+                in_string = False
+                prev_close = pos
+            continue
+        if not stack:
+            if char in "{[":
+                stack.append(pos)
+                children, last_comma, prev_close = [], -1, -1
+            continue
+        if char == '"':
+            # A quote right after a closing bracket and right before another one (or the end) is a stray
+            if prev_close != -1 and _is_blank(text, prev_close + 1, pos) and text[prev_close] in "}]":
+                rest = text[pos + 1:pos + 64].lstrip()
+                if not rest or rest[0] in "}]":
+                    drops.append(pos)
+                    continue
+            in_string = True
+        elif char == ",":
+            last_comma = pos
+        elif char in "{[":
+            stack.append(pos)
+        else:  # closer
+            if text[stack[-1]] != _CLOSERS[char]:
+                continue  # mismatched closer: ignore it
+            if last_comma > stack[-1] and _is_blank(text, last_comma + 1, pos):
+                drops.append(last_comma)
+            start = stack.pop()
+            prev_close = pos
+            if len(stack) == 1:
+                children.append((start, pos + 1))
+            elif not stack:
+                value = _decode(text, start, pos + 1, drops, expect)
+                if value is not None:
+                    return value
+                # The outermost span is broken; its first-level children may still be valid
+                for child_start, child_end in children:
+                    value = _decode(text, child_start, child_end, drops, expect)
+                    if value is not None:
+                        return value
+    # Unbalanced to the end (a stray "{" in prose, truncated output): try what did close inside it
+    for child_start, child_end in children:
+        value = _decode(text, child_start, child_end, drops, expect)
+        if value is not None:
+            return value
+    return None
+
+
+def extract_json(text: str, expect=(dict, list)):
+    """
+    First valid JSON value of type `expect` (default: object or array) in
+    `text`, repairing the defects listed in the module docstring; None if
+    there is none.
+    """
+    if not text:
+        return None
+    text = _strip_fence(text.strip())
+    if text.startswith('"'):
+        # Double-encoded: the whole payload is one JSON string
+        try:
+            inner = _decoder.decode(text)
+        except ValueError:
+            inner = None
+        if isinstance(inner, str):
+            return extract_json(inner, expect)
+    # Fast path: a well-formed value at the first bracket decodes in C, ignoring whatever follows it
+    start = _first_open(text)
+    if start == -1:
+        return None
+    try:
+        value = _decoder.raw_decode(text, start)[0]
+    except ValueError:
+        value = None
+    if value is not None and isinstance(value, expect):
+        return value
+    return _scan(text, expect)
+
+
+def parse_llm_json(result, expect=(dict, list)):
+    """
+    JSON from a crew result: CrewOutput / CachedCrewOutput (json_dict,
+    pydantic, raw), a dict or list, or a string. None if nothing usable.
+    """
+    if result is None:
+        return None
+    if isinstance(result, (dict, list)):
+        return result if isinstance(result, expect) else None
+    with metrics.stage("llm_json_parse") as timer:
+        if isinstance(result, str):
+            value = extract_json(result, expect)
+        else:
+            value = _structured(result, expect)
+            if value is None and isinstance(getattr(result, "raw", None), str):
+                value = extract_json(result.raw, expect)
+        if value is None:
+            timer.fail("no_json")
+            logger.warning(f"No JSON found in LLM output: {str(result)[:200]}")
+    return value
+
+
+def _structured(result, expect):
+    """A CrewOutput's already-parsed json_dict / pydantic output, if it has the right type."""
+    json_dict = getattr(result, "json_dict", None)
+    if json_dict and isinstance(json_dict, expect):
+        return json_dict
+    pydantic = getattr(result, "pydantic", None)
+    if pydantic is not None and hasattr(pydantic, "model_dump"):
+        value = pydantic.model_dump()
+        if isinstance(value, expect):
+            return value
+    return None
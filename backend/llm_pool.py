@@ -0,0 +1,83 @@
+"""
+Bounded worker pool for blocking CrewAI kickoffs.
+
+crew.kickoff() is a synchronous LLM round-trip that can take many seconds.
+Async code awaits run_in_llm_pool(crew.kickoff) instead, so the event loop
+stays free and at most LLM_WORKERS kickoffs run at once; the rest wait in
+the pool's queue. stats() reports the current queue depth for /api/stats.
+
+Cancelling the awaiting task only removes a job that is still queued. A
+kickoff that has already started runs to completion in its thread (CrewAI
+cannot be interrupted) and holds its worker until then.
+"""
+import os
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+
+logger = logging.getLogger("llm_pool")
+
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm-worker")
+_lock = threading.Lock()
+_counters = {"queued": 0, "active": 0, "completed": 0, "failed": 0}
+
+
+def _on_done(future):
+    # Jobs cancelled while still queued never reach _call, so release them here
+    if future.cancelled():
+        with _lock:
+            _counters["queued"] -= 1
+
+
+def _stage_name(fn) -> str:
+    """Metrics stage of a pool job: "crew_kickoff:<first agent's role>" for crew.kickoff, else the function name."""
+    tasks = getattr(getattr(fn, "__self__", None), "tasks", None)
+    agent = getattr(tasks[0], "agent", None) if tasks else None
+    if agent is not None:
+        return f"crew_kickoff:{agent.role}"
+    return f"llm:{getattr(fn, '__name__', 'call')}"
+
+
+async def run_in_llm_pool(fn, *args, **kwargs):
+    """Run a blocking LLM call (e.g. crew.kickoff) in the LLM pool and await its result."""
+    submitted = time.perf_counter()
+
+    def _call():
+        metrics.observe("llm_pool_wait", time.perf_counter() - submitted)
+        with _lock:
+            _counters["queued"] -= 1
+            _counters["active"] += 1
+        try:
+            with metrics.stage(_stage_name(fn)):
+                result = fn(*args, **kwargs)
+        except Exception:
+            with _lock:
+                _counters["failed"] += 1
+            raise
+        else:
+            with _lock:
+                _counters["completed"] += 1
+            return result
+        finally:
+            with _lock:
+                _counters["active"] -= 1
+
+    with _lock:
+        _counters["queued"] += 1
+        queued = _counters["queued"]
+    if queued > LLM_WORKERS:
+        logger.warning(f"LLM pool saturated: {queued} jobs waiting for {LLM_WORKERS} workers")
+    future = _executor.submit(_call)
+    future.add_done_callback(_on_done)
+    return await asyncio.wrap_future(future)
+
+
+def stats() -> dict:
+    """Current pool size, queue depth and totals."""
+    with _lock:
+        return {"workers": LLM_WORKERS, **_counters}
@@ -1,31 +1,79 @@
 import os
 import logging
 import json
-from typing import Optional
-from fastapi import FastAPI, HTTPException
+import re
+import time
+import asyncio
+import httpx
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-import httpx
 from dotenv import load_dotenv
 
-# Import CrewAI tools
-from crewai_product_cleaner import run_product_cleaner
-from crewai_price_comparator import PriceComparatorCrew
-
-
-from extraction_utils import fetch_firecrawl_contents, extract_price_with_regex
+from extraction_utils import (
+    afetch_exa_contents, afetch_firecrawl_contents, fetch_firecrawl_contents_many, iter_firecrawl_contents,
+)
+from price_parser import parse_price
+from projections import firecrawl_scrape_body
+from near_duplicates import collapse_near_duplicates
+from llm_json import parse_llm_json
+import http_clients
+import llm_pool
+import governor
+import breaker
+from breaker import CircuitOpenError
+from llm_pool import run_in_llm_pool
+from scrape_cache import get_scrape_cache
+from llm_cache import get_llm_cache
+from exa_cache import acached_request, get_exa_cache
+from price_history import get_price_history
+from product_index import PRODUCT_INDEX_MODE, PRODUCT_INDEX_PREFER_COUNT, get_product_index, index_product
+import singleflight
+import lazy
+import prompt_compaction
+import metrics
+from singleflight import SingleFlight
+from url_utils import canonicalize_url, url_problem
+from deadline import DEADLINE_HEADER, Deadline, DeadlineExceeded, use_deadline, within_deadline
+from product_extractor import extract_product_fields, is_complete, attach_json_ld
 
 load_dotenv()
 
+# CrewAI and the agent modules take seconds to import; load them on first use (or via WARM_UP)
+lazy.register("product_cleaner", "crewai_product_cleaner:run_product_cleaner")
+lazy.register("price_comparator", "crewai_price_comparator:PriceComparatorCrew")
+
 # --- Logging Setup ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # --- Globals & Config ---
 FIRECRAWL_API_KEY = os.getenv("FIRECRAWL_API_KEY")
-FIRECRAWL_API_URL = "https://api.firecrawl.dev/v1/scrape"
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_URLS = int(os.getenv("BATCH_MAX_URLS", "500"))
+# /api/price-history defaults and limits
+PRICE_HISTORY_DEFAULT_DAYS = int(os.getenv("PRICE_HISTORY_DEFAULT_DAYS", "365"))
+PRICE_HISTORY_MAX_URLS = int(os.getenv("PRICE_HISTORY_MAX_URLS", "10000"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared upstream connection pools live as long as the app
+    await http_clients.startup()
+    # Loading the persisted product index reads every row; do it before serving, off the event loop
+    await asyncio.to_thread(get_product_index)
+    # Optionally import the agent stack up front so the first LLM request does not pay for it
+    if lazy.WARM_UP == "blocking":
+        await asyncio.to_thread(lazy.warm_up)
+    elif lazy.WARM_UP == "background":
+        app.state.warm_up = asyncio.create_task(asyncio.to_thread(lazy.warm_up))
+    yield
+    await http_clients.shutdown()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # --- Middleware ---
 app.add_middleware(
@@ -36,10 +84,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """API latency by route template (so /api/price-history?url=... is one series); streams are timed to their first byte."""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        if metrics.METRICS_ENABLED:
+            route = request.scope.get("route")
+            metrics.HTTP_SECONDS.observe(
+                time.perf_counter() - started, request.method, getattr(route, "path", "unmatched"), str(status)
+            )
+
 # --- Pydantic Models ---
 class ProductRequest(BaseModel):
     url: str
 
+class BatchProductRequest(BaseModel):
+    urls: List[str]
+    concurrency: Optional[int] = None
+
 class Product(BaseModel):
     title: str
     price: Optional[float] = None
@@ -60,45 +128,12 @@ def parse_similar_products_result(result, fallback_url=None):
     Always returns {"similar_products": [ ... ]} with at least title and url per product.
     Extra fields are passed through. Defaults are used if missing.
     """
-    import re
-    # 1. Handle string result (possibly with code block markers)
-    if isinstance(result, str):
-        cleaned = result.strip()
-        cleaned = re.sub(r'^```[a-zA-Z]*\n?', '', cleaned)
-        cleaned = re.sub(r'```$', '', cleaned)
-        try:
-            result = json.loads(cleaned)
-            if isinstance(result, str):
-                result = json.loads(result)
-        except Exception:
-            logger.error(f"Failed to parse agent result as JSON: {cleaned}")
-            return {"similar_products": []}
-    # 2. CrewOutput with .json_dict or .raw
-    if hasattr(result, "json_dict") and result.json_dict:
-        result = result.json_dict
-    elif hasattr(result, "raw") and result.raw:
-        raw = result.raw.strip()
-        # Fix common LLM JSON bugs
-        if raw.endswith(']"}'):
-            raw = raw[:-3] + ']}'
-        elif raw.endswith('"}'):
-            raw = raw[:-2] + '}'
-        elif raw.endswith(']"'):
-            raw = raw[:-2] + ']'
-        elif raw.endswith('"') and raw.count('"') > raw.count(':'):
-            raw = raw[:-1]
-        try:
-            result = json.loads(raw)
-        except Exception:
-            logger.error(f"Failed to parse CrewOutput.raw as JSON: {raw}")
-            return {"similar_products": []}
-    elif hasattr(result, "dict"):
-        result = result.dict()
-    elif hasattr(result, "to_dict"):
-        result = result.to_dict()
-    elif hasattr(result, "output"):
-        result = result.output
-    # 3. Try to find a list of products
+    # 1. Parse string / CrewOutput results (fences, prose and common LLM JSON defects are handled)
+    result = parse_llm_json(result)
+    if result is None:
+        logger.error("Failed to parse agent result as JSON")
+        return {"similar_products": []}
+    # 2. Try to find a list of products
     products = []
     if isinstance(result, dict):
         if "similar_products" in result and isinstance(result["similar_products"], list):
@@ -111,7 +146,7 @@ def parse_similar_products_result(result, fallback_url=None):
                     break
     elif isinstance(result, list):
         products = result
-    # 4. Validate and normalize each product
+    # 3. Validate and normalize each product
     normalized = []
     for i, prod in enumerate(products):
         # Accept dicts only
@@ -134,70 +169,324 @@ def parse_similar_products_result(result, fallback_url=None):
     logger.info(f"Returning {len(normalized)} valid similar products to UI.")
     return {"similar_products": normalized}
 
+# Concurrent requests for the same page share one upstream call
+exa_flight = SingleFlight("exa_find_similar")
+scrape_flight = SingleFlight("firecrawl_scrape")
+
+async def exa_find_similar(url: str, num_results: int = 10):
+    """Call Exa's findSimilar endpoint (through the Exa cache) and return the response JSON."""
+    EXA_API_KEY = os.getenv("EXA_API_KEY")
+    headers = {"Authorization": f"Bearer {EXA_API_KEY}", "Content-Type": "application/json"}
+    payload = {
+        "url": url,
+        "numResults": num_results
+    }
+
+    async def fetch():
+        exa_client = http_clients.get_async_client("exa")
+        async with metrics.stage("exa_find_similar") as timer:
+            try:
+                exa_resp = await exa_client.post("/v1/findSimilar", json=payload, headers=headers, timeout=30)
+            except CircuitOpenError as e:
+                timer.fail("circuit_open")
+                logger.warning(f"Exa findSimilar skipped: {e}")
+                raise HTTPException(status_code=503, detail="Exa is temporarily unavailable")
+            if exa_resp.status_code != 200:
+                timer.fail(f"http_{exa_resp.status_code}")
+                logger.error(f"Exa API error: {exa_resp.status_code} {exa_resp.text}")
+                raise HTTPException(status_code=502, detail="Exa API error")
+            return exa_resp.json()
+
+    # Fresh cache hits return at once; stale ones too, with a background refresh
+    return await acached_request("findSimilar", payload, fetch)
+
+async def scrape_fallback(url: str):
+    """Firecrawl-shaped page data read through Exa contents, for when Firecrawl is down (not cached)."""
+    product_data = await afetch_exa_contents(url)
+    if not product_data:
+        raise HTTPException(status_code=502, detail="Firecrawl API error")
+    metadata = {
+        "title": product_data["title"],
+        "price": product_data["price"],
+        "currency": product_data["currency"],
+        "image": product_data["image_url"],
+        "description": product_data["product_description"],
+        "url": url,
+    }
+    return {"success": True, "data": {"metadata": metadata, "markdown": product_data["text"]}, "fallback": "exa_contents"}
+
+async def scrape_product_page(url: str):
+    """Raw Firecrawl scrape (metadata, markdown, JSON-LD) for /api/product, read through the scrape cache."""
+    cache = get_scrape_cache()
+    firecrawl_data = await asyncio.to_thread(cache.get, "firecrawl_scrape", url) if cache else None
+    if firecrawl_data is not None:
+        logger.info(f"Scrape cache hit for {url}")
+        return firecrawl_data
+    headers = {"Authorization": f"Bearer {FIRECRAWL_API_KEY}"}
+    # rawHtml is only needed for its JSON-LD blocks; attach_json_ld drops the rest
+    payload = firecrawl_scrape_body(url, ["markdown", "rawHtml"])
+    firecrawl_client = http_clients.get_async_client("firecrawl")
+    async with metrics.stage("firecrawl_scrape") as timer:
+        try:
+            resp = await firecrawl_client.post("/v1/scrape", json=payload, headers=headers, timeout=20)
+        except CircuitOpenError as e:
+            timer.fail("circuit_open")
+            logger.warning(f"{e}; reading {url} through Exa contents")
+            resp = None
+        except httpx.HTTPError as e:
+            timer.fail(type(e).__name__)
+            logger.warning(f"Firecrawl scrape failed for {url} ({e!r}); reading it through Exa contents")
+            resp = None
+        if resp is not None and resp.status_code != 200:
+            timer.fail(f"http_{resp.status_code}")
+    if resp is None:
+        return await scrape_fallback(url)
+    if resp.status_code == 429 or resp.status_code >= 500:
+        logger.warning(f"Firecrawl scrape of {url} returned HTTP {resp.status_code}; reading it through Exa contents")
+        return await scrape_fallback(url)
+    if resp.status_code != 200:
+        logger.warning(f"Firecrawl scrape of {url} returned HTTP {resp.status_code}")
+        raise HTTPException(status_code=502, detail="Firecrawl API error")
+    firecrawl_data = attach_json_ld(resp.json())
+    if cache:
+        await asyncio.to_thread(cache.put, "firecrawl_scrape", url, firecrawl_data)
+    return firecrawl_data
+
+# Page fields that stay valid for SCRAPE_CACHE_TTL, long after the cached price has expired
+LONG_LIVED_FIELDS = ("title", "image_url", "site_name", "description")
+
+async def fill_from_earlier_scrape(url: str, fields: dict) -> dict:
+    """Fill title/image/site/description missing from a fresh scrape (e.g. the Exa fallback) from a cached one."""
+    if all(fields.get(field) not in (None, "") for field in LONG_LIVED_FIELDS):
+        return fields
+    cache = get_scrape_cache()
+    earlier = (
+        await asyncio.to_thread(cache.get, "firecrawl_scrape", url, require_price=False) if cache else None
+    )
+    if earlier:
+        earlier_fields = extract_product_fields(earlier)
+        for field in LONG_LIVED_FIELDS:
+            if fields.get(field) in (None, "") and earlier_fields.get(field) not in (None, ""):
+                fields[field] = earlier_fields[field]
+    return fields
+
+async def find_local_candidates(product: Product):
+    """
+    Similar products from the local product index, as {"title", "url",
+    "score", "product"} (empty when disabled). "product" is the summary
+    stored when the page was scraped, so these candidates are not scraped again.
+    """
+    # Normally loaded by the lifespan already; otherwise load it off the event loop
+    index = await asyncio.to_thread(get_product_index)
+    if index is None:
+        return []
+    query = {"title": product.title, "description": product.description, "url": product.url}
+    hits = await asyncio.to_thread(index.similar, query)
+    logger.info(f"[Direct] Found {len(hits)} similar products in the local index.")
+    return [
+        {
+            "title": hit["title"],
+            "url": hit["url"],
+            "score": hit["score"],
+            "product": {**{k: v for k, v in hit.items() if k != "score"}, "source": "product_index"},
+        }
+        for hit in hits
+    ]
+
+async def find_similar_candidates(product: Product):
+    """
+    Candidate similar products as a list of {"title", "url"}: Exa findSimilar
+    results in Exa rank order, followed by local-index matches Exa did not
+    return. In PRODUCT_INDEX_MODE=prefer, Exa is skipped when the local index
+    alone has PRODUCT_INDEX_PREFER_COUNT good matches. Local matches carry
+    their stored product data under "product" (see find_local_candidates).
+    """
+    local = await find_local_candidates(product)
+    if PRODUCT_INDEX_MODE == "prefer" and len(local) >= PRODUCT_INDEX_PREFER_COUNT:
+        logger.info("[Direct] Using local index matches instead of Exa.")
+        return local
+    exa_data = await within_deadline(exa_flight.do(
+        f"exa_find_similar:{canonicalize_url(product.url)}", exa_find_similar, product.url
+    ))
+    similar_products = []
+    for item in exa_data.get("results", []):
+        url = item.get("url")
+        title = item.get("title")
+        if url and title:
+            similar_products.append({"title": title, "url": url})
+    logger.info(f"[Direct] Found {len(similar_products)} similar product URLs from Exa.")
+    seen = {canonicalize_url(prod["url"]) for prod in similar_products}
+    similar_products.extend(prod for prod in local if canonicalize_url(prod["url"]) not in seen)
+    return similar_products
+
+def urls_to_scrape(candidates: list) -> list:
+    """(rank, url) of the candidates that need a Firecrawl scrape (local-index matches already have their data)."""
+    return [(idx, c["url"]) for idx, c in enumerate(candidates) if "product" not in c]
+
+def enrich_similar_product(candidate: dict, firecrawl_data: dict) -> dict:
+    """Attach the Exa candidate's URL and title to its Firecrawl product data."""
+    firecrawl_data = dict(firecrawl_data)
+    firecrawl_data["source_url"] = candidate["url"]
+    firecrawl_data["original_title"] = candidate["title"]
+    return firecrawl_data
+
 @app.post("/api/similar-products")
-async def find_similar_products(product: Product):
+async def find_similar_products(product: Product, deadline_seconds: Optional[float] = Header(None, alias=DEADLINE_HEADER)):
     """
     Find similar products using Exa API and extract product data for each using Firecrawl.
-    Returns: {"similar_products": [ ... ]}
+    Returns: {"similar_products": [ ... ], "partial": bool}
+    When the request deadline runs out, the products scraped so far come back with partial=true.
     """
     logger.info(f"[Direct] Received find similar products request for: {product.title}")
+    deadline = Deadline.start(deadline_seconds)
+    with use_deadline(deadline):
+        try:
+            # 1. Call Exa API directly to get similar product URLs
+            similar_products = await find_similar_candidates(product)
+            # 2. Call Firecrawl for all URLs not in the local index concurrently (results stay in Exa rank order);
+            #    candidates are shown by title and image, so a cached scrape with an expired price still serves
+            pending = urls_to_scrape(similar_products)
+            scraped = [prod.get("product") for prod in similar_products]
+            results = await fetch_firecrawl_contents_many([url for _, url in pending], require_price=False)
+            for (idx, _), firecrawl_data in zip(pending, results):
+                scraped[idx] = firecrawl_data
+            detailed_products = []
+            for prod, firecrawl_data in zip(similar_products, scraped):
+                url = prod["url"]
+                if firecrawl_data:
+                    detailed_products.append(enrich_similar_product(prod, firecrawl_data))
+                    logger.info(f"[Direct] Firecrawl extraction success for {url}")
+                else:
+                    logger.warning(f"[Direct] Firecrawl extraction failed for {url}")
+            logger.info(f"[Direct] Extracted detailed data for {len(detailed_products)} products using Firecrawl")
+            partial = deadline.expired and len(detailed_products) < len(similar_products)
+            if partial:
+                logger.warning(f"[Direct] Deadline of {deadline.budget}s ran out, returning {len(detailed_products)} products")
+            return {"similar_products": collapse_near_duplicates(detailed_products), "partial": partial}
+        except DeadlineExceeded:
+            logger.warning(f"[Direct] Deadline of {deadline.budget}s ran out during the Exa stage")
+            return {"similar_products": [], "partial": True}
+        except Exception as e:
+            logger.exception("[Direct] Unexpected error during similar product search.")
+            raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_similar_products(product: Product, deadline: Deadline):
+    """
+    Event stream for the similar-products flow:
+      candidates  - Exa results (title + url) as soon as Exa answers
+      product     - one enriched product per finished scrape, with its Exa rank
+      failed      - a candidate whose scrape failed or timed out
+      done        - summary with every enriched product in Exa rank order,
+                    near-duplicates collapsed (partial=true when the request
+                    deadline cut scrapes short)
+      error       - the Exa stage failed; the stream ends
+    """
+    with use_deadline(deadline):
+        async for event in _similar_products_events(product, deadline):
+            yield event
+
+async def _similar_products_events(product: Product, deadline: Deadline):
+    started = time.monotonic()
     try:
-        # 1. Call Exa API directly to get similar product URLs
-        EXA_API_KEY = os.getenv("EXA_API_KEY")
-        EXA_FIND_SIMILAR_URL = "https://api.exa.ai/v1/findSimilar"
-        headers = {"Authorization": f"Bearer {EXA_API_KEY}", "Content-Type": "application/json"}
-        payload = {
-            "url": product.url,
-            "numResults": 10
-        }
-        async with httpx.AsyncClient() as client:
-            exa_resp = await client.post(EXA_FIND_SIMILAR_URL, json=payload, headers=headers, timeout=30)
-        if exa_resp.status_code != 200:
-            logger.error(f"Exa API error: {exa_resp.status_code} {exa_resp.text}")
-            raise HTTPException(status_code=502, detail="Exa API error")
-        exa_data = exa_resp.json()
-        # Parse URLs from Exa response
-        similar_products = []
-        for item in exa_data.get("results", []):
-            url = item.get("url")
-            title = item.get("title")
-            if url and title:
-                similar_products.append({"title": title, "url": url})
-        logger.info(f"[Direct] Found {len(similar_products)} similar product URLs from Exa.")
-        # 2. For each URL, call Firecrawl to extract product data
-        detailed_products = []
-        for idx, prod in enumerate(similar_products):
-            url = prod["url"]
-            logger.info(f"[Direct] ({idx+1}/{len(similar_products)}) Crawling with Firecrawl: {url}")
-            firecrawl_data = fetch_firecrawl_contents(url)
-            if firecrawl_data:
-                firecrawl_data["source_url"] = url
-                firecrawl_data["original_title"] = prod["title"]
-                detailed_products.append(firecrawl_data)
-                logger.info(f"[Direct] Firecrawl extraction success for {url}")
-            else:
-                logger.warning(f"[Direct] Firecrawl extraction failed for {url}")
-        logger.info(f"[Direct] Extracted detailed data for {len(detailed_products)} products using Firecrawl")
-        return {"similar_products": detailed_products}
+        candidates = await find_similar_candidates(product)
+    except DeadlineExceeded:
+        logger.warning(f"[Stream] Deadline of {deadline.budget}s ran out during the Exa stage")
+        yield sse_event("done", {
+            "similar_products": [], "candidates": 0, "succeeded": 0, "failed": 0, "partial": True,
+            "elapsed_ms": int((time.monotonic() - started) * 1000),
+        })
+        return
     except Exception as e:
-        logger.exception("[Direct] Unexpected error during similar product search.")
-        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
+        logger.exception("[Stream] Exa stage failed during similar product search.")
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        yield sse_event("error", {"detail": detail})
+        return
+    candidates = parse_similar_products_result({"similar_products": candidates})["similar_products"]
+    yield sse_event("candidates", {
+        "similar_products": [{k: v for k, v in c.items() if k != "product"} for c in candidates]
+    })
 
-@app.post("/api/product")
-async def get_product_data(req: ProductRequest):
-    # 1. Call Firecrawl
-    headers = {"Authorization": f"Bearer {FIRECRAWL_API_KEY}"}
-    payload = {"url": req.url}
-    async with httpx.AsyncClient() as client:
-        resp = await client.post(FIRECRAWL_API_URL, json=payload, headers=headers, timeout=20)
-    if resp.status_code != 200:
-        print("Firecrawl error:", resp.status_code, resp.text)
-        raise HTTPException(status_code=502, detail="Firecrawl API error")
-    firecrawl_data = resp.json()
+    async def finished():
+        # Local-index matches first (no scrape needed), then each scrape as it finishes
+        for idx, candidate in enumerate(candidates):
+            if "product" in candidate:
+                yield idx, candidate["product"]
+        pending = urls_to_scrape(candidates)
+        async for n, firecrawl_data in iter_firecrawl_contents([url for _, url in pending], require_price=False):
+            yield pending[n][0], firecrawl_data
+
+    ranked = {}
+    async for idx, firecrawl_data in finished():
+        candidate = candidates[idx]
+        if not firecrawl_data:
+            yield sse_event("failed", {"rank": idx, "url": candidate["url"]})
+            continue
+        normalized = parse_similar_products_result(
+            {"similar_products": [enrich_similar_product(candidate, firecrawl_data)]}, fallback_url=candidate["url"]
+        )["similar_products"]
+        if normalized:
+            ranked[idx] = normalized[0]
+            yield sse_event("product", {"rank": idx, "product": normalized[0]})
 
-    # 2. Run CrewAI agent on Firecrawl output
+    yield sse_event("done", {
+        "similar_products": collapse_near_duplicates([ranked[idx] for idx in sorted(ranked)]),
+        "candidates": len(candidates),
+        "succeeded": len(ranked),
+        "failed": len(candidates) - len(ranked),
+        "partial": deadline.expired and len(ranked) < len(candidates),
+        "elapsed_ms": int((time.monotonic() - started) * 1000),
+    })
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@app.post("/api/similar-products/stream")
+async def find_similar_products_stream(product: Product, deadline_seconds: Optional[float] = Header(None, alias=DEADLINE_HEADER)):
+    """Server-Sent Events variant of /api/similar-products (see stream_similar_products)."""
+    logger.info(f"[Stream] Received find similar products request for: {product.title}")
+    stream = stream_similar_products(product, Deadline.start(deadline_seconds))
+    return StreamingResponse(stream, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/api/similar-products/stream")
+async def find_similar_products_stream_get(url: str, title: str = "", deadline: Optional[float] = None):
+    """Same stream for EventSource clients, which can only send GET requests (deadline as a query parameter)."""
+    product = Product(title=title or url, url=url)
+    logger.info(f"[Stream] Received find similar products request for: {product.title}")
+    stream = stream_similar_products(product, Deadline.start(deadline))
+    return StreamingResponse(stream, media_type="text/event-stream", headers=SSE_HEADERS)
+
+def record_product(url: str, product: Product) -> Product:
+    """Append the product's current price to its price history and add it to the local product index (blocking: SQLite writes)."""
+    history = get_price_history()
+    if history is not None and product.price:
+        try:
+            history.record(url, product.price, product.currency)
+        except Exception:
+            logger.exception(f"Failed to record price history for {url}")
+    index_product(url, {**product.model_dump(), "product_description": product.description})
+    return product
+
+async def build_product(url: str) -> Product:
+    """Scrape a product page and turn it into a Product (shared by /api/product and the batch endpoint)."""
+    # 1. Call Firecrawl (unless we scraped this page recently or a scrape is already running)
+    firecrawl_data = await scrape_flight.do(
+        f"firecrawl_scrape:{canonicalize_url(url)}", scrape_product_page, url
+    )
+
+    # 2. Deterministic fast path: metadata/JSON-LD usually has everything we need
+    fields = await fill_from_earlier_scrape(url, extract_product_fields(firecrawl_data))
+    fields["url"] = fields.get("url") or url
+    if is_complete(fields):
+        logger.info(f"Rule-based extraction complete for {url}, skipping CrewAI")
+        return await asyncio.to_thread(record_product, url, Product(**fields))
+
+    # 3. Incomplete page: run CrewAI agent on Firecrawl output (in the LLM pool, off the event loop)
+    logger.info(f"Rule-based extraction incomplete for {url}, falling back to CrewAI")
     try:
-        result = run_product_cleaner(firecrawl_data)
+        run_product_cleaner = await lazy.aget("product_cleaner")
+        result = await run_in_llm_pool(run_product_cleaner, firecrawl_data)
     except Exception as e:
         import traceback
         print("CrewAI error:", e)
@@ -206,18 +495,7 @@ async def get_product_data(req: ProductRequest):
     
     metadata = firecrawl_data.get("data", {}).get("metadata", {})
 
-    def create_product_from_firecrawl(metadata):
-        return {
-            "title": metadata.get("og:title") or metadata.get("title"),
-            "price": metadata.get("og:price:amount"),
-            "currency": metadata.get("og:price:currency"),
-            "image_url": metadata.get("og:image") or metadata.get("ogImage"),
-            "site_name": metadata.get("og:site_name") or metadata.get("ogSiteName"),
-            "description": metadata.get("og:description") or metadata.get("description"),
-            "url": metadata.get("og:url") or metadata.get("url"),
-        }
-
-    # Validate CrewAI result. If it seems fake, fallback to Firecrawl.
+    # Validate CrewAI result. If it seems fake, fallback to the rule-based fields.
     is_valid = False
     if result and isinstance(result, dict) and result.get("title"):
         real_title = metadata.get("og:title", "").lower()
@@ -226,14 +504,236 @@ async def get_product_data(req: ProductRequest):
             is_valid = True
 
     if is_valid:
-        product_data = result
+        product_data = dict(result)
+        # Anything the agent left empty can still come from the page itself
+        for field, value in fields.items():
+            if product_data.get(field) in (None, "") and value not in (None, ""):
+                product_data[field] = value
     else:
-        product_data = create_product_from_firecrawl(metadata)
+        product_data = fields
+
+    return await asyncio.to_thread(record_product, url, Product(**product_data))
+
+@app.post("/api/product")
+async def get_product_data(req: ProductRequest):
+    return await build_product(req.url)
+
+@app.post("/api/products/batch")
+async def get_products_batch(req: BatchProductRequest):
+    """
+    Ingest many product URLs in one request.
+    Duplicate URLs (after canonicalization) are scraped once. Products are
+    built with bounded concurrency and streamed back as NDJSON, one line per
+    unique URL in completion order, followed by a summary line:
+      {"index": 0, "url": "...", "ok": true, "product": {...}}
+      {"index": 3, "url": "...", "ok": false, "error": "..."}
+      {"done": true, "total": 2, "succeeded": 1, "failed": 1, "duplicates": 0}
+    """
+    if len(req.urls) > BATCH_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_URLS} URLs per batch.")
+
+    unique, invalid = {}, []
+    for idx, url in enumerate(req.urls):
+        if not (url and url.strip()):
+            continue
+        # A URL that cannot be scraped fails on its own line instead of failing the batch
+        problem = url_problem(url)
+        if problem:
+            invalid.append({"index": idx, "url": url.strip(), "ok": False, "error": f"Invalid URL: {problem}"})
+            continue
+        unique.setdefault(canonicalize_url(url), (idx, url.strip()))
+    items = list(unique.values())
+    duplicates = sum(1 for url in req.urls if url and url.strip()) - len(items) - len(invalid)
+    semaphore = asyncio.Semaphore(max(1, min(req.concurrency or BATCH_CONCURRENCY, BATCH_CONCURRENCY)))
+    logger.info(f"[Batch] {len(items)} unique URLs ({duplicates} duplicates skipped)")
+
+    async def process(idx, url):
+        async with semaphore:
+            try:
+                product = await build_product(url)
+                return {"index": idx, "url": url, "ok": True, "product": product.model_dump()}
+            except HTTPException as e:
+                return {"index": idx, "url": url, "ok": False, "error": e.detail}
+            except Exception as e:
+                logger.exception(f"[Batch] Failed to build product for {url}")
+                return {"index": idx, "url": url, "ok": False, "error": str(e)}
+
+    async def stream():
+        tasks = [asyncio.ensure_future(process(idx, url)) for idx, url in items]
+        succeeded = 0
+        try:
+            for line in invalid:
+                yield json.dumps(line) + "\n"
+            for next_done in asyncio.as_completed(tasks):
+                line = await next_done
+                succeeded += line["ok"]
+                yield json.dumps(line) + "\n"
+            yield json.dumps({
+                "done": True,
+                "total": len(items) + len(invalid),
+                "succeeded": succeeded,
+                "failed": len(items) + len(invalid) - succeeded,
+                "duplicates": duplicates,
+            }) + "\n"
+        finally:
+            # Client went away (or we are done): stop any remaining work
+            for task in tasks:
+                task.cancel()
 
-    return Product(**product_data)
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+# ISO-8601 year or year-month, which datetime.fromisoformat does not accept
+REDUCED_DATE_RE = re.compile(r"\d{4}(?:-\d{2})?")
+
+def parse_time(value: Optional[str], default: float) -> float:
+    """
+    Unix timestamp from an ISO-8601 date/datetime (also "2024" or "2024-05")
+    or epoch seconds (naive times are UTC). ISO is tried first, so since=2024
+    is the year 2024, not 2024 seconds after the epoch.
+    """
+    if value is None or value == "":
+        return default
+    iso = value.replace("Z", "+00:00")
+    if REDUCED_DATE_RE.fullmatch(iso):
+        iso += "-01" * (3 - len(iso.split("-")))
+    try:
+        parsed = datetime.fromisoformat(iso)
+    except ValueError:
+        try:
+            return float(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid time: {value}")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def price_history_for(url: str, start: float, end: float, resolution: str) -> dict:
+    """One product's history: raw points or daily min/max/last aggregates."""
+    history = get_price_history()
+    if resolution == "raw":
+        points = [
+            {"ts": ts, "price": amount, "currency": currency}
+            for ts, amount, currency in history.points(url, start, end)
+        ]
+        return {"url": url, "resolution": "raw", "points": points}
+    return {"url": url, "resolution": "day", "days": list(history.daily(url, start, end))}
+
+class PriceHistoryRequest(BaseModel):
+    urls: List[str]
+    start: Optional[str] = None
+    end: Optional[str] = None
+    resolution: str = "day"
+
+def history_window(start: Optional[str], end: Optional[str], resolution: str):
+    if get_price_history() is None:
+        raise HTTPException(status_code=404, detail="Price history is disabled.")
+    if resolution not in ("day", "raw"):
+        raise HTTPException(status_code=400, detail="resolution must be 'day' or 'raw'.")
+    end_ts = parse_time(end, time.time())
+    return parse_time(start, end_ts - PRICE_HISTORY_DEFAULT_DAYS * 86400), end_ts
+
+@app.get("/api/price-history")
+async def get_price_history_for_product(url: str, start: Optional[str] = None, end: Optional[str] = None, resolution: str = "day"):
+    """Price history for one product URL (last PRICE_HISTORY_DEFAULT_DAYS days unless start/end are given)."""
+    start_ts, end_ts = history_window(start, end, resolution)
+    return await asyncio.to_thread(price_history_for, url, start_ts, end_ts, resolution)
+
+@app.post("/api/price-history")
+async def get_price_history_batch(req: PriceHistoryRequest):
+    """
+    Price history for many products, streamed as NDJSON (one line per URL,
+    in request order). Products are read one at a time, so memory use does
+    not grow with the number of URLs.
+    """
+    if len(req.urls) > PRICE_HISTORY_MAX_URLS:
+        raise HTTPException(status_code=400, detail=f"At most {PRICE_HISTORY_MAX_URLS} URLs per request.")
+    start_ts, end_ts = history_window(req.start, req.end, req.resolution)
+
+    async def stream():
+        for url in req.urls:
+            line = await asyncio.to_thread(price_history_for, url, start_ts, end_ts, req.resolution)
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+@app.get("/api/stats")
+async def get_stats():
+    """Runtime stats for the backend's shared resources."""
+    cache = get_scrape_cache()
+    llm_cache = get_llm_cache()
+    exa_cache = get_exa_cache()
+    history = get_price_history()
+    index = get_product_index()
+    return {
+        "llm_pool": llm_pool.stats(),
+        "governor": governor.stats(),
+        "breakers": breaker.all_stats(),
+        "scrape_cache": cache.stats() if cache else None,
+        "llm_cache": llm_cache.stats() if llm_cache else None,
+        "exa_cache": exa_cache.stats() if exa_cache else None,
+        "price_history": history.stats() if history else None,
+        "product_index": index.stats() if index else None,
+        "single_flight": singleflight.all_stats(),
+        "lazy": lazy.stats(),
+        "prompt_compaction": prompt_compaction.stats(),
+    }
+
+def _cache_families(caches: dict) -> list:
+    ratio, entries, size, events = [], [], [], []
+    for name, cache in caches.items():
+        if cache is None:
+            continue
+        cache_stats = cache.stats()
+        ratio.append(({"cache": name}, cache_stats.pop("hit_ratio")))
+        entries.append(({"cache": name}, cache_stats.pop("entries")))
+        size.append(({"cache": name}, cache_stats.pop("bytes")))
+        events += [({"cache": name, "event": event}, count) for event, count in cache_stats.items()]
+    return [
+        metrics.family("velora_cache_hit_ratio", "gauge", "Hits over lookups since start-up.", ratio),
+        metrics.family("velora_cache_entries", "gauge", "Entries stored.", entries),
+        metrics.family("velora_cache_bytes", "gauge", "Bytes stored.", size),
+        metrics.family("velora_cache_events_total", "counter", "Cache lookups, stores and evictions by kind.", events),
+    ]
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition: stage latency histograms and errors, API latency, caches, LLM pool, limiters and breakers."""
+    pool = llm_pool.stats()
+    limiters = governor.stats()["limiters"]
+    breakers = breaker.all_stats()["breakers"]
+    families = _cache_families({"scrape": get_scrape_cache(), "llm": get_llm_cache(), "exa": get_exa_cache()}) + [
+        metrics.family("velora_llm_pool_workers", "gauge", "LLM pool threads.", [({}, pool["workers"])]),
+        metrics.family("velora_llm_pool_queued", "gauge", "LLM calls waiting for a pool thread.", [({}, pool["queued"])]),
+        metrics.family("velora_llm_pool_active", "gauge", "LLM calls running.", [({}, pool["active"])]),
+        metrics.family(
+            "velora_llm_pool_calls_total", "counter", "Finished LLM pool calls by outcome.",
+            [({"outcome": outcome}, pool[outcome]) for outcome in ("completed", "failed")],
+        ),
+        metrics.family(
+            "velora_governor_in_flight", "gauge", "Upstream calls holding a governor permit.",
+            [({"upstream": name}, limiter["in_flight"]) for name, limiter in limiters.items()],
+        ),
+        metrics.family(
+            "velora_governor_concurrency_limit", "gauge", "Adaptive concurrency limit per upstream.",
+            [({"upstream": name}, limiter["concurrency_limit"]) for name, limiter in limiters.items()],
+        ),
+        metrics.family(
+            "velora_breaker_state", "gauge", "1 for each breaker's current state.",
+            [
+                ({"breaker": name, "state": state}, int(b["state"] == state))
+                for name, b in breakers.items() for state in (breaker.CLOSED, breaker.OPEN, breaker.HALF_OPEN)
+            ],
+        ),
+    ]
+    return PlainTextResponse(metrics.render(*families), media_type=metrics.CONTENT_TYPE)
 
 @app.post("/api/compare-price")
-async def compare_price(product: Product):
+async def compare_price(product: Product, deadline_seconds: Optional[float] = Header(None, alias=DEADLINE_HEADER)):
+    """
+    Cheaper offers for a product: {"cheaper_offers": [...], "partial": bool}.
+    If the request deadline runs out, whatever the search crews already found
+    is returned with partial=true.
+    """
     logger.info(f"Received price comparison request for: {product.title}")
 
     if not product.price:
@@ -242,59 +742,22 @@ async def compare_price(product: Product):
     
     try:
         logger.info(f"Kicking off PriceComparatorCrew for '{product.title}' with price {product.price}")
+        PriceComparatorCrew = await lazy.aget("price_comparator")
         comparator_crew = PriceComparatorCrew(product_title=product.title, original_price=product.price)
-        cheaper_option = await comparator_crew.run()
+        with use_deadline(Deadline.start(deadline_seconds)):
+            cheaper_option = await comparator_crew.run()
         
         logger.info(f"PriceComparatorCrew finished. Result: {cheaper_option}")
         
-        # Parse string output from CrewAI if necessary
-        if isinstance(cheaper_option, str):
-            # Remove code block markers (triple backticks and optional 'json')
-            import re
-            cleaned = cheaper_option.strip()
-            cleaned = re.sub(r'^```[a-zA-Z]*\n?', '', cleaned)
-            cleaned = re.sub(r'```$', '', cleaned)
-            try:
-                # Try parsing once
-                cheaper_option = json.loads(cleaned)
-                # If still a string, parse again (double-encoded JSON)
-                if isinstance(cheaper_option, str):
-                    cheaper_option = json.loads(cheaper_option)
-            except Exception as e:
+        # Parse string / CrewOutput results from CrewAI
+        if not isinstance(cheaper_option, dict):
+            parsed = parse_llm_json(cheaper_option, expect=dict)
+            if parsed is None:
                 logger.error(f"Failed to parse agent result as JSON: {cheaper_option}")
                 raise HTTPException(status_code=500, detail="AI agent returned invalid JSON.")
+            cheaper_option = parsed
         logger.info(f"Parsed cheaper_option type: {type(cheaper_option)} value: {cheaper_option}")
 
-        # Convert CrewOutput to dict if needed
-        if hasattr(cheaper_option, "json_dict") and cheaper_option.json_dict:
-            cheaper_option = cheaper_option.json_dict
-        elif hasattr(cheaper_option, "raw") and cheaper_option.raw:
-            raw = cheaper_option.raw
-            # Fix common LLM JSON bugs (e.g., {"offers":[]"})
-            cleaned = raw
-            # Remove trailing quote after array/object if present
-            if cleaned.endswith(']"}'):
-                cleaned = cleaned[:-3] + ']}'
-            elif cleaned.endswith('"}'):
-                cleaned = cleaned[:-2] + '}'
-            elif cleaned.endswith(']"'):
-                cleaned = cleaned[:-2] + ']'
-            elif cleaned.endswith('"') and cleaned.count('"') > cleaned.count(':'):
-                cleaned = cleaned[:-1]
-            if cleaned != raw:
-                logger.warning(f"Cleaned malformed JSON from agent: {raw} -> {cleaned}")
-            try:
-                cheaper_option = json.loads(cleaned)
-            except Exception as e:
-                logger.error(f"Failed to parse CrewOutput.raw as JSON (after cleaning): {cleaned}")
-                raise HTTPException(status_code=500, detail="AI agent returned invalid JSON in CrewOutput.raw.")
-        elif hasattr(cheaper_option, "dict"):
-            cheaper_option = cheaper_option.dict()
-        elif hasattr(cheaper_option, "to_dict"):
-            cheaper_option = cheaper_option.to_dict()
-        elif hasattr(cheaper_option, "output"):
-            cheaper_option = cheaper_option.output
-        
         # Validate structure: must be dict with 'offers' (list of dicts with required fields)
         if (
             not cheaper_option or
@@ -321,7 +784,7 @@ async def compare_price(product: Product):
             else:
                 logger.warning(f"Invalid offer found and skipped: {offer}")
 
-        return {"cheaper_offers": valid_offers}
+        return {"cheaper_offers": collapse_near_duplicates(valid_offers), "partial": comparator_crew.partial}
     except Exception as e:
         logger.exception("An unexpected error occurred during price comparison.")
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
@@ -336,7 +799,7 @@ async def extract_price_ai(request: PriceExtractionRequest):
     logger.info(f"[Direct] Received price extraction request for URL: {request.url}")
     try:
         # 1. Call Firecrawl for content extraction
-        firecrawl_data = fetch_firecrawl_contents(request.url)
+        firecrawl_data = await afetch_firecrawl_contents(request.url)
         logger.info(f"[Direct] Firecrawl data: {bool(firecrawl_data)}")
         result = {}
         confidence = 0
@@ -347,12 +810,15 @@ async def extract_price_ai(request: PriceExtractionRequest):
             confidence = firecrawl_data.get("overall_confidence", 0)
         else:
             logger.warning(f"[Direct] Firecrawl extraction failed for {request.url}")
-        # 2. Fallback: if missing price, use regex on raw_content
+        # 2. Fallback: if missing price, parse it out of raw_content
         price = result.get("price") if isinstance(result, dict) else None
         if not price and raw_content:
-            fallback_price = extract_price_with_regex(raw_content)
+            fallback_price = parse_price(raw_content)
             if fallback_price:
-                result["price"] = fallback_price
+                result["price"] = float(fallback_price.amount)
+                result["currency"] = result.get("currency") or fallback_price.currency
+                if fallback_price.original is not None:
+                    result["original_price"] = float(fallback_price.original)
                 result["price_extraction_fallback"] = "regex"
                 logger.info(f"[Direct] Fallback regex price used: {fallback_price}")
         # 3. Log final result
@@ -0,0 +1,199 @@
+"""
+Prometheus-style metrics for the backend's stages.
+
+Each stage of a request (Exa call, Firecrawl scrape, crew kickoff, LLM JSON
+parsing, ...) is wrapped in `with stage("exa_find_similar"):` (or
+`async with`), which records:
+  - velora_stage_duration_seconds{stage}   latency histogram
+  - velora_stage_errors_total{stage,error} exceptions, or the reason passed
+                                            to fail() (e.g. "http_502")
+  - velora_stage_in_flight{stage}          calls currently running
+
+Recording is lock-free on the hot path: every thread writes to its own shard
+(a plain dict reached through threading.local, so no other thread ever
+writes to it) and render() sums the shards when /metrics is scraped. A lock
+is only taken the first time a thread records to a metric.
+
+render() produces the Prometheus text exposition format (0.0.4); other
+gauges (cache hit ratios, LLM pool, breakers) are passed to it as families
+built from the existing stats() functions. METRICS_ENABLED=false turns
+recording off.
+"""
+import os
+import time
+import threading
+from bisect import bisect_left
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; spans sub-millisecond JSON parsing up to minute-long crew kickoffs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_metrics = []
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: tuple):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        _metrics.append(self)
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def _merged(self) -> dict:
+        with self._shards_lock:
+            shards = list(self._shards)
+        merged = {}
+        for shard in shards:
+            for labels, value in list(shard.items()):
+                merged[labels] = self._add(merged.get(labels), value)
+        return merged
+
+    def _add(self, total, value):
+        return value if total is None else total + value
+
+    def _label_text(self, labels: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def samples(self) -> list:
+        return [f"{self.name}{self._label_text(labels)} {_number(value)}" for labels, value in sorted(self._merged().items())]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+
+class Gauge(Counter):
+    """Up/down counter (summed across threads), e.g. calls in flight."""
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels) -> None:
+        shard = self._shard()
+        cells = shard.get(labels)
+        if cells is None:
+            # one count per bucket (+Inf last), then sum
+            cells = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def _add(self, total, value):
+        return list(value) if total is None else [a + b for a, b in zip(total, value)]
+
+    def samples(self) -> list:
+        lines = []
+        for labels, cells in sorted(self._merged().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), cells):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._label_text(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {_number(cells[-1])}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {cumulative}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+STAGE_SECONDS = Histogram("velora_stage_duration_seconds", "Latency of each request stage.", ("stage",))
+STAGE_ERRORS = Counter("velora_stage_errors_total", "Failed stage calls by error.", ("stage", "error"))
+STAGE_IN_FLIGHT = Gauge("velora_stage_in_flight", "Stage calls currently running.", ("stage",))
+HTTP_SECONDS = Histogram("velora_http_request_duration_seconds", "API request latency.", ("method", "route", "status"))
+
+
+class stage:
+    """Times a stage: `with stage("firecrawl_json") as s:` (or `async with`); s.fail(reason) marks a handled failure."""
+    __slots__ = ("name", "started", "error")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.error = None
+
+    def fail(self, reason: str) -> None:
+        self.error = reason
+
+    def __enter__(self):
+        if METRICS_ENABLED:
+            STAGE_IN_FLIGHT.inc(self.name)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if METRICS_ENABLED:
+            STAGE_SECONDS.observe(time.perf_counter() - self.started, self.name)
+            STAGE_IN_FLIGHT.dec(self.name)
+            error = self.error or (exc_type.__name__ if exc_type is not None else None)
+            if error:
+                STAGE_ERRORS.inc(self.name, error)
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def observe(stage_name: str, seconds: float) -> None:
+    """Record a duration measured elsewhere (e.g. time spent queued) under `stage_name`."""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage_name)
+
+
+def family(name: str, kind: str, help: str, samples: list) -> list:
+    """Exposition lines for a gauge/counter family from [(labels dict, value)]."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        label_text = ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items())
+        lines.append(f"{name}{{{label_text}}} {_number(value)}" if label_text else f"{name} {_number(value)}")
+    return lines
+
+
+def render(*families) -> str:
+    """Every recorded metric plus `families` (from family()) in the text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines += [f"# HELP {metric.name} {metric.help}", f"# TYPE {metric.name} {metric.kind}"]
+        lines += metric.samples()
+    for lines_of_family in families:
+        lines += lines_of_family
+    return "\n".join(lines) + "\n"
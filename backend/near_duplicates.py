@@ -0,0 +1,136 @@
+"""
+Near-duplicate detection for offers and similar products.
+
+The same item is often listed on several retailer URLs with slightly
+different titles ("Sony WH-1000XM5 Wireless Headphones - Black" vs "Sony
+WH1000XM5 Noise Cancelling Headphones, Black"). collapse_near_duplicates()
+finds those clusters in linear time:
+  - each title is normalized and cut into character NEAR_DUPLICATE_SHINGLE-
+    grams,
+  - a MinHash signature (NUM_PERM hashes, vectorized with NumPy) estimates
+    the Jaccard similarity of two shingle sets,
+  - LSH banding (BANDS x ROWS) only pairs items that share a band bucket,
+    and a pair is merged (union-find) when its estimated similarity is at
+    least NEAR_DUPLICATE_THRESHOLD and the titles do not name different
+    model numbers ("iPhone 14 Pro" vs "iPhone 15 Pro").
+
+Each cluster keeps its best-priced member; the others are listed under its
+"duplicate_offers" so no retailer is lost.
+"""
+import os
+import re
+import zlib
+import numpy as np
+from offer_merge import normalize_price
+
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "true").lower() in ("1", "true", "yes")
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.6"))
+NEAR_DUPLICATE_SHINGLE = 4
+
+NUM_PERM = 64
+BANDS, ROWS = 16, 4  # LSH pairs items whose similarity is roughly (1 / BANDS) ** (1 / ROWS) = 0.5 or more
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.uint64)
+_NORMALIZE_RE = re.compile(r"[^a-z0-9]+")
+_WORD_RE = re.compile(r"[^\s,;/()]+")
+
+
+def shingles(text: str, size: int = NEAR_DUPLICATE_SHINGLE) -> set:
+    """Character shingles of `text` lowercased with punctuation and spacing removed."""
+    text = _NORMALIZE_RE.sub("", str(text or "").lower())
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def minhash(items: set) -> np.ndarray:
+    """MinHash signature (NUM_PERM values) of a set of strings; all-max for an empty set."""
+    if not items:
+        return np.full(NUM_PERM, _PRIME, dtype=np.uint64)
+    hashes = np.fromiter((zlib.crc32(item.encode("utf-8")) for item in items), dtype=np.uint64, count=len(items))
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def model_tokens(text: str) -> frozenset:
+    """Tokens with digits in them ("wh1000xm5", "45", "128gb"), punctuation inside a token dropped."""
+    words = (_NORMALIZE_RE.sub("", word) for word in _WORD_RE.findall(str(text or "").lower()))
+    return frozenset(word for word in words if any(c.isdigit() for c in word))
+
+
+def _compatible(a: frozenset, b: frozenset) -> bool:
+    return not a or not b or a == b
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i: int, j: int) -> None:
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def cluster(texts: list, threshold: float = None) -> list:
+    """Clusters of near-duplicate texts as lists of indexes, in order of first appearance."""
+    threshold = NEAR_DUPLICATE_THRESHOLD if threshold is None else threshold
+    if not texts:
+        return []
+    signatures = np.array([minhash(shingles(text)) for text in texts])
+    empty = [not _NORMALIZE_RE.sub("", str(text or "").lower()) for text in texts]
+    models = [model_tokens(text) for text in texts]
+    groups = _UnionFind(len(texts))
+    for band in range(BANDS):
+        buckets = {}
+        for i, rows in enumerate(signatures[:, band * ROWS:(band + 1) * ROWS]):
+            if empty[i]:
+                continue
+            first = buckets.setdefault(rows.tobytes(), i)
+            if first != i and groups.find(first) != groups.find(i):
+                if np.mean(signatures[first] == signatures[i]) >= threshold and _compatible(models[first], models[i]):
+                    groups.union(first, i)
+    clusters = {}
+    for i in range(len(texts)):
+        clusters.setdefault(groups.find(i), []).append(i)
+    return list(clusters.values())
+
+
+def _price_rank(item: dict):
+    price = normalize_price(item.get("price"))
+    return (price is None, price or 0.0)
+
+
+def collapse_near_duplicates(items: list, title_key: str = "title") -> list:
+    """
+    One item per near-duplicate cluster (by title): the best-priced member,
+    with the others under "duplicate_offers" as {title, url, retailer, price}.
+    Items keep the order of their cluster's first member.
+    """
+    if not NEAR_DUPLICATE_ENABLED or len(items) < 2:
+        return list(items)
+    collapsed = []
+    for members in cluster([item.get(title_key) for item in items]):
+        if len(members) == 1:
+            collapsed.append(items[members[0]])
+            continue
+        ranked = sorted(members, key=lambda i: _price_rank(items[i]))
+        best = dict(items[ranked[0]])
+        best["duplicate_offers"] = [
+            {
+                "title": items[i].get(title_key),
+                "url": items[i].get("url") or items[i].get("source_url"),
+                "retailer": items[i].get("retailer") or items[i].get("site_name"),
+                "price": items[i].get("price"),
+            }
+            for i in ranked[1:]
+        ]
+        collapsed.append(best)
+    return collapsed
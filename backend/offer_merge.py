@@ -0,0 +1,126 @@
+"""
+Deterministic merge of the offers found by the price-comparison search crews.
+
+merge_offers() takes the raw offer lists from each source and:
+  - normalizes prices to floats ("$1,299.99", "1.299,00 €", 12 or
+    {"value": 12.5} all work); offers without a usable price are dropped,
+  - keeps only offers cheaper than the original price,
+  - dedupes by canonical URL, and by retailer + fuzzy title (token-set
+    overlap >= TITLE_SIMILARITY), keeping the cheapest copy and filling its
+    empty fields from the others,
+  - sorts by price ascending.
+
+It replaces the LLM "Offer Synthesizer" step, so it must accept whatever
+shape the search agents returned (see llm_json.parse_llm_json).
+"""
+import re
+from urllib.parse import urlsplit
+from price_parser import parse_amount, parse_price
+from url_utils import canonicalize_url
+
+# Token-set Jaccard overlap above which two titles from one retailer are the same offer
+TITLE_SIMILARITY = 0.8
+OFFER_FIELDS = ("title", "image_url", "description", "price", "retailer", "url")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_RETAILER_SUFFIX_RE = re.compile(r"\.(com|co|net|org|shop|store|[a-z]{2})(\.[a-z]{2})?$")
+
+
+def normalize_price(value):
+    """Price as a float, or None."""
+    if isinstance(value, dict):
+        value = value.get("value", value.get("amount"))
+    if isinstance(value, str) and not value.strip():
+        return None
+    if isinstance(value, str):
+        parsed = parse_price(value)
+        amount = parsed.amount if parsed else parse_amount(value)
+    else:
+        amount = parse_amount(value)
+    return float(amount) if amount is not None else None
+
+
+def _domain(url: str) -> str:
+    try:
+        host = (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+    return host[4:] if host.startswith("www.") else host
+
+
+def retailer_key(offer: dict) -> str:
+    """Retailer name ("Best Buy", "bestbuy.com") or URL domain, folded to compare across sources."""
+    name = str(offer.get("retailer") or "").lower().strip() or _domain(offer.get("url") or "")
+    name = name[4:] if name.startswith("www.") else name
+    return "".join(_TOKEN_RE.findall(_RETAILER_SUFFIX_RE.sub("", name)))
+
+
+def title_tokens(title) -> frozenset:
+    return frozenset(_TOKEN_RE.findall(str(title or "").lower()))
+
+
+def _similar(a: frozenset, b: frozenset) -> bool:
+    if not a or not b:
+        return False
+    return len(a & b) / len(a | b) >= TITLE_SIMILARITY
+
+
+def _iter_offers(result):
+    items = result.get("offers", []) if isinstance(result, dict) else result
+    for offer in items if isinstance(items, list) else []:
+        if isinstance(offer, dict):
+            yield offer
+
+
+def _normalize(offer: dict, price: float) -> dict:
+    out = dict(offer)
+    for field in OFFER_FIELDS:
+        if not isinstance(out.get(field), str):
+            out[field] = "" if out.get(field) is None else str(out[field])
+    out["price"] = price
+    out["url"] = out["url"].strip()
+    if not out["retailer"]:
+        out["retailer"] = _domain(out["url"])
+    return out
+
+
+def _fill(kept: dict, other: dict) -> None:
+    for field, value in other.items():
+        if kept.get(field) in (None, "") and value not in (None, ""):
+            kept[field] = value
+
+
+def merge_offers(original_price, *results) -> list:
+    """Unique offers cheaper than `original_price` from every source's results, cheapest first."""
+    limit = normalize_price(original_price)
+    by_url = {}
+    by_retailer = {}  # retailer key -> [(title tokens, offer)]
+    for result in results:
+        for offer in _iter_offers(result):
+            url = canonicalize_url(str(offer.get("url") or ""))
+            price = normalize_price(offer.get("price"))
+            if not url or price is None or (limit is not None and price >= limit):
+                continue
+            offer = _normalize(offer, price)
+            tokens = title_tokens(offer["title"])
+            same = by_url.get(url)
+            if same is None:
+                for seen_tokens, seen in by_retailer.get(retailer_key(offer), ()):
+                    if _similar(tokens, seen_tokens):
+                        same = seen
+                        break
+            if same is None:
+                by_url[url] = offer
+                by_retailer.setdefault(retailer_key(offer), []).append((tokens, offer))
+                continue
+            if price < same["price"]:
+                # Keep the cheaper copy in place (both indexes point at the same dict)
+                previous = dict(same)
+                same.clear()
+                same.update(offer)
+                _fill(same, previous)
+            else:
+                _fill(same, offer)
+            by_url.setdefault(url, same)
+    unique = {id(offer): offer for offer in by_url.values()}.values()
+    return sorted(unique, key=lambda offer: (offer["price"], offer["title"].lower()))
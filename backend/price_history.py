@@ -0,0 +1,167 @@
+"""
+Append-only price history for tracked products.
+
+Every price we see for a product is appended to an embedded SQLite store
+keyed by canonical product URL. Points are stored as packed arrays
+(uint32 timestamps, float64 amounts, uint8 indexes into a per-chunk currency
+list), one row per product per BUCKET_DAYS-day chunk, so a year of history
+is about a dozen small rows per product. Range queries read only the chunks
+they overlap, and daily aggregates (min/max/last per UTC day) are computed
+while walking those chunks, one product at a time.
+
+Repeats of the last observed price within PRICE_HISTORY_MIN_INTERVAL seconds
+are not stored again.
+"""
+import os
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+from datetime import datetime, timezone
+from url_utils import canonicalize_url
+
+logger = logging.getLogger("price_history")
+
+PRICE_HISTORY_ENABLED = os.getenv("PRICE_HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+PRICE_HISTORY_PATH = os.getenv(
+    "PRICE_HISTORY_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "price_history.sqlite3")
+)
+PRICE_HISTORY_MIN_INTERVAL = float(os.getenv("PRICE_HISTORY_MIN_INTERVAL", "3600"))
+
+DAY = 86400
+BUCKET_DAYS = 32
+
+
+def _bucket(ts: float) -> int:
+    return int(ts // (DAY * BUCKET_DAYS))
+
+
+def _day(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+class PriceHistory:
+    def __init__(self, path: str, min_interval: float = PRICE_HISTORY_MIN_INTERVAL):
+        self.path = path
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " key TEXT NOT NULL, bucket INTEGER NOT NULL, currencies TEXT NOT NULL,"
+            " ts BLOB NOT NULL, amounts BLOB NOT NULL, currency_idx BLOB NOT NULL,"
+            " PRIMARY KEY (key, bucket)) WITHOUT ROWID"
+        )
+
+    def record(self, url: str, amount: float, currency=None, ts: float = None) -> bool:
+        """Append one observation; False when it repeats the last stored point too soon."""
+        if amount is None or amount <= 0:
+            return False
+        key = canonicalize_url(url)
+        ts = time.time() if ts is None else ts
+        bucket = _bucket(ts)
+        currency = (currency or "").upper()
+        with self._lock:
+            last = self._conn.execute(
+                "SELECT bucket, currencies, ts, amounts, currency_idx FROM chunks WHERE key = ? ORDER BY bucket DESC LIMIT 1",
+                (key,),
+            ).fetchone()
+            if last is not None:
+                last_ts, last_amount, last_currency = _unpack(*last[1:])[-1]
+                if (
+                    last_amount == float(amount)
+                    and (last_currency or "") == currency
+                    and 0 <= ts - last_ts < self.min_interval
+                ):
+                    return False
+            row = last if last is not None and last[0] == bucket else self._conn.execute(
+                "SELECT bucket, currencies, ts, amounts, currency_idx FROM chunks WHERE key = ? AND bucket = ?",
+                (key, bucket),
+            ).fetchone()
+            if row is None:
+                currencies, stamps, amounts, idx = [], array("I"), array("d"), array("B")
+            else:
+                currencies = row[1].split(",")
+                stamps, amounts, idx = array("I", row[2]), array("d", row[3]), array("B", row[4])
+            if currency not in currencies:
+                currencies.append(currency)
+            # Out-of-order points (backfills) are inserted in place so chunks stay sorted
+            pos = len(stamps)
+            while pos and stamps[pos - 1] > int(ts):
+                pos -= 1
+            stamps.insert(pos, int(ts))
+            amounts.insert(pos, float(amount))
+            idx.insert(pos, currencies.index(currency))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO chunks (key, bucket, currencies, ts, amounts, currency_idx) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, bucket, ",".join(currencies), stamps.tobytes(), amounts.tobytes(), idx.tobytes()),
+            )
+        return True
+
+    def _chunks(self, key: str, start: float, end: float) -> list:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT currencies, ts, amounts, currency_idx FROM chunks"
+                " WHERE key = ? AND bucket BETWEEN ? AND ? ORDER BY bucket",
+                (key, _bucket(start), _bucket(end)),
+            ).fetchall()
+
+    def points(self, url: str, start: float, end: float):
+        """(timestamp, amount, currency) observations for `url` with start <= timestamp <= end, oldest first."""
+        for chunk in self._chunks(canonicalize_url(url), start, end):
+            for point in _unpack(*chunk):
+                if start <= point[0] <= end:
+                    yield point
+
+    def daily(self, url: str, start: float, end: float):
+        """Per-UTC-day aggregates {"date", "min", "max", "last", "currency", "count"} for `url`."""
+        current = None
+        for ts, amount, currency in self.points(url, start, end):
+            date = _day(ts)
+            if current is None or current["date"] != date:
+                if current is not None:
+                    yield current
+                current = {"date": date, "min": amount, "max": amount, "last": amount, "currency": currency, "count": 0}
+            current["min"] = min(current["min"], amount)
+            current["max"] = max(current["max"], amount)
+            current["last"] = amount
+            current["currency"] = currency
+            current["count"] += 1
+        if current is not None:
+            yield current
+
+    def stats(self) -> dict:
+        with self._lock:
+            products, chunks = self._conn.execute("SELECT COUNT(DISTINCT key), COUNT(*) FROM chunks").fetchone()
+            points = self._conn.execute("SELECT COALESCE(SUM(LENGTH(currency_idx)), 0) FROM chunks").fetchone()[0]
+        return {"products": products, "chunks": chunks, "points": points}
+
+
+def _unpack(currencies: str, ts: bytes, amounts: bytes, currency_idx: bytes) -> list:
+    names = currencies.split(",") if currencies else [""]
+    return [
+        (stamp, amount, names[i] or None)
+        for stamp, amount, i in zip(array("I", ts), array("d", amounts), array("B", currency_idx))
+    ]
+
+
+_price_history = None
+_init_lock = threading.Lock()
+
+
+def get_price_history():
+    """Process-wide PriceHistory, or None when PRICE_HISTORY_ENABLED is off."""
+    global _price_history
+    if not PRICE_HISTORY_ENABLED:
+        return None
+    if _price_history is None:
+        with _init_lock:
+            if _price_history is None:
+                _price_history = PriceHistory(PRICE_HISTORY_PATH)
+                logger.info(f"Price history opened at {PRICE_HISTORY_PATH}")
+    return _price_history
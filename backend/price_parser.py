@@ -0,0 +1,252 @@
+"""
+Price parsing engine shared by the API and the CrewAI tools.
+
+All patterns are compiled once at import. parse_price() turns free text
+("Was $1,299.99 Now $999", "12,99 €", "£20 - £30") into a Price with a
+Decimal amount and ISO 4217 currency; parse_prices() does the same for many
+texts with a single regex scan; parse_amount() handles bare numbers such as
+metadata values ("1.299,00").
+"""
+import re
+from bisect import bisect_right
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+
+# Currency symbols/codes -> ISO 4217. Longer tokens first so "US$" wins over "$".
+CURRENCY_SYMBOLS = {
+    "US$": "USD", "USD$": "USD", "CA$": "CAD", "C$": "CAD", "AU$": "AUD", "A$": "AUD",
+    "NZ$": "NZD", "HK$": "HKD", "S$": "SGD", "R$": "BRL", "MX$": "MXN",
+    "$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₹": "INR", "₩": "KRW",
+    "zł": "PLN", "kr": "SEK", "Fr.": "CHF",
+}
+ISO_CODES = (
+    "USD", "EUR", "GBP", "JPY", "CAD", "AUD", "NZD", "CHF", "SEK", "NOK", "DKK", "PLN",
+    "CZK", "HUF", "INR", "CNY", "HKD", "SGD", "KRW", "BRL", "MXN", "ZAR", "AED", "TRY",
+)
+
+# Symbols also written after the amount ("12,99 €", "49 zł"). $, £, ¥, ₹ and ₩ only ever
+# precede it, so "iPhone 15 $799" must not read as 15 USD.
+SUFFIX_SYMBOLS = ("€", "zł", "kr", "Fr.")
+
+# An alphabetic suffix or code may not run on into a word ("12 krabs for $5")
+_NOT_LETTER = r"(?![^\W\d_])"
+_SYMBOL_RE = "|".join(re.escape(s) for s in sorted(CURRENCY_SYMBOLS, key=len, reverse=True))
+_CODE_RE = r"\b(?:" + "|".join(ISO_CODES) + r")" + _NOT_LETTER
+_CUR = rf"(?:{_CODE_RE}|{_SYMBOL_RE})"
+_SUFFIX_RE = "|".join(re.escape(s) + (_NOT_LETTER if s[-1].isalpha() else "") for s in SUFFIX_SYMBOLS)
+# A suffix glued to the next number ("3 €12.00") is that number's prefix instead
+_SUF = rf"(?:{_CODE_RE}|{_SUFFIX_RE})(?!\d)"
+# 1,299.99 / 1.299,99 / 1 299,99 / 1'299.99 / 1299 / 12,5
+_NUM = r"\d{1,3}(?:[.,\u00a0\u202f' ]\d{3})+(?:[.,]\d{1,2})?(?!\d)|\d+(?:[.,]\d{1,2})?(?!\d)"
+_RANGE_SEP = r"\s*(?:-|–|—|to|bis|à)\s*"
+
+PRICE_RE = re.compile(
+    rf"(?P<pre>{_CUR})\s?(?P<num>{_NUM})(?:{_RANGE_SEP}(?:{_CUR})?\s?(?P<hi>{_NUM}))?"
+    rf"|(?P<snum>{_NUM})(?:{_RANGE_SEP}(?P<shi>{_NUM}))?\s?(?P<suf>{_SUF})"
+)
+_WAS_RE = re.compile(
+    r"(?:\bwas|\boriginal(?:ly)?|\bregular|\breg\.?|\blist price|\bcompare at|\brrp|\bmsrp|\bbefore"
+    r"|\bstatt|\bantes|\bprix barré|\buvp)\W{0,3}(?:price\W{0,3})?$",
+    re.IGNORECASE,
+)
+_NOW_RE = re.compile(
+    r"(?:\bnow|\bsale|\btoday|\bcurrent|\bour price|\bspecial|\bdeal|\bonly|\boffer|\bjetzt|\bahora)"
+    r"\W{0,3}(?:price\W{0,3})?(?:only\W{0,3})?$",
+    re.IGNORECASE,
+)
+# Context that names the amount as the price, and context that says it is something else
+# (a shipping threshold, a saving, a size or pack count) and should only be used as a last resort
+_PRICE_RE = re.compile(
+    r"(?:\bprice|\bpreis|\bprix|\bprecio|\bprezzo|\bcost|\bbuy(?: it)? for|\bpay)\W{0,3}(?:only\W{0,3})?$",
+    re.IGNORECASE,
+)
+_OTHER_RE = re.compile(
+    r"(?:\bover|\babove|\bunder|\bspend|\bsave|\bsaving|\bshipping|\bdelivery|\bsize|\bpack of|\bqty"
+    r"|\bquantity|\bmodel)\W{0,3}$",
+    re.IGNORECASE,
+)
+# Cheap pre-scan for currency tokens: a bare character class and a literal
+# alternation each run at C speed, unlike PRICE_RE over the whole text, so
+# PRICE_RE only runs in small windows around the tokens they find.
+_SYMBOL_ANCHOR_RE = re.compile("[" + "".join(s for s in CURRENCY_SYMBOLS if len(s) == 1) + "]")
+_TOKEN_ANCHOR_RE = re.compile("|".join(
+    [re.escape(s) for s in CURRENCY_SYMBOLS if len(s) > 1 and "$" not in s] + list(ISO_CODES)
+))
+_WINDOW_BEFORE = 40
+_WINDOW_AFTER = 60
+_BARE_NUM_RE = re.compile(_NUM)
+_SPACES_RE = re.compile(r"[\s\u00a0\u202f']")
+_CONTEXT = 30
+_MAX_AMOUNT = Decimal("10000000")
+# Separator used to join texts for batch scanning; it can never be part of a match
+_BATCH_SEP = "\n\x00\n"
+
+
+@dataclass(frozen=True)
+class Price:
+    amount: Decimal
+    currency: Optional[str] = None
+    original: Optional[Decimal] = None    # "was" price when the text has a was/now pair
+    max_amount: Optional[Decimal] = None  # upper bound when the text gives a range
+    raw: str = ""
+
+    def to_dict(self) -> dict:
+        """JSON-friendly form (floats) for API responses and tool output."""
+        return {
+            "price": float(self.amount),
+            "currency": self.currency,
+            "original_price": float(self.original) if self.original is not None else None,
+            "max_price": float(self.max_amount) if self.max_amount is not None else None,
+        }
+
+
+def _to_decimal(number: str) -> Optional[Decimal]:
+    """Decimal value of a number string, working out US vs EU separators."""
+    number = _SPACES_RE.sub("", number)
+    if "," in number and "." in number:
+        if number.rfind(",") > number.rfind("."):
+            number = number.replace(".", "").replace(",", ".")
+        else:
+            number = number.replace(",", "")
+    elif "," in number:
+        head, _, tail = number.rpartition(",")
+        number = f"{head.replace(',', '')}.{tail}" if len(tail) <= 2 and number.count(",") == 1 else number.replace(",", "")
+    elif number.count(".") > 1 or ("." in number and len(number.rpartition(".")[2]) == 3):
+        number = number.replace(".", "")
+    try:
+        value = Decimal(number)
+    except InvalidOperation:
+        return None
+    return value if Decimal(0) < value < _MAX_AMOUNT else None
+
+
+def _currency(token: Optional[str]) -> Optional[str]:
+    if not token:
+        return None
+    return CURRENCY_SYMBOLS.get(token, token.upper())
+
+
+def _label(text: str, start: int, floor: int) -> Optional[str]:
+    context = text[max(floor, start - _CONTEXT):start]
+    if _WAS_RE.search(context):
+        return "was"
+    if _NOW_RE.search(context):
+        return "now"
+    if _PRICE_RE.search(context):
+        return "price"
+    if _OTHER_RE.search(context):
+        return "other"
+    return None
+
+
+def _candidate(text: str, match, floor: int) -> Optional[dict]:
+    if match.group("num") is not None:
+        amount, high, token = match.group("num"), match.group("hi"), match.group("pre")
+    else:
+        amount, high, token = match.group("snum"), match.group("shi"), match.group("suf")
+    value = _to_decimal(amount)
+    if value is None:
+        return None
+    high_value = _to_decimal(high) if high else None
+    return {
+        "amount": value,
+        "max_amount": high_value if high_value is not None and high_value > value else None,
+        "currency": _currency(token),
+        "label": _label(text, match.start(), floor),
+        "start": match.start(),
+        "end": match.end(),
+        "raw": match.group(0),
+    }
+
+
+def _choose(candidates: List[dict]) -> Optional[Price]:
+    """Pick the selling price (and "was" price) out of the candidates found in one text."""
+    if not candidates:
+        return None
+    was = next((c for c in candidates if c["label"] == "was"), None)
+    now = next((c for c in candidates if c["label"] == "now"), None)
+    if now is None and was is not None:
+        # "Was $50 $30": the unlabelled price right after the was price is the current one
+        now = next((c for c in candidates if c["start"] > was["end"] and c["label"] is None
+                    and c["start"] - was["end"] <= _CONTEXT), None)
+    # Otherwise the first amount named as the price, then the first unlabelled one, and a
+    # shipping threshold or size ("other") only when nothing else is left
+    chosen = now or next(
+        (c for label in ("price", None, "other") for c in candidates if c["label"] == label), None
+    ) or was
+    original = None
+    if was is not None and was is not chosen and was["amount"] > chosen["amount"]:
+        original = was["amount"]
+    return Price(
+        amount=chosen["amount"],
+        currency=chosen["currency"] or (was or {}).get("currency"),
+        original=original,
+        max_amount=chosen["max_amount"],
+        raw=chosen["raw"],
+    )
+
+
+def _scan(text: str):
+    """PRICE_RE matches in `text`, searching only the windows around currency tokens."""
+    anchors = [m.start() for m in _SYMBOL_ANCHOR_RE.finditer(text)]
+    anchors.extend(m.start() for m in _TOKEN_ANCHOR_RE.finditer(text))
+    if not anchors:
+        return
+    anchors.sort()
+    windows = []
+    for pos in anchors:
+        lo, hi = max(0, pos - _WINDOW_BEFORE), pos + _WINDOW_AFTER
+        if windows and lo <= windows[-1][1]:
+            windows[-1][1] = hi
+        else:
+            windows.append([lo, hi])
+    for lo, hi in windows:
+        for match in PRICE_RE.finditer(text, lo, hi):
+            yield match
+            if match.group("suf") is not None:
+                # "Size 10 USD 45": the suffix may be the next amount's prefix instead
+                overlap = PRICE_RE.match(text, match.start("suf"), hi)
+                if overlap is not None and overlap.group("pre") is not None:
+                    yield overlap
+
+
+def find_prices(text: str) -> List[dict]:
+    """Every currency-tagged amount in `text`, with position and was/now label."""
+    if not text:
+        return []
+    return [c for c in (_candidate(text, m, 0) for m in _scan(text)) if c]
+
+
+def parse_price(text: str) -> Optional[Price]:
+    """Best selling price in `text`, or None when no currency-tagged amount is found."""
+    return _choose(find_prices(text))
+
+
+def parse_prices(texts: List[str]) -> List[Optional[Price]]:
+    """parse_price for many texts at once: one regex pass over all of them, results aligned with `texts`."""
+    texts = [t or "" for t in texts]
+    starts = []
+    offset = 0
+    for t in texts:
+        starts.append(offset)
+        offset += len(t) + len(_BATCH_SEP)
+    joined = _BATCH_SEP.join(texts)
+    per_text = [[] for _ in texts]
+    for match in _scan(joined):
+        idx = bisect_right(starts, match.start()) - 1
+        candidate = _candidate(joined, match, starts[idx])
+        if candidate:
+            per_text[idx].append(candidate)
+    return [_choose(candidates) for candidates in per_text]
+
+
+def parse_amount(value) -> Optional[Decimal]:
+    """Amount from a bare value such as 19.99, "1,299.00" or "1.299,00 €" (no currency required)."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float, Decimal)):
+        value = Decimal(str(value))
+        return value if value > 0 else None
+    match = _BARE_NUM_RE.search(str(value))
+    return _to_decimal(match.group(0)) if match else None
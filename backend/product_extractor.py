@@ -0,0 +1,156 @@
+"""
+Rule-based product extraction from Firecrawl scrape results.
+
+Reads the fields the `Product` model needs straight from page metadata
+(og:, product:, twitter: tags) and JSON-LD `Product` blocks. When title and
+price are both found, /api/product answers from here without an LLM call;
+the CrewAI cleaner only runs for pages where this comes up short.
+"""
+import re
+import json
+import logging
+from price_parser import parse_amount
+
+logger = logging.getLogger("product_extractor")
+
+# Fields that must be present for the rule-based result to be used on its own
+REQUIRED_FIELDS = ("title", "price")
+
+_JSON_LD_RE = re.compile(
+    r'<script[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script>',
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Candidate keys per field, in priority order
+METADATA_KEYS = {
+    "title": ("og:title", "ogTitle", "product:title", "twitter:title", "title"),
+    "price": ("product:price:amount", "og:price:amount", "product:sale_price:amount", "price"),
+    "currency": ("product:price:currency", "og:price:currency", "product:sale_price:currency", "currency"),
+    "original_price": ("product:original_price:amount", "og:price:standard_amount", "product:retail_price:amount"),
+    "image_url": ("og:image", "ogImage", "og:image:secure_url", "twitter:image", "image"),
+    "site_name": ("og:site_name", "ogSiteName", "application-name"),
+    "description": ("og:description", "ogDescription", "description", "twitter:description"),
+    "url": ("og:url", "ogUrl", "url", "sourceURL"),
+    "category": ("product:category", "category"),
+}
+
+
+def _first(value):
+    """Metadata values can be lists (repeated tags); take the first non-empty one."""
+    if isinstance(value, list):
+        return next((v for v in value if v not in (None, "")), None)
+    return value
+
+
+def _to_float(value):
+    amount = parse_amount(value)
+    return float(amount) if amount is not None else None
+
+
+def extract_json_ld(html: str) -> list:
+    """Parse every JSON-LD block in an HTML document, flattening lists and @graph."""
+    nodes = []
+    if not html:
+        return nodes
+    for block in _JSON_LD_RE.findall(html):
+        try:
+            data = json.loads(block.strip())
+        except ValueError:
+            continue
+        stack = [data]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, list):
+                stack.extend(reversed(item))
+            elif isinstance(item, dict):
+                if "@graph" in item:
+                    graph = item["@graph"]
+                    stack.extend(reversed(graph) if isinstance(graph, list) else [graph])
+                else:
+                    nodes.append(item)
+    return nodes
+
+
+def attach_json_ld(firecrawl_data: dict) -> dict:
+    """Replace the scraped rawHtml with just its JSON-LD blocks, so cached payloads stay small."""
+    data = firecrawl_data.get("data")
+    if isinstance(data, dict) and "rawHtml" in data:
+        data["jsonLd"] = extract_json_ld(data.pop("rawHtml") or "")
+    return firecrawl_data
+
+
+def _is_type(node: dict, type_name: str) -> bool:
+    node_type = node.get("@type")
+    if isinstance(node_type, list):
+        return type_name in node_type
+    return node_type == type_name
+
+
+def _json_ld_product(nodes: list) -> dict:
+    for type_name in ("Product", "ProductGroup"):
+        for node in nodes:
+            if _is_type(node, type_name):
+                return node
+    return {}
+
+
+def _json_ld_fields(product: dict) -> dict:
+    if not product:
+        return {}
+    offers = product.get("offers") or {}
+    if isinstance(offers, list):
+        offers = offers[0] if offers else {}
+    price_spec = offers.get("priceSpecification") or {}
+    if isinstance(price_spec, list):
+        price_spec = price_spec[0] if price_spec else {}
+    image = product.get("image")
+    if isinstance(image, list):
+        image = image[0] if image else None
+    if isinstance(image, dict):
+        image = image.get("url") or image.get("contentUrl")
+    return {
+        "title": product.get("name"),
+        "price": offers.get("price") or offers.get("lowPrice") or price_spec.get("price"),
+        "currency": offers.get("priceCurrency") or price_spec.get("priceCurrency"),
+        "image_url": image,
+        "description": product.get("description"),
+        "url": product.get("url") or offers.get("url"),
+        "category": product.get("category") if isinstance(product.get("category"), str) else None,
+    }
+
+
+def extract_product_fields(firecrawl_data: dict) -> dict:
+    """
+    Build a Product-shaped dict from a Firecrawl /v1/scrape response.
+    JSON-LD wins where present, then metadata tags in METADATA_KEYS order.
+    Missing fields are None.
+    """
+    data = (firecrawl_data or {}).get("data") or {}
+    metadata = data.get("metadata") or {}
+    json_ld = data.get("jsonLd")
+    if json_ld is None:
+        json_ld = extract_json_ld(data.get("rawHtml") or "")
+    fields = _json_ld_fields(_json_ld_product(json_ld))
+
+    for field, keys in METADATA_KEYS.items():
+        if fields.get(field) not in (None, ""):
+            continue
+        fields[field] = next(
+            (_first(metadata[key]) for key in keys if _first(metadata.get(key)) not in (None, "")), None
+        )
+
+    # twitter:label1/data1 often carries the price on shops without product: tags
+    if fields.get("price") in (None, "") and str(_first(metadata.get("twitter:label1")) or "").lower() == "price":
+        fields["price"] = _first(metadata.get("twitter:data1"))
+
+    fields["price"] = _to_float(fields.get("price"))
+    fields["original_price"] = _to_float(fields.get("original_price"))
+    for field in ("title", "description", "currency", "site_name"):
+        if isinstance(fields.get(field), str):
+            fields[field] = fields[field].strip() or None
+    return fields
+
+
+def is_complete(fields: dict) -> bool:
+    """True when the rule-based result has every REQUIRED_FIELDS value."""
+    return all(fields.get(field) not in (None, "") for field in REQUIRED_FIELDS)
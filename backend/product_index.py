@@ -0,0 +1,226 @@
+"""
+Local similarity index over every product we have scraped.
+
+Products from Firecrawl JSON extraction (fetch_firecrawl_contents) and
+/api/product are added as they pass through. Each one gets:
+  - its title/brand/description terms in an in-memory inverted index
+    (term -> packed uint32 row ids),
+  - a SKETCH_DIM-dimensional feature-hashed sketch of its title/brand and
+    description tokens and bigrams (L2-normalized; float16 on disk, float32
+    in memory).
+
+similar() scores every indexed product against a query product in one pass:
+idf-weighted term overlap from the posting lists plus cosine similarity of
+the sketches (a single matrix-vector product), and returns the top matches.
+With tens of thousands of products a query takes a few milliseconds.
+
+Everything is persisted to an embedded SQLite file, one row per canonical
+product URL. On start-up the terms and sketches are read back in one query
+(no re-tokenizing of descriptions), so reload is fast.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+from array import array
+import numpy as np
+from relevance import tokenize
+from url_utils import canonicalize_url
+
+logger = logging.getLogger("product_index")
+
+PRODUCT_INDEX_ENABLED = os.getenv("PRODUCT_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+PRODUCT_INDEX_PATH = os.getenv(
+    "PRODUCT_INDEX_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "product_index.sqlite3")
+)
+# merge: local matches are added after Exa's; prefer: Exa is skipped when the index has enough good matches
+PRODUCT_INDEX_MODE = os.getenv("PRODUCT_INDEX_MODE", "merge").lower()
+PRODUCT_INDEX_MAX_RESULTS = int(os.getenv("PRODUCT_INDEX_MAX_RESULTS", "10"))
+PRODUCT_INDEX_MIN_SCORE = float(os.getenv("PRODUCT_INDEX_MIN_SCORE", "0.35"))
+PRODUCT_INDEX_PREFER_COUNT = int(os.getenv("PRODUCT_INDEX_PREFER_COUNT", "5"))
+
+SKETCH_DIM = 256
+# Terms in more than this share of products carry no signal and are skipped at query time
+MAX_TERM_SHARE = 0.2
+LEXICAL_WEIGHT = 0.5
+DESCRIPTION_TOKENS = 80
+
+
+def _texts(product: dict):
+    title = " ".join(str(product.get(field) or "") for field in ("title", "brand"))
+    description = product.get("product_description") or product.get("description") or ""
+    return tokenize(title), tokenize(description)[:DESCRIPTION_TOKENS]
+
+
+def sketch(title_tokens: list, description_tokens: list) -> np.ndarray:
+    """Signed feature-hashing sketch of tokens and bigrams, title weighted double."""
+    vector = np.zeros(SKETCH_DIM, dtype=np.float32)
+    for tokens, weight in ((title_tokens, 2.0), (description_tokens, 1.0)):
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % SKETCH_DIM] += weight if h & 0x80000000 else -weight
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _summary(url: str, product: dict) -> dict:
+    """The fields kept for each indexed product (what a similar-products candidate needs)."""
+    return {
+        "url": url,
+        "title": product.get("title") or "",
+        "brand": product.get("brand") or "",
+        "image_url": product.get("image_url") or "",
+        "price": product.get("price"),
+        "currency": product.get("currency") or "",
+    }
+
+
+class ProductIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " key TEXT PRIMARY KEY, summary BLOB NOT NULL, terms TEXT NOT NULL,"
+            " sketch BLOB NOT NULL, indexed_at REAL NOT NULL)"
+        )
+        self._keys = []
+        self._rows = {}  # key -> row
+        self._terms = []  # row -> frozenset of terms
+        self._postings = {}  # term -> array("I") of rows
+        self._sketches = np.zeros((0, SKETCH_DIM), dtype=np.float32)
+        self._load()
+
+    def _load(self) -> None:
+        started = time.perf_counter()
+        rows = self._conn.execute("SELECT key, terms, sketch FROM products").fetchall()
+        self._sketches = np.zeros((max(len(rows), 64), SKETCH_DIM), dtype=np.float32)
+        if rows:
+            self._sketches[:len(rows)] = np.frombuffer(
+                b"".join(row[2] for row in rows), dtype=np.float16
+            ).reshape(len(rows), SKETCH_DIM)
+        for key, terms, _ in rows:
+            self._append(key, frozenset(terms.split()))
+        logger.info(f"Product index loaded {len(rows)} products in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def _append(self, key: str, terms: frozenset) -> int:
+        row = len(self._keys)
+        self._keys.append(key)
+        self._rows[key] = row
+        self._terms.append(terms)
+        for term in terms:
+            self._postings.setdefault(term, array("I")).append(row)
+        return row
+
+    def add(self, url: str, product: dict) -> bool:
+        """Index (or re-index) a scraped product; False when it has nothing to index."""
+        if not url or not isinstance(product, dict) or not product.get("title"):
+            return False
+        key = canonicalize_url(url)
+        title_tokens, description_tokens = _texts(product)
+        terms = frozenset(title_tokens + description_tokens)
+        vector = sketch(title_tokens, description_tokens)
+        summary = zlib.compress(json.dumps(_summary(url, product), default=str).encode("utf-8"))
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                row = self._append(key, terms)
+                if row >= len(self._sketches):
+                    grown = np.zeros((len(self._sketches) * 2, SKETCH_DIM), dtype=np.float32)
+                    grown[:row] = self._sketches[:row]
+                    self._sketches = grown
+            elif self._terms[row] != terms:
+                for term in self._terms[row] - terms:
+                    self._postings[term].remove(row)
+                for term in terms - self._terms[row]:
+                    self._postings.setdefault(term, array("I")).append(row)
+                self._terms[row] = terms
+            self._sketches[row] = vector
+            self._conn.execute(
+                "INSERT OR REPLACE INTO products (key, summary, terms, sketch, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, summary, " ".join(sorted(terms)), vector.astype(np.float16).tobytes(), time.time()),
+            )
+        return True
+
+    def similar(self, product: dict, limit: int = PRODUCT_INDEX_MAX_RESULTS, min_score: float = PRODUCT_INDEX_MIN_SCORE) -> list:
+        """Indexed products most similar to `product` (its own URL excluded), best first, each with a "score"."""
+        title_tokens, description_tokens = _texts(product)
+        if not title_tokens and not description_tokens:
+            return []
+        query_vector = sketch(title_tokens, description_tokens)
+        weights = {term: 1.0 for term in description_tokens}
+        weights.update({term: 2.0 for term in title_tokens})
+        with self._lock:
+            exclude = self._rows.get(canonicalize_url(product.get("url") or ""))
+            count = len(self._keys)
+            if not count:
+                return []
+            lexical = np.zeros(count, dtype=np.float32)
+            total = 0.0
+            for term, weight in weights.items():
+                postings = self._postings.get(term)
+                df = len(postings) if postings else 0
+                idf = float(np.log(1 + count / (df + 1)))
+                total += weight * idf
+                if df and df <= max(1, MAX_TERM_SHARE * count):
+                    lexical[np.frombuffer(postings, dtype=np.uint32)] += weight * idf
+            cosine = self._sketches[:count] @ query_vector
+            keys = self._keys
+        scores = LEXICAL_WEIGHT * lexical / max(total, 1e-9) + (1 - LEXICAL_WEIGHT) * np.clip(cosine, 0, 1)
+        if exclude is not None:
+            scores[exclude] = 0
+        top = np.argpartition(-scores, min(limit, count - 1))[:limit] if count > limit else np.arange(count)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        hits = [(keys[row], float(scores[row])) for row in top if scores[row] >= min_score]
+        summaries = self._summaries([key for key, _ in hits])
+        return [dict(summaries[key], score=round(score, 4)) for key, score in hits if key in summaries]
+
+    def _summaries(self, keys: list) -> dict:
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, summary FROM products WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+        return {key: json.loads(zlib.decompress(summary)) for key, summary in rows}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"products": len(self._keys), "terms": len(self._postings), "mode": PRODUCT_INDEX_MODE}
+
+
+_product_index = None
+_init_lock = threading.Lock()
+
+
+def get_product_index():
+    """Process-wide ProductIndex, or None when PRODUCT_INDEX_ENABLED is off."""
+    global _product_index
+    if not PRODUCT_INDEX_ENABLED:
+        return None
+    if _product_index is None:
+        with _init_lock:
+            if _product_index is None:
+                _product_index = ProductIndex(PRODUCT_INDEX_PATH)
+                logger.info(f"Product index opened at {PRODUCT_INDEX_PATH}")
+    return _product_index
+
+
+def index_product(url: str, product: dict) -> None:
+    """Add a scraped product to the index (no-op when disabled; never raises)."""
+    index = get_product_index()
+    if index is None:
+        return
+    try:
+        index.add(url, product)
+    except Exception:
+        logger.exception(f"Failed to index product {url}")
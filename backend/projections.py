@@ -0,0 +1,68 @@
+"""
+What each caller asks Exa and Firecrawl for.
+
+Most callers read a few hundred characters of a page (a snippet for an
+agent, a description, a price), but the upstream defaults send far more:
+exa_py's find_similar()/search() attach 10,000 characters of text to every
+result, get_contents() sends whole pages, and Firecrawl scrapes include
+navigation, footers and every metadata tag. Callers pick a view here instead
+and the cap is applied upstream, so the full document is never transferred
+or held in memory:
+  - "metadata": title / url / image only (EXA_VIEWS value 0),
+  - "snippet":  EXA_SNIPPET_CHARS characters of text,
+  - "page":     EXA_PAGE_CHARS characters of text.
+
+Firecrawl scrapes are main-content only (FIRECRAWL_ONLY_MAIN_CONTENT), and
+trim_firecrawl_scrape() cuts a scrape down to short metadata and the
+title/price windows of its markdown (prompt_compaction.select_windows)
+before it is handed to an agent.
+"""
+import os
+from prompt_compaction import budget_chars, select_windows
+
+EXA_SNIPPET_CHARS = int(os.getenv("EXA_SNIPPET_CHARS", "500"))
+EXA_PAGE_CHARS = int(os.getenv("EXA_PAGE_CHARS", "2000"))
+FIRECRAWL_ONLY_MAIN_CONTENT = os.getenv("FIRECRAWL_ONLY_MAIN_CONTENT", "true").lower() in ("1", "true", "yes")
+FIRECRAWL_TOOL_MARKDOWN_CHARS = int(os.getenv("FIRECRAWL_TOOL_MARKDOWN_CHARS", str(budget_chars("scrape_tool"))))
+# Firecrawl-side timeout of a JSON (LLM) extraction; 45-60s extractions are normal
+FIRECRAWL_EXTRACT_TIMEOUT = float(os.getenv("FIRECRAWL_EXTRACT_TIMEOUT", "60"))
+
+# Characters of page text per view; 0 means no text at all
+EXA_VIEWS = {"metadata": 0, "snippet": EXA_SNIPPET_CHARS, "page": EXA_PAGE_CHARS}
+# Metadata values longer than this (inline JSON, long keyword lists) are dropped by trim_firecrawl_scrape
+MAX_METADATA_VALUE = 500
+
+
+def exa_text(view: str) -> dict:
+    """exa_py `text` option for get_contents() in `view` ("snippet" or "page")."""
+    return {"max_characters": EXA_VIEWS[view]}
+
+
+def exa_contents(view: str):
+    """exa_py `contents` option for find_similar()/search(): False for "metadata", else capped text."""
+    return {"text": exa_text(view)} if EXA_VIEWS[view] else False
+
+
+def exa_rest_text(view: str):
+    """`text` field of an Exa REST /contents (or `contents` of /search) body."""
+    return {"maxCharacters": EXA_VIEWS[view]} if EXA_VIEWS[view] else False
+
+
+def firecrawl_scrape_body(url: str, formats: list, **options) -> dict:
+    """Firecrawl /v1/scrape body for `formats`, main content only unless configured otherwise."""
+    return {"url": url, "formats": formats, "onlyMainContent": FIRECRAWL_ONLY_MAIN_CONTENT, **options}
+
+
+def trim_firecrawl_scrape(body: dict, markdown_chars: int = FIRECRAWL_TOOL_MARKDOWN_CHARS) -> dict:
+    """A Firecrawl scrape response cut down to short metadata values and up to `markdown_chars` of markdown."""
+    data = body.get("data") or {}
+    metadata = {
+        key: value for key, value in (data.get("metadata") or {}).items()
+        if isinstance(value, (str, int, float, list)) and len(str(value)) <= MAX_METADATA_VALUE
+    }
+    title = metadata.get("og:title") or metadata.get("title") or ""
+    markdown = select_windows(data.get("markdown"), markdown_chars, title=title, task="scrape_tool")
+    trimmed = {"metadata": metadata, "markdown": markdown}
+    if data.get("json"):
+        trimmed["json"] = data["json"]
+    return {"success": body.get("success", False), "data": trimmed}
@@ -0,0 +1,223 @@
+"""
+Prompt context compaction shared by the crews.
+
+Everything a crew puts into a task prompt (scraped metadata, page text,
+candidate lists, search results) goes through here first, cut down to what
+the task reads and to the task's token budget:
+  - compact_metadata() flattens nested data (JSON-LD offers become
+    "offers.price"), keeps the first value of lists, drops keys no task
+    reads (viewport, robots, verification tags, Firecrawl bookkeeping, ...)
+    and values already given under another key (og:title / twitter:title),
+    then drops the least useful keys until the budget is met;
+  - select_windows() keeps the lead of a page (usually the title) plus
+    windows around every price price_parser finds and around the product
+    title's words, in page order, instead of the first N characters;
+  - compact_records() cuts lists of dicts to the fields a task reads and
+    shortens long text fields evenly (then drops trailing records).
+
+Budgets are per task (TASK_BUDGETS, overridable with PROMPT_BUDGET_<TASK>).
+Tokens are estimated at CHARS_PER_TOKEN characters each, close enough for
+product pages without a tokenizer dependency. stats() reports characters
+in and out per task.
+"""
+import os
+import re
+import json
+import threading
+from price_parser import find_prices
+
+PROMPT_COMPACTION_ENABLED = os.getenv("PROMPT_COMPACTION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+CHARS_PER_TOKEN = 4
+TASK_BUDGETS = {
+    "product_cleaner": 400,
+    "price_extractor": 800,  # page text
+    "price_extractor_structured": 300,  # JSON-LD / meta tags
+    "search_term": 200,
+    "tie_break": 600,
+    "search_results": 600,
+    "scrape_tool": 1000,  # markdown the Firecrawl scraper tool hands to an agent
+}
+# Longest single metadata value, and the size of the page lead / price windows (characters)
+MAX_VALUE_CHARS = 300
+LEAD_CHARS = 300
+WINDOW_RADIUS = 160
+MAX_PRICE_WINDOWS = 12
+
+_DROP_KEYS = frozenset((
+    "viewport", "robots", "googlebot", "referrer", "keywords", "news_keywords", "generator", "format-detection",
+    "theme-color", "x-ua-compatible", "language", "favicon", "scrapeid", "statuscode", "contenttype", "proxyused",
+    "cachestate", "cachedat", "creditsused", "error", "@context", "@id", "csrf-token", "csrf-param",
+    "og:locale", "og:locale:alternate", "og:type", "twitter:card", "twitter:site", "twitter:creator",
+))
+_DROP_PREFIXES = (
+    "msapplication", "apple-", "fb:", "al:", "google", "twitter:app", "article:", "p:domain", "facebook-",
+    "mobile-", "handheldfriendly", "yandex", "bingbot", "norton", "pinterest",
+)
+# Keys whose values tasks actually read; these go last when a budget forces keys out
+_USEFUL_RE = re.compile(r"title|name|price|currency|amount|brand|image|url|site|description|availability|sku", re.I)
+_WS_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"[a-z0-9]{4,}")
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def budget(task: str) -> int:
+    """Token budget for `task`."""
+    return int(os.getenv(f"PROMPT_BUDGET_{task.upper()}", TASK_BUDGETS[task]))
+
+
+def budget_chars(task: str) -> int:
+    return budget(task) * CHARS_PER_TOKEN
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _record(task: str, before: int, after: int) -> None:
+    with _stats_lock:
+        counters = _stats.setdefault(task, {"calls": 0, "chars_in": 0, "chars_out": 0})
+        counters["calls"] += 1
+        counters["chars_in"] += before
+        counters["chars_out"] += after
+
+
+def _size(value) -> int:
+    return len(value) if isinstance(value, str) else len(json.dumps(value, default=str))
+
+
+def _flatten(data, prefix: str = ""):
+    if isinstance(data, list):
+        data = next((item for item in data if item not in (None, "", [], {})), None)
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from _flatten(value, f"{prefix}.{key}" if prefix else str(key))
+    elif data not in (None, ""):
+        yield prefix, data
+
+
+def _dropped(key: str) -> bool:
+    leaf = key.rsplit(".", 1)[-1].lower()
+    return leaf in _DROP_KEYS or leaf.startswith(_DROP_PREFIXES)
+
+
+def compact_metadata(metadata, task: str = None, value_chars: int = MAX_VALUE_CHARS) -> dict:
+    """Flat {key: short string} of the useful, distinct values in `metadata`, within `task`'s budget."""
+    if not isinstance(metadata, (dict, list)):
+        return {}
+    if not PROMPT_COMPACTION_ENABLED:
+        return metadata if isinstance(metadata, dict) else {}
+    out, seen = {}, set()
+    for key, value in _flatten(metadata):
+        if _dropped(key):
+            continue
+        text = _WS_RE.sub(" ", str(value)).strip()[:value_chars]
+        folded = text.lower()
+        if not text or folded in seen:
+            continue
+        seen.add(folded)
+        out[key] = text
+    if task is not None:
+        limit = budget_chars(task)
+        # Least useful keys first, later keys before earlier ones
+        droppable = sorted(out, key=lambda k: (bool(_USEFUL_RE.search(k)), -list(out).index(k)))
+        while droppable and _size(out) > limit:
+            del out[droppable.pop(0)]
+        _record(task, _size(metadata), _size(out))
+    return out
+
+
+def _snap(text: str, start: int, end: int):
+    """Widen [start, end) to whole words."""
+    start, end = max(0, start), min(len(text), end)
+    while start > 0 and not text[start - 1].isspace():
+        start -= 1
+    while end < len(text) and not text[end].isspace():
+        end += 1
+    return start, end
+
+
+def _covered(spans: list) -> int:
+    total, last = 0, -1
+    for start, end in sorted(spans):
+        if end > last:
+            total += end - max(start, last)
+            last = end
+    return total
+
+
+def select_windows(text, max_chars: int, title: str = "", task: str = None) -> str:
+    """
+    `text` cut to about `max_chars`: its lead, then windows around prices
+    (labelled ones first) and around the title's words, joined in page order.
+    """
+    text = _WS_RE.sub(" ", str(text or "")).strip()
+    if len(text) <= max_chars or not PROMPT_COMPACTION_ENABLED:
+        result = text if PROMPT_COMPACTION_ENABLED else text[:max_chars]
+        if task is not None:
+            _record(task, len(text), len(result))
+        return result
+    candidates = [(0, min(LEAD_CHARS, max_chars))]
+    prices = find_prices(text)[:MAX_PRICE_WINDOWS * 2]
+    prices.sort(key=lambda price: price["label"] is None)
+    candidates += [(p["start"] - WINDOW_RADIUS // 2, p["end"] + WINDOW_RADIUS // 2) for p in prices[:MAX_PRICE_WINDOWS]]
+    words = set(_WORD_RE.findall(str(title or "").lower()))
+    if words:
+        pattern = re.compile("|".join(re.escape(word) for word in sorted(words)), re.I)
+        candidates += [(m.start() - WINDOW_RADIUS, m.end() + WINDOW_RADIUS) for m in pattern.finditer(text, LEAD_CHARS)][:len(words)]
+    chosen = []
+    for start, end in candidates:
+        span = _snap(text, start, end)
+        room = max_chars - _covered(chosen)
+        if room <= 0:
+            break
+        if _covered(chosen + [span]) - _covered(chosen) > room:
+            span = _snap(text, span[0], span[0] + room)
+            span = (span[0], min(span[1], span[0] + room))
+        chosen.append(span)
+    merged = []
+    for start, end in sorted(chosen):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    result = " … ".join(text[start:end].strip() for start, end in merged)
+    if task is not None:
+        _record(task, len(text), len(result))
+    return result
+
+
+def compact_records(records, fields: tuple, task: str) -> list:
+    """`records` (dicts) cut to `fields`, long values shortened evenly, within `task`'s budget."""
+    if not isinstance(records, list):
+        return []
+    limit = budget_chars(task)
+    kept = [
+        {field: _WS_RE.sub(" ", str(record[field])).strip() for field in fields if record.get(field) not in (None, "")}
+        for record in records if isinstance(record, dict)
+    ]
+    if not PROMPT_COMPACTION_ENABLED:
+        return kept
+    value_chars = MAX_VALUE_CHARS
+    out = kept
+    while _size(out) > limit and value_chars > 40:
+        out = [{field: value[:value_chars] for field, value in record.items()} for record in kept]
+        value_chars //= 2
+    while len(out) > 1 and _size(out) > limit:
+        out = out[:-1]
+    _record(task, _size(records), _size(out))
+    return out
+
+
+def stats() -> dict:
+    """Per task: calls, characters in and out, and the estimated token reduction."""
+    with _stats_lock:
+        return {
+            task: {
+                **counters,
+                "tokens_saved": (counters["chars_in"] - counters["chars_out"]) // CHARS_PER_TOKEN,
+            }
+            for task, counters in _stats.items()
+        }
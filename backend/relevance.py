@@ -0,0 +1,161 @@
+"""
+Local relevance ranking of candidate products against a source product.
+
+score_candidates() scores every candidate in one vectorized NumPy pass:
+  - BM25 of the source product's terms against each candidate's fields
+    (title, brand, description, weighted by FIELD_WEIGHTS, BM25F style),
+    normalized by the source's score against itself so 1.0 means "as
+    relevant as the product itself";
+  - a category feature: title/description hits on CATEGORY_KEYWORDS give
+    each product a category distribution, and candidates are scored on its
+    cosine with the source's. A candidate that is clearly another category
+    (no overlap while both have one) is what the old LLM filter dropped.
+
+The final score is a mix of the two (CATEGORY_WEIGHT). rank_candidates()
+keeps candidates at or above RELEVANCE_MIN_SCORE, topped up to
+RELEVANCE_MIN_KEEP by rank, and reports which ones sit within
+RELEVANCE_TIE_MARGIN of the threshold for an optional LLM tie-break.
+"""
+import os
+import re
+import numpy as np
+
+RELEVANCE_MIN_SCORE = float(os.getenv("RELEVANCE_MIN_SCORE", "0.2"))
+RELEVANCE_MIN_KEEP = int(os.getenv("RELEVANCE_MIN_KEEP", "3"))
+RELEVANCE_TIE_MARGIN = float(os.getenv("RELEVANCE_TIE_MARGIN", "0.05"))
+# Ask the LLM about borderline candidates (SimilarProductsCrew); off by default
+RELEVANCE_LLM_TIEBREAK = os.getenv("RELEVANCE_LLM_TIEBREAK", "false").lower() in ("1", "true", "yes")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+FIELD_WEIGHTS = {"title": 3.0, "brand": 2.0, "description": 1.0}
+CATEGORY_WEIGHT = 0.4
+
+CATEGORY_KEYWORDS = {
+    "jewelry": ("necklace", "pendant", "bracelet", "earring", "ring", "pearl", "choker", "anklet", "brooch", "jewelry", "jewellery"),
+    "belts": ("belt", "buckle", "waistband"),
+    "bags": ("bag", "handbag", "tote", "backpack", "purse", "clutch", "crossbody", "wallet", "satchel"),
+    "footwear": ("shoe", "sneaker", "boot", "sandal", "loafer", "heel", "trainer", "slipper", "pump", "mule"),
+    "tops": ("shirt", "tee", "t-shirt", "blouse", "top", "sweater", "hoodie", "cardigan", "polo", "tank", "sweatshirt"),
+    "bottoms": ("jeans", "pants", "trousers", "shorts", "skirt", "leggings", "chinos", "joggers"),
+    "dresses": ("dress", "gown", "jumpsuit", "romper"),
+    "outerwear": ("jacket", "coat", "parka", "blazer", "vest", "windbreaker", "raincoat"),
+    "eyewear": ("sunglasses", "glasses", "eyewear", "frames"),
+    "watches": ("watch", "smartwatch", "chronograph"),
+    "headwear": ("hat", "cap", "beanie", "beret", "fedora"),
+    "audio": ("headphones", "earbuds", "headset", "speaker", "earphones", "soundbar"),
+    "phones": ("phone", "smartphone", "iphone", "android"),
+    "computers": ("laptop", "notebook", "macbook", "chromebook", "desktop", "monitor", "keyboard", "mouse"),
+    "home": ("sofa", "chair", "table", "lamp", "rug", "cushion", "pillow", "bedding", "curtain", "mattress"),
+    "kitchen": ("pan", "pot", "knife", "kettle", "blender", "mug", "cookware", "toaster"),
+    "beauty": ("lipstick", "mascara", "serum", "moisturizer", "perfume", "fragrance", "shampoo", "cleanser"),
+}
+
+_STOPWORDS = frozenset(
+    "a an and are as at by for from in into is it of on or the this to with your our new buy shop free "
+    "shipping sale online best men mens women womens size".split()
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+_CATEGORIES = list(CATEGORY_KEYWORDS)
+
+
+def _stem(token: str) -> str:
+    """Plural folding only ("necklaces" -> "necklace", "dresses" -> "dress")."""
+    if len(token) > 4 and token.endswith(("sses", "shes", "ches", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+_KEYWORD_CATEGORY = {
+    _stem(keyword): index for index, category in enumerate(_CATEGORIES) for keyword in CATEGORY_KEYWORDS[category]
+}
+
+
+def tokenize(text) -> list:
+    if not text:
+        return []
+    return [_stem(t) for t in _TOKEN_RE.findall(str(text).lower()) if t not in _STOPWORDS]
+
+
+def _field(product: dict, name: str) -> str:
+    if name == "description":
+        return product.get("description") or product.get("product_description") or ""
+    if name == "title":
+        return product.get("title") or product.get("original_title") or ""
+    return product.get(name) or ""
+
+
+def _category_vector(tokens: list) -> np.ndarray:
+    vector = np.zeros(len(_CATEGORIES))
+    for token in tokens:
+        index = _KEYWORD_CATEGORY.get(token)
+        if index is None and "-" in token:
+            index = _KEYWORD_CATEGORY.get(token.replace("-", ""))
+        if index is not None:
+            vector[index] += 1
+    return vector
+
+
+def score_candidates(source: dict, candidates: list) -> np.ndarray:
+    """Relevance of each candidate to `source` in [0, 1] (same order as `candidates`)."""
+    if not candidates:
+        return np.zeros(0)
+    products = [source] + list(candidates)
+    fields = {name: [tokenize(_field(p, name)) for p in products] for name in FIELD_WEIGHTS}
+    query = sorted({t for name in FIELD_WEIGHTS for t in fields[name][0]})
+    if not query:
+        return np.zeros(len(candidates))
+    column = {term: i for i, term in enumerate(query)}
+
+    # Field-weighted term frequencies (BM25F): rows are products, columns query terms
+    tf = np.zeros((len(products), len(query)))
+    lengths = np.zeros(len(products))
+    for name, weight in FIELD_WEIGHTS.items():
+        for row, tokens in enumerate(fields[name]):
+            lengths[row] += weight * len(tokens)
+            for token in tokens:
+                col = column.get(token)
+                if col is not None:
+                    tf[row, col] += weight
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log(1 + (len(products) - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(lengths.mean(), 1e-9))
+    bm25 = (tf * (BM25_K1 + 1) / (tf + norm[:, None]) * idf).sum(axis=1)
+    lexical = np.clip(bm25[1:] / bm25[0], 0, 1) if bm25[0] > 0 else np.zeros(len(candidates))
+
+    categories = np.array([
+        _category_vector(fields["title"][row] * 2 + fields["description"][row]) for row in range(len(products))
+    ])
+    source_category = categories[0]
+    if not source_category.any():
+        return lexical
+    magnitudes = np.linalg.norm(categories[1:], axis=1)
+    cosine = categories[1:] @ source_category / (np.maximum(magnitudes, 1e-9) * np.linalg.norm(source_category))
+    # Candidates with no category keywords at all are judged on text alone
+    category = np.where(magnitudes > 0, cosine, lexical)
+    return (1 - CATEGORY_WEIGHT) * lexical + CATEGORY_WEIGHT * category
+
+
+def rank_candidates(source: dict, candidates: list, min_score: float = None, min_keep: int = None):
+    """
+    (kept, ambiguous): candidates worth showing, best first, each with a
+    "relevance_score"; and the subset within RELEVANCE_TIE_MARGIN of the
+    threshold, which an optional tie-breaker may still drop.
+    """
+    min_score = RELEVANCE_MIN_SCORE if min_score is None else min_score
+    min_keep = RELEVANCE_MIN_KEEP if min_keep is None else min_keep
+    scores = score_candidates(source, candidates)
+    order = np.argsort(-scores, kind="stable")
+    kept, ambiguous = [], []
+    for rank, index in enumerate(order):
+        score = float(scores[index])
+        if score < min_score and (rank >= min_keep or score <= 0):
+            break
+        product = dict(candidates[index])
+        product["relevance_score"] = round(score, 4)
+        kept.append(product)
+        if abs(score - min_score) <= RELEVANCE_TIE_MARGIN or score < min_score:
+            ambiguous.append(product)
+    return kept, ambiguous
@@ -0,0 +1,99 @@
+"""
+Persistent cache for Firecrawl scrape results.
+
+Entries live in a local SQLite file (see sqlite_cache), keyed by kind +
+canonical URL, with zlib-compressed JSON payloads. Price fields expire quickly
+(SCRAPE_CACHE_PRICE_TTL) while title/image/description stay valid much
+longer (SCRAPE_CACHE_TTL). The cache is capped by entry count and payload
+bytes, evicting least-recently-used entries first.
+"""
+import os
+import logging
+import threading
+from sqlite_cache import SqliteCache
+from url_utils import canonicalize_url
+
+logger = logging.getLogger("scrape_cache")
+
+SCRAPE_CACHE_ENABLED = os.getenv("SCRAPE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SCRAPE_CACHE_PATH = os.getenv(
+    "SCRAPE_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "scrape_cache.sqlite3")
+)
+SCRAPE_CACHE_PRICE_TTL = float(os.getenv("SCRAPE_CACHE_PRICE_TTL", str(15 * 60)))
+SCRAPE_CACHE_TTL = float(os.getenv("SCRAPE_CACHE_TTL", str(7 * 24 * 3600)))
+SCRAPE_CACHE_MAX_ENTRIES = int(os.getenv("SCRAPE_CACHE_MAX_ENTRIES", "5000"))
+SCRAPE_CACHE_MAX_BYTES = int(os.getenv("SCRAPE_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+
+def _is_price_field(key: str) -> bool:
+    key = key.lower()
+    return "price" in key or "discount" in key or "currency" in key
+
+
+def _drop_price_fields(value):
+    """Copy of a payload with every price-like field removed (recursively)."""
+    if isinstance(value, dict):
+        return {k: _drop_price_fields(v) for k, v in value.items() if not _is_price_field(k)}
+    if isinstance(value, list):
+        return [_drop_price_fields(v) for v in value]
+    return value
+
+
+class ScrapeCache(SqliteCache):
+    HIT_COUNTERS = ("hits", "partial_hits")
+    MISS_COUNTERS = ("misses", "stale")
+
+    def __init__(self, path: str, price_ttl: float, ttl: float, max_entries: int, max_bytes: int):
+        super().__init__(path, max_entries=max_entries, max_bytes=max_bytes)
+        self.price_ttl = price_ttl
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(kind: str, url: str) -> str:
+        return f"{kind}:{canonicalize_url(url)}"
+
+    def get(self, kind: str, url: str, require_price: bool = True):
+        """
+        Cached payload for (kind, url), or None.
+        With require_price=False an entry whose price has expired is still
+        returned, minus its price fields, as long as the long TTL holds.
+        """
+        found = self._read(self.make_key(kind, url), self.ttl)
+        if found is None:
+            self._count("misses")
+            return None
+        data, age = found
+        if age <= self.price_ttl:
+            self._count("hits")
+            return data
+        if require_price:
+            self._count("stale")
+            return None
+        self._count("partial_hits")
+        return _drop_price_fields(data)
+
+    def put(self, kind: str, url: str, data) -> None:
+        self._write(self.make_key(kind, url), data)
+
+
+_scrape_cache = None
+_init_lock = threading.Lock()
+
+
+def get_scrape_cache():
+    """Process-wide ScrapeCache, or None when SCRAPE_CACHE_ENABLED is off."""
+    global _scrape_cache
+    if not SCRAPE_CACHE_ENABLED:
+        return None
+    if _scrape_cache is None:
+        with _init_lock:
+            if _scrape_cache is None:
+                _scrape_cache = ScrapeCache(
+                    SCRAPE_CACHE_PATH,
+                    price_ttl=SCRAPE_CACHE_PRICE_TTL,
+                    ttl=SCRAPE_CACHE_TTL,
+                    max_entries=SCRAPE_CACHE_MAX_ENTRIES,
+                    max_bytes=SCRAPE_CACHE_MAX_BYTES,
+                )
+                logger.info(f"Scrape cache opened at {SCRAPE_CACHE_PATH}")
+    return _scrape_cache
@@ -0,0 +1,101 @@
+"""
+Single-flight request coalescing.
+
+While a call for a key is in flight, further callers with the same key wait
+for that call and share its result (or exception) instead of starting their
+own upstream request. Keys are usually "<upstream>:<canonical url>".
+
+SingleFlight is for coroutines, ThreadSingleFlight for blocking code running
+in worker threads (CrewAI tools). all_stats() reports how many calls were
+coalesced per named instance.
+"""
+import asyncio
+import threading
+
+_registry = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}
+        self._counters = {"calls": 0, "shared": 0}
+        _registry[name] = self
+
+    async def do(self, key: str, fn, *args, **kwargs):
+        """Await fn(*args, **kwargs), or the identical call already running for `key`."""
+        self._counters["calls"] += 1
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            entry = self._inflight[key] = {"task": task, "waiters": 0}
+
+            def _forget(_task):
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+            task.add_done_callback(_forget)
+        else:
+            self._counters["shared"] += 1
+        entry["waiters"] += 1
+        try:
+            # Shield so one caller's timeout/cancel does not cancel the call for the others
+            return await asyncio.shield(entry["task"])
+        finally:
+            entry["waiters"] -= 1
+            if entry["waiters"] == 0 and not entry["task"].done():
+                entry["task"].cancel()
+
+    def stats(self) -> dict:
+        return {**self._counters, "in_flight": len(self._inflight)}
+
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ThreadSingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._counters = {"calls": 0, "shared": 0}
+        _registry[name] = self
+
+    def do(self, key: str, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs), or block on the identical call already running for `key`."""
+        with self._lock:
+            self._counters["calls"] += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self._counters["shared"] += 1
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counters, "in_flight": len(self._inflight)}
+
+
+def all_stats() -> dict:
+    return {name: flight.stats() for name, flight in _registry.items()}
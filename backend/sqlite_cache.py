@@ -0,0 +1,118 @@
+"""
+Small on-disk key/value cache used by scrape_cache and llm_cache.
+
+Values are JSON, zlib-compressed, in a single SQLite table (WAL mode, one
+connection shared across threads behind a lock). The table is capped by
+entry count and compressed bytes; least-recently-used entries go first.
+Running entry/byte totals are kept on every insert and delete, so a write
+only scans the table when it pushes the cache over a cap (the totals are
+re-read then, in case another process shares the file).
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+
+
+class SqliteCache:
+    # Counter names that count as a hit / a miss when computing hit_ratio
+    HIT_COUNTERS = ("hits",)
+    MISS_COUNTERS = ("misses",)
+
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._counters = {name: 0 for name in self.HIT_COUNTERS + self.MISS_COUNTERS + ("writes", "evictions")}
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL,"
+            " stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self._entries, self._bytes = self._totals()
+
+    def _totals(self) -> tuple:
+        return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def _delete(self, key: str, size: int) -> None:
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._entries -= 1
+        self._bytes -= size
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _read(self, key: str, ttl: float):
+        """(value, age in seconds) for `key`, or None. Entries older than `ttl` are deleted."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, size, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            payload, size, stored_at = row
+            age = now - stored_at
+            if age > ttl:
+                self._delete(key, size)
+                return None
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(zlib.decompress(payload)), age
+
+    def _write(self, key: str, value) -> None:
+        payload = zlib.compress(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            replaced = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, payload, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload), now, now),
+            )
+            if replaced is None:
+                self._entries += 1
+            else:
+                self._bytes -= replaced[0]
+            self._bytes += len(payload)
+            self._counters["writes"] += 1
+            if self._entries > self.max_entries or self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._entries, self._bytes = self._totals()
+        while self._entries > self.max_entries or self._bytes > self.max_bytes:
+            # Drop the least-recently-used tenth (at least one entry) per round
+            batch = max(1, self._entries // 10)
+            victims = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at ASC LIMIT ?", (batch,)
+            ).fetchall()
+            if not victims:
+                break
+            for key, size in victims:
+                self._delete(key, size)
+            self._counters["evictions"] += len(victims)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._entries, self._bytes = 0, 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._entries, self._bytes = self._totals()
+            counters = dict(self._counters)
+        hits = sum(counters[name] for name in self.HIT_COUNTERS)
+        lookups = hits + sum(counters[name] for name in self.MISS_COUNTERS)
+        return {
+            "entries": count,
+            "bytes": total,
+            **counters,
+            "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+        }
@@ -1,21 +1,108 @@
 import logging
 from typing import List, Dict, Any
 from crewai.tools import BaseTool
-from duckduckgo_search import DDGS
 import os
-import requests
 import json
 from dotenv import load_dotenv
-from exa_py import Exa
+import lazy
+from http_clients import UPSTREAMS, get_client
+from singleflight import ThreadSingleFlight
+from url_utils import canonicalize_url
+from price_parser import parse_price
+from projections import exa_contents, exa_text, firecrawl_scrape_body, trim_firecrawl_scrape
+from prompt_compaction import compact_records
+from exa_cache import cached_exa_client, cached_request
+from governor import permit
+import metrics
+from breaker import CircuitOpenError, guard
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Get Exa API key from environment variables
 EXA_API_KEY = os.getenv("EXA_API_KEY", "24b1e244-275f-4343-bd1d-0578e3ddc020")  # Fallback to provided key if not in .env
+# With DuckDuckGo off (it has no base URL to redirect), web searches go to Exa
+DUCKDUCKGO_ENABLED = os.getenv("DUCKDUCKGO_ENABLED", "true").lower() in ("1", "true", "yes")
 
-# Initialize Exa client
-exa_client = Exa(EXA_API_KEY)
+
+def _build_exa_client():
+    from exa_py import Exa
+    # Same base URL as the pooled httpx clients, so EXA_BASE_URL redirects the SDK too
+    return cached_exa_client(Exa(EXA_API_KEY, base_url=UPSTREAMS["exa"]["base_url"]))
+
+
+# Exa client (findSimilar/search responses go through the shared Exa cache) and DuckDuckGo, built on first use
+lazy.register("exa_client", _build_exa_client)
+lazy.register("ddgs", "duckduckgo_search:DDGS")
+lazy.register("ddg_ratelimit", "duckduckgo_search.exceptions:RatelimitException")
+
+
+def get_exa_client():
+    return lazy.get("exa_client")
+
+
+# Tools run in CrewAI worker threads; identical concurrent upstream calls share one request
+exa_flight = ThreadSingleFlight("exa_tools")
+firecrawl_tool_flight = ThreadSingleFlight("firecrawl_tool")
+
+logger = logging.getLogger("tools")
+
+
+def exa_find_similar(url: str, num_results: int, view: str = "metadata"):
+    """Exa findSimilar results with `view` contents (see projections: "metadata", "snippet" or "page")."""
+    return exa_flight.do(
+        f"find_similar:{num_results}:{view}:{canonicalize_url(url)}",
+        get_exa_client().find_similar, url=url, num_results=num_results, contents=exa_contents(view)
+    )
+
+
+def exa_get_contents(url: str, view: str = "page"):
+    return exa_flight.do(
+        f"get_contents:{view}:{canonicalize_url(url)}", get_exa_client().get_contents, url, text=exa_text(view)
+    )
+
+def ddg_search(query: str) -> list:
+    """Top 5 DuckDuckGo results; raises CircuitOpenError while DuckDuckGo's breaker is open."""
+    if not DUCKDUCKGO_ENABLED:
+        raise RuntimeError("DuckDuckGo search is disabled (DUCKDUCKGO_ENABLED=false)")
+    DDGS, RatelimitException = lazy.get("ddgs"), lazy.get("ddg_ratelimit")
+    with metrics.stage("duckduckgo"), guard("duckduckgo") as call, permit("duckduckgo") as held:
+        try:
+            with DDGS() as ddgs:
+                return list(ddgs.text(query, max_results=5))
+        except RatelimitException:
+            held.record(429)
+            call.record(429)
+            raise
+
+
+def search_results_context(results) -> str:
+    """DuckDuckGo / Exa search results as compact JSON for an agent (title, link and snippet only)."""
+    return json.dumps(compact_records(results, ("title", "url", "href", "body", "text"), task="search_results"))
+
+
+def exa_search(query: str) -> dict:
+    """Top 5 Exa search results (cached); raises CircuitOpenError while Exa search's breaker is open."""
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {EXA_API_KEY}",
+    }
+    data = {
+        "query": query,
+        "num_results": 5
+    }
+    def search():
+        with metrics.stage("exa_search"):
+            response = get_client("exa").post(
+                "/search",
+                headers=headers,
+                json=data,
+                timeout=10
+            )
+            response.raise_for_status()
+            return response.json()
+    return exa_flight.do(f"search:{' '.join(query.lower().split())}", cached_request, "search", data, search)
 
 class SearchTools:
     class FirecrawlTool(BaseTool):
@@ -23,6 +110,9 @@ class SearchTools:
         description: str = "A tool to scrape product details from a URL including title, price, images, and description."
         
         def _run(self, url: str) -> str:
+            return firecrawl_tool_flight.do(f"scrape:{canonicalize_url(url)}", self._scrape, url)
+
+        def _scrape(self, url: str) -> str:
             import logging
             logger = logging.getLogger(__name__)
             
@@ -33,19 +123,23 @@ class SearchTools:
                 if firecrawl_api_key:
                     # Use Firecrawl API for better extraction
                     headers = {"Authorization": f"Bearer {firecrawl_api_key}"}
-                    response = requests.post(
-                        "https://api.firecrawl.dev/scrape",
-                        json={"url": url, "elements": ["title", "images", "meta", "price", "description"]},
-                        headers=headers
-                    )
-                    if response.status_code == 200:
-                        return json.dumps(response.json(), indent=2)
+                    try:
+                        response = get_client("firecrawl").post(
+                            "/v1/scrape",
+                            json=firecrawl_scrape_body(url, ["markdown"]),
+                            headers=headers
+                        )
+                        if response.status_code == 200:
+                            return json.dumps(trim_firecrawl_scrape(response.json()))
+                    except Exception as e:
+                        # Includes CircuitOpenError while Firecrawl's breaker is open
+                        logger.warning(f"Firecrawl scrape failed for {url}: {e}")
                 
                 # Fallback to simpler extraction method
                 logger.info(f"Using fallback extraction for URL: {url}")
                 
                 # Use Exa's get_contents as fallback
-                content_result = exa_client.get_contents(url=url)
+                content_result = exa_get_contents(url)
                 
                 # Extract basic data
                 result = {
@@ -67,21 +161,14 @@ class SearchTools:
                         result["description"] = text[:300] if text else ""
                         
                         # Look for price in text
-                        import re
-                        price_patterns = [
-                            r'\$\d+(?:\.\d{2})?',  # $X.XX or $XX
-                            r'€\d+(?:\.\d{2})?',  # €X.XX or €XX
-                            r'£\d+(?:\.\d{2})?',  # £X.XX or £XX
-                        ]
-                        for pattern in price_patterns:
-                            match = re.search(pattern, text)
-                            if match:
-                                result["price"] = match.group(0)
-                                break
+                        parsed = parse_price(text)
+                        if parsed:
+                            result["price"] = float(parsed.amount)
+                            result["currency"] = parsed.currency
                     
                     # Extract images
-                    if hasattr(content_result.results[0], 'image_urls'):
-                        result["images"] = content_result.results[0].image_urls[:5] if content_result.results[0].image_urls else []
+                    if getattr(content_result.results[0], 'image', None):
+                        result["images"] = [content_result.results[0].image]
                 
                 return json.dumps(result, indent=2)
                 
@@ -94,9 +181,13 @@ class SearchTools:
         description: str = "A tool to search the web for a given query. Returns the top 5 results."
 
         def _run(self, query: str) -> str:
-            with DDGS() as ddgs:
-                results = list(ddgs.text(query, max_results=5))
-                return str(results)
+            if not DUCKDUCKGO_ENABLED:
+                return search_results_context(exa_search(query).get("results", []))
+            try:
+                return search_results_context(ddg_search(query))
+            except CircuitOpenError as e:
+                logger.warning(f"{e}; searching Exa instead")
+                return search_results_context(exa_search(query).get("results", []))
 
     class ExaSearchTool(BaseTool):
         name: str = "Exa Web Search Tool"
@@ -105,24 +196,14 @@ class SearchTools:
         def _run(self, query: str) -> str:
             if not EXA_API_KEY:
                 return "EXA_API_KEY not set."
-            headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {EXA_API_KEY}",
-            }
-            data = {
-                "query": query,
-                "num_results": 5
-            }
             try:
-                response = requests.post(
-                    "https://api.exa.ai/search",
-                    headers=headers,
-                    json=data,
-                    timeout=10
-                )
-                response.raise_for_status()
-                return str(response.json().get("results", []))
+                return search_results_context(exa_search(query).get("results", []))
+            except CircuitOpenError as e:
+                logger.warning(f"{e}; searching DuckDuckGo instead")
+                try:
+                    return search_results_context(ddg_search(query))
+                except Exception as ddg_err:
+                    return f"Exa search failed: {e}; DuckDuckGo fallback failed: {ddg_err}"
             except Exception as e:
                 return f"Exa search failed: {e}"
                 
@@ -156,7 +237,7 @@ class ExaFindSimilarTool(BaseTool):
         # Try URL-based search first
         try:
             logger_exa_find_similar.info("Attempting to find similar products using URL...")
-            result = exa_client.find_similar(url=url, num_results=num_results)
+            result = exa_find_similar(url, num_results)
             logger_exa_find_similar.info(f"Found {len(result.results)} similar links from URL search")
             for item in result.results:
                 similar_products.append({
@@ -180,7 +261,9 @@ class ExaFindSimilarTool(BaseTool):
                             search_query = potential_product_name.replace('-', ' ') + f" site:{domain}"
                             logger_exa_find_similar.info(f"Attempting fallback search with: {search_query}")
                             try:
-                                content_result = exa_client.search(search_query, num_results=num_results)
+                                content_result = get_exa_client().search(
+                                    search_query, num_results=num_results, contents=exa_contents("metadata")
+                                )
                                 logger_exa_find_similar.info(f"Fallback search found {len(content_result.results)} results")
                                 for item in content_result.results:
                                     similar_products.append({
@@ -215,61 +298,32 @@ class ExaFindSimilarTool(BaseTool):
                 logger.info(f"Finding similar links for URL: {url}")
                 logger.info(f"Using Exa API key: {EXA_API_KEY[:4]}...{EXA_API_KEY[-4:]}")
                 
-                # Step 1: Find similar links first
-                logger.info("Step 1: Calling Exa find_similar API with parameters: url=%s, num_results=10", url)
-                similar_results = exa_client.find_similar(
-                    url=url,
-                    num_results=8  # Get 8 similar products as requested
-                )
+                # Find similar links with a text snippet each (one request, text capped by Exa)
+                logger.info("Calling Exa find_similar API with parameters: url=%s, num_results=8", url)
+                similar_results = exa_find_similar(url, 8, view="snippet")  # Get 8 similar products as requested
                 
                 logger.info(f"Exa find_similar API call successful. Found {len(similar_results.results)} similar links")
                 
                 # Format results with more detailed data
                 formatted_results = []
                 
-                # Step 2: Fetch content for each similar URL
                 for i, result in enumerate(similar_results.results):
                     try:
                         result_url = result.url if hasattr(result, 'url') else ""
                         if not result_url:
                             continue
-                            
-                        # Fetch content for this URL
-                        logger.info(f"Step 2.{i+1}: Fetching content for URL: {result_url}")
-                        content_result = exa_client.get_contents(url=result_url)
                         
-                        # Extract useful product data from content
-                        text_content = ""
-                        image_url = "https://via.placeholder.com/400"  # Default placeholder
+                        # Extract useful product data from the snippet
+                        text_content = getattr(result, 'text', None) or ""
+                        image_url = getattr(result, 'image', None) or "https://via.placeholder.com/400"  # Default placeholder
                         price_text = "[Price not available]"
+                        currency = None
                         
-                        if hasattr(content_result, 'results') and content_result.results:
-                            # Get text content
-                            if hasattr(content_result.results[0], 'text') and content_result.results[0].text:
-                                text_content = content_result.results[0].text[:500]  # Truncate to reasonable size
-                            
-                            # Try to extract image URL from content
-                            if hasattr(content_result.results[0], 'image_urls') and content_result.results[0].image_urls:
-                                if len(content_result.results[0].image_urls) > 0:
-                                    image_url = content_result.results[0].image_urls[0]  # Get first image
-                            
-                            # Try to find price in content
-                            if text_content:
-                                # Simple pattern matching for prices
-                                import re
-                                price_patterns = [
-                                    r'\$\d+(?:\.\d{2})?',  # $X.XX or $XX
-                                    r'€\d+(?:\.\d{2})?',   # €X.XX or €XX
-                                    r'£\d+(?:\.\d{2})?',   # £X.XX or £XX
-                                    r'\d+(?:\.\d{2})? USD', # X.XX USD or XX USD
-                                    r'\d+(?:\.\d{2})? EUR', # X.XX EUR or XX EUR
-                                    r'\d+(?:\.\d{2})? GBP'  # X.XX GBP or XX GBP
-                                ]
-                                for pattern in price_patterns:
-                                    price_match = re.search(pattern, text_content)
-                                    if price_match:
-                                        price_text = price_match.group(0)
-                                        break
+                        # Try to find price in content
+                        parsed_price = parse_price(text_content) if text_content else None
+                        if parsed_price:
+                            price_text = float(parsed_price.amount)
+                            currency = parsed_price.currency
                         
                         # Extract retailer from domain
                         from urllib.parse import urlparse
@@ -284,6 +338,7 @@ class ExaFindSimilarTool(BaseTool):
                             "url": result_url,
                             "description": text_content[:200] if text_content else "[No description available]",
                             "price": price_text,
+                            "currency": currency,
                             "retailer": retailer,
                             "image_url": image_url,
                             "score": result.score if hasattr(result, 'score') else 0
@@ -0,0 +1,67 @@
+"""
+URL helpers shared by the scraping and caching layers.
+"""
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only carry tracking/attribution info and never change the page
+TRACKING_PARAMS = {
+    "gclid", "gclsrc", "dclid", "fbclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "ref", "ref_", "referrer", "srsltid", "spm", "scm", "cmpid", "campaign",
+    "affiliate", "aff_id", "irclickid", "clickid", "trk", "tracking",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_", "mtm_")
+
+
+def _is_tracking_param(name: str) -> bool:
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def url_problem(url: str):
+    """Why `url` cannot be scraped (not http(s), no valid host, a bad port), or None when it looks fine."""
+    url = (url or "").strip()
+    if "://" not in url:
+        url = "https://" + url
+    try:
+        parts = urlsplit(url)
+        parts.port
+    except ValueError as e:
+        return str(e)
+    if parts.scheme.lower() not in ("http", "https"):
+        return f"unsupported scheme {parts.scheme!r}"
+    if not parts.hostname or any(ch.isspace() for ch in parts.hostname):
+        return "no valid host"
+    return None
+
+
+def canonicalize_url(url: str) -> str:
+    """
+    Normalize a product URL so that trivially different spellings of the same
+    page map to one key: lowercase scheme/host, no `www.`, no default port,
+    no fragment, no trailing slash, no tracking parameters and the remaining
+    query parameters sorted. A URL urllib cannot parse (a non-numeric port,
+    a broken IPv6 host) comes back stripped but otherwise unchanged.
+    """
+    if not url:
+        return ""
+    stripped = url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return stripped
+    scheme = (parts.scheme or "https").lower()
+    if scheme == "http":
+        scheme = "https"
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    path = parts.path.rstrip("/") or "/"
+    query = urlencode(sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking_param(k)
+    ))
+    return urlunsplit((scheme, host, path, query, ""))